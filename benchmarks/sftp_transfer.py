@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+SFTP transfer benchmark.
+
+Uploads and downloads a file of random data with the paramiko defaults (SFTPClient.put/getfo updating a progress
+bar on every 32 KB chunk, as the assistant did before), with the tuned Sftp storage (window/packet sizes if given,
+preferred ciphers, pipelined writes, prefetched reads, progress bar updates every 0.1 s at most) and with SSH streams
+(cat over exec channels, checked on the storage host).
+
+Without --host a local SSH server (paramiko, in a separate process, SFTP and exec) is started for a temp dir, so the
+numbers show the client side overhead; a real storage host shows the latency/window effects as well.
+
+Usage: python benchmarks/sftp_transfer.py [--size MB] [--runs N]
+                                          [--host HOST --port PORT --user USER --password PASSWORD --path PATH]
+                                          [--window-size MB] [--max-packet-size KB] [--cipher NAME ...]
+"""
+
+import dataclasses
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from argparse import ArgumentParser
+from pathlib import Path, PurePath
+
+import paramiko
+from rich.console import Console
+from rich.progress import Progress
+
+SOURCE_DIR = Path(__file__).parent.parent.joinpath('xtrabackup-assistant').absolute()
+sys.path.insert(0, str(SOURCE_DIR))
+
+LOCAL_USER = 'benchmark'
+LOCAL_PASSWORD = 'benchmark'
+
+
+class LocalServer(paramiko.ServerInterface):
+    def check_auth_password(self, username, password):
+        if (username, password) == (LOCAL_USER, LOCAL_PASSWORD):
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED if kind == 'session' else paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        threading.Thread(target=run_command, args=(channel, command.decode('utf-8')), daemon=True).start()
+        return True
+
+
+def run_command(channel: paramiko.Channel, command: str) -> None:
+    """ A shell command of an exec channel, its stdin/stdout/stderr pumped through the channel """
+
+    process = subprocess.Popen(command, shell=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE)
+
+    def pump_stdin():
+        try:
+            for data in iter(lambda: channel.recv(1024 * 1024), b''):
+                process.stdin.write(data)
+            process.stdin.close()
+        except BrokenPipeError:
+            # the command exited without reading everything (an error)
+            pass
+
+    def pump_stderr():
+        channel.sendall_stderr(process.stderr.read())
+
+    threads = [threading.Thread(target=pump_stdin, daemon=True), threading.Thread(target=pump_stderr, daemon=True)]
+    for thread in threads:
+        thread.start()
+    for data in iter(lambda: process.stdout.read1(1024 * 1024), b''):
+        channel.sendall(data)
+    threads[1].join()
+
+    channel.send_exit_status(process.wait())
+    channel.shutdown_write()
+    channel.close()
+
+
+class LocalSftpServer(paramiko.SFTPServerInterface):
+    """ The files of the host (paths as they are, the server listens on localhost), just enough for put/get/stat """
+
+    def open(self, path, flags, attr):
+        mode = 'wb' if flags & os.O_WRONLY else 'r+b' if flags & os.O_RDWR else 'rb'
+        try:
+            handle = paramiko.SFTPHandle(flags)
+            file = open(path, mode)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        handle.readfile = file
+        handle.writefile = file
+        return handle
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    lstat = stat
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+
+def serve(port: int) -> None:
+    """ The local server process: a connection at a time, until killed """
+
+    host_key = paramiko.RSAKey.generate(2048)
+
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server_socket.bind(('127.0.0.1', port))
+    server_socket.listen(16)
+    print('ready', flush=True)
+
+    while True:
+        connection, _ = server_socket.accept()
+        transport = paramiko.Transport(connection, default_window_size=2 ** 31 - 1, default_max_packet_size=256 * 1024)
+        transport.add_server_key(host_key)
+        transport.set_subsystem_handler('sftp', paramiko.SFTPServer, LocalSftpServer)
+        transport.start_server(server=LocalServer())
+        threading.Thread(target=transport.join, daemon=True).start()
+
+
+def start_local_server() -> (subprocess.Popen, int):
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+
+    process = subprocess.Popen([sys.executable, __file__, '--serve', str(port)], stdout=subprocess.PIPE)
+    process.stdout.readline()
+
+    return process, port
+
+
+def muted_progress() -> Progress:
+    """ A progress bar rendering to /dev/null: the updates cost as much as on a terminal """
+
+    return Progress(console=Console(file=open(os.devnull, 'w'), force_terminal=True))
+
+
+def measure_defaults(config, local_path: Path, remote_path: PurePath, runs: int) -> (list, list):
+    ssh_client = paramiko.SSHClient()
+    ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    ssh_client.connect(hostname=config.host, port=config.port, username=config.user, password=config.password)
+    sftp_client = ssh_client.open_sftp()
+
+    upload_timings, download_timings = [], []
+    with muted_progress() as progress:
+        task = progress.add_task('transfer', total=local_path.stat().st_size)
+
+        def callback(transferred, total):
+            progress.update(task, completed=transferred)
+
+        for _ in range(runs):
+            start = time.perf_counter()
+            sftp_client.put(str(local_path), str(remote_path), callback)
+            upload_timings.append(time.perf_counter() - start)
+
+            with open(os.devnull, 'wb') as devnull:
+                start = time.perf_counter()
+                sftp_client.getfo(str(remote_path), devnull, callback)
+                download_timings.append(time.perf_counter() - start)
+
+    print(f"paramiko defaults: cipher {ssh_client.get_transport().local_cipher}")
+    ssh_client.close()
+
+    return upload_timings, download_timings
+
+
+def measure_tuned(config, local_path: Path, remote_path: PurePath, runs: int, label: str) -> (list, list):
+    from utils import Sftp
+
+    sftp = Sftp(config)
+    upload_timings, download_timings = [], []
+    with muted_progress() as progress:
+        callback = Sftp._progress_callback(progress, progress.add_task('transfer', total=local_path.stat().st_size))
+
+        for _ in range(runs):
+            start = time.perf_counter()
+            sftp._put(local_path, remote_path, callback)
+            upload_timings.append(time.perf_counter() - start)
+
+            with open(os.devnull, 'wb') as devnull:
+                start = time.perf_counter()
+                sftp._get(remote_path, devnull, callback)
+                download_timings.append(time.perf_counter() - start)
+
+    print(f"{label}: cipher {sftp.ssh_client.get_transport().local_cipher}, ssh streams {sftp.stream is not None}")
+    sftp.close()
+
+    return upload_timings, download_timings
+
+
+def report(title: str, timings: list, size: int) -> None:
+    print(
+        f"{title:<32} median {size / statistics.median(timings):8.1f} MB/s | "
+        f"min {size / max(timings):8.1f} MB/s | max {size / min(timings):8.1f} MB/s"
+    )
+
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == '--serve':
+        serve(int(sys.argv[2]))
+        return
+
+    parser = ArgumentParser(description='XtraBackup Assistant SFTP transfer benchmark')
+    parser.add_argument('--size', type=int, default=256, help='MB, the size of the transferred file')
+    parser.add_argument('--runs', type=int, default=3, help='number of runs for every case')
+    parser.add_argument('--host', help='SFTP storage host (a local server is started if not set)')
+    parser.add_argument('--port', type=int, default=22)
+    parser.add_argument('--user')
+    parser.add_argument('--password')
+    parser.add_argument('--path', default='/tmp', help='the dir on the storage host the file is written to')
+    parser.add_argument('--window-size', type=int, help='MB, the tuned SSH channel window (paramiko default 2)')
+    parser.add_argument('--max-packet-size', type=int, help='KB, the tuned SSH packet size (paramiko default 32)')
+    parser.add_argument('--cipher', action='append', help='preferred ciphers for the tuned transport, in order')
+    args = parser.parse_args()
+
+    from configs import SftpConfig
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        server = None
+        port = args.port
+        if args.host is None:
+            server, port = start_local_server()
+            args.host, args.user, args.password, args.path = '127.0.0.1', LOCAL_USER, LOCAL_PASSWORD, temp_dir
+
+        local_path = Path(temp_dir, 'benchmark.local')
+        with open(local_path, 'wb') as local_file:
+            for _ in range(args.size):
+                local_file.write(os.urandom(1024 * 1024))
+        remote_path = PurePath(args.path, f"benchmark-{os.getpid()}.remote")
+
+        default_config = SftpConfig(host=args.host, port=port, user=args.user, password=args.password, path=args.path)
+        tuned_config = SftpConfig(
+            host=args.host,
+            port=port,
+            user=args.user,
+            password=args.password,
+            path=args.path,
+            window_size=args.window_size,
+            max_packet_size=args.max_packet_size,
+            ciphers=args.cipher or ('aes128-ctr', 'aes256-ctr')
+        )
+
+        try:
+            uploads, downloads = measure_defaults(default_config, local_path, remote_path, args.runs)
+            report('upload (paramiko defaults)', uploads, args.size)
+            report('download (paramiko defaults)', downloads, args.size)
+
+            uploads, downloads = measure_tuned(tuned_config, local_path, remote_path, args.runs, 'tuned')
+            report('upload (tuned)', uploads, args.size)
+            report('download (tuned)', downloads, args.size)
+
+            stream_config = dataclasses.replace(tuned_config, ssh_streams=True)
+            uploads, downloads = measure_tuned(stream_config, local_path, remote_path, args.runs, 'ssh streams')
+            report('upload (ssh streams)', uploads, args.size)
+            report('download (ssh streams)', downloads, args.size)
+        finally:
+            if server is not None:
+                server.kill()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Startup time benchmark.
+
+Measures the wall time of a bare interpreter start, of the CLI start (`main.py --version`, i.e. all module level
+imports) and, if the MySQL/XtraBackup binaries are available, of the environment detection with a cold and
+a warm version cache.
+
+Usage: python benchmarks/startup.py [--runs N]
+"""
+
+import statistics
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+SOURCE_DIR = Path(__file__).parent.parent.joinpath('xtrabackup-assistant').absolute()
+
+ENVIRONMENT_SNIPPET = 'import time; s = time.perf_counter(); from common import Environment; Environment(); ' \
+                      'print(time.perf_counter() - s)'
+
+
+def measure(command: list, runs: int) -> list:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=SOURCE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        timings.append(time.perf_counter() - start)
+
+    return timings
+
+
+def measure_environment(runs: int, cold: bool) -> list:
+    cache_path = Path(SOURCE_DIR.parent, 'data/cache/environment.json')
+
+    timings = []
+    for _ in range(runs):
+        if cold:
+            cache_path.unlink(missing_ok=True)
+        command = subprocess.run(
+            [sys.executable, '-c', ENVIRONMENT_SNIPPET],
+            cwd=SOURCE_DIR,
+            capture_output=True,
+            check=True
+        )
+        timings.append(float(command.stdout.decode('utf-8').strip().splitlines()[-1]))
+
+    return timings
+
+
+def report(title: str, timings: list) -> None:
+    print(
+        f"{title:<32} median {statistics.median(timings) * 1000:8.1f} ms | "
+        f"min {min(timings) * 1000:8.1f} ms | max {max(timings) * 1000:8.1f} ms"
+    )
+
+
+def main():
+    parser = ArgumentParser(description='XtraBackup Assistant startup benchmark')
+    parser.add_argument('--runs', type=int, default=20, help='number of runs for every case')
+    runs = parser.parse_args().runs
+
+    report('python -c pass', measure([sys.executable, '-c', 'pass'], runs))
+    report('main.py --version', measure([sys.executable, 'main.py', '--version'], runs))
+
+    try:
+        report('environment (cold cache)', measure_environment(runs, cold=True))
+        report('environment (warm cache)', measure_environment(runs, cold=False))
+    except subprocess.CalledProcessError:
+        print('environment detection skipped: mysql/xtrabackup binaries are not available')
+
+
+if __name__ == '__main__':
+    main()
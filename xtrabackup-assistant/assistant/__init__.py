@@ -1,2 +1,9 @@
+from utils import lazy_getattr
 from .commands import Command
-from .assistant import Assistant
+
+# the assistant pulls in the configs and rich, the CLI needs the commands only to parse the arguments
+_LAZY_ATTRIBUTES = {
+    'Assistant': '.assistant',
+}
+
+__getattr__ = lazy_getattr(__name__, _LAZY_ATTRIBUTES)
@@ -1,27 +1,121 @@
-from common import Environment
 from configs import Config
-from utils import Slack
-from .commands import Command, CreateCommand, RestoreCommand, RotateCommand
+from constants import JOB_LOCK_PATH, TEMP_DIR_PATH, TRASH_DIR_PATH
+from utils import ProcessLock, Throttle, IoPriority, clear_dir, reap_trash, echo, logger
+from .commands import Command
 
 
 class Assistant:
     def __init__(self, config: Config):
         self._config = config
 
-    def execute(self, command: Command) -> None:
-        if command in [Command.CREATE, Command.CREATE_UPLOAD]:
+    def execute(self, command: Command, options: dict = None) -> None:
+        options = options or {}
+        IoPriority.apply(self._config.io_priority)
+        # the dirs a previous run didn't get to delete (killed, the host restarted)
+        reap_trash(TRASH_DIR_PATH)
+
+        if command is Command.DAEMON:
+            from .commands import DaemonCommand
+
+            DaemonCommand(self._config).execute(run_job=self.execute)
+        elif command is Command.DAEMON_STATUS:
+            from .commands import DaemonCommand
+
+            DaemonCommand.print_status()
+        elif command is Command.BINLOG:
+            from .commands import BinlogCommand
+
+            # a long-running stream alongside the backup jobs, so it doesn't take the job lock
+            with Throttle(self._config.throttle) as throttle:
+                BinlogCommand(self._config, throttle).execute()
+        else:
+            # backup jobs must not overlap (cron runs, daemon jobs, manual runs share the data dirs)
+            with ProcessLock(JOB_LOCK_PATH, 'backup job'):
+                try:
+                    self._apply_auto_tuning()
+                    with Throttle(self._config.throttle) as throttle:
+                        self._execute_job(command, options, throttle)
+                finally:
+                    clear_dir(TEMP_DIR_PATH)
+
+    def _execute_job(self, command: Command, options: dict, throttle: Throttle) -> None:
+        # commands and their dependencies are imported per branch to keep startup cheap
+        if command in [Command.CREATE, Command.CREATE_UPLOAD] and options.get('targets') is not None:
+            from common import Environment
+            from .commands import OrchestrateCommand
+
+            env = Environment()
+            env.print_versions()
+            # failures are reported to Slack per target by the orchestrator
+            upload = command is Command.CREATE_UPLOAD
+            OrchestrateCommand(env, self._config, options['targets'], throttle).execute(upload)
+        elif command in [Command.CREATE, Command.CREATE_UPLOAD]:
+            from common import Environment
+            from .commands import CreateCommand
+
             env = Environment()
             env.print_versions()
             try:
                 upload = command is Command.CREATE_UPLOAD
-                CreateCommand(env, self._config).execute(upload)
+                CreateCommand(env, self._config, throttle).execute(upload)
             except RuntimeError as e:
                 if self._config.slack is not None:
+                    from utils import Slack
                     Slack(self._config.slack).notify(project=self._config.project_name, error=e)
                 raise
         elif command is Command.RESTORE:
+            from common import Environment
+            from .commands import RestoreCommand
+
             env = Environment()
             env.print_versions()
-            RestoreCommand(env, self._config).execute()
+            RestoreCommand(env, self._config, throttle).execute(
+                at=options.get('at'),
+                from_stage=options.get('from_stage'),
+                clean=options.get('clean', False),
+                apply=options.get('apply', False),
+                latest=options.get('latest', False),
+                filename=options.get('filename'),
+                pitr=options.get('pitr', False)
+            )
         elif command is Command.ROTATE:
+            from .commands import RotateCommand
+
             RotateCommand(self._config).execute()
+        elif command in [Command.VERIFY, Command.CHECK]:
+            from .commands import VerifyCommand, CheckCommand
+
+            try:
+                if command is Command.VERIFY:
+                    VerifyCommand(self._config, options.get('workers'), throttle).execute()
+                else:
+                    CheckCommand(self._config, options.get('archives'), options.get('workers'), throttle).execute()
+            except RuntimeError as e:
+                if self._config.slack is not None:
+                    from utils import Slack
+                    Slack(self._config.slack).notify(project=self._config.project_name, error=e)
+                raise
+
+    def _apply_auto_tuning(self) -> None:
+        """ Pick 'auto' thread options from the current host resources and log them for later comparison """
+
+        self._config.reset_tuning()
+        if not self._config.is_auto_tuned:
+            return
+
+        from utils.tuning import detect_host_resources, auto_tune
+
+        resources = detect_host_resources(TEMP_DIR_PATH)
+        tuning = auto_tune(resources)
+        self._config.apply_tuning(tuning)
+
+        disk_type = {True: 'rotational', False: 'SSD', None: 'unknown'}[resources['rotational_disk']]
+        message = (
+            f"Auto tuning: parallel={tuning['parallel']}, compress_threads={tuning['compress_threads']}, "
+            f"decompress_threads={tuning['decompress_threads']}, encrypt_threads={tuning['encrypt_threads']}, "
+            f"sftp_prefetch_requests={tuning['sftp_prefetch_requests']} "
+            f"(cpus={resources['cpu_count']}, load={resources['load_average']:.2f}, "
+            f"available_memory={resources['available_memory'] // 1024 ** 2}MB, disk={disk_type})"
+        )
+        echo(message, author='Tuning', time=False)
+        logger.info(message)
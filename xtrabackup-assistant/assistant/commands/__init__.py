@@ -1,4 +1,16 @@
+from utils import lazy_getattr
 from .command import Command
-from .create import CreateCommand
-from .restore import RestoreCommand
-from .rotate import RotateCommand
+
+# command modules pull in rich progress widgets, paramiko etc., so they are imported on first use only
+_LAZY_ATTRIBUTES = {
+    'CreateCommand': '.create',
+    'RestoreCommand': '.restore',
+    'RotateCommand': '.rotate',
+    'VerifyCommand': '.verify',
+    'CheckCommand': '.check',
+    'DaemonCommand': '.daemon',
+    'OrchestrateCommand': '.orchestrate',
+    'BinlogCommand': '.binlog',
+}
+
+__getattr__ = lazy_getattr(__name__, _LAZY_ATTRIBUTES)
@@ -0,0 +1,258 @@
+import gzip
+import os
+import re
+import shutil
+import signal
+import subprocess
+import threading
+from pathlib import Path, PurePath
+from time import monotonic
+from typing import Union
+
+from common import BinlogScanner, BinlogIndex, FanOutUpload, UploadFile, BINLOGS_DIR_NAME
+from configs import Config
+from constants import BINLOGS_DIR_PATH, BINLOG_LOCK_PATH
+from utils import ProcessLock, LocalStorage, HashingWriter, Throttle, echo, echo_warning, logger
+
+# binary logs are named by the server: <log_bin basename>.<sequence number>
+BINLOG_FILE_PATTERN = re.compile(r'^.+\.\d{6,}$')
+
+
+class BinlogCommand:
+    """
+    Streams the binary logs of the server continuously (mysqlbinlog --raw --stop-never) into data/binlogs/<project>.
+    A binary log is closed once the next one appears: it's scanned (time range, GTIDs), compressed and uploaded to
+    every storage along with the updated index, then removed locally. A broken stream is started again where it stopped.
+    """
+
+    POLL_INTERVAL = 5
+    RESTART_DELAY = 10
+    STOP_TIMEOUT = 10
+    QUERY_TIMEOUT = 30
+
+    def __init__(self, config: Config, throttle: Union[Throttle, None] = None):
+        if config.binlog is None:
+            raise RuntimeError("Required option 'binlog' is missing in the config")
+        if config.sftp is None and len(config.local_storages) == 0:
+            raise RuntimeError("Binary logs need a storage: 'sftp' or 'local_storage' option is missing in the config")
+        self._config = config
+        self._throttle = throttle
+
+        self._dir_path = Path(BINLOGS_DIR_PATH, self._config.project_name)
+        self._index_path = Path(self._dir_path, BinlogIndex.FILENAME)
+        self._remote_dir_path = PurePath(BINLOGS_DIR_NAME, self._config.project_name)
+
+        self._stopped = threading.Event()
+        self._process: Union[subprocess.Popen, None] = None
+        self._flushed_at = monotonic()
+        self._upload_retry_at = 0.0
+
+    def execute(self) -> None:
+        # runs alongside the backup jobs, only one stream per host
+        with ProcessLock(BINLOG_LOCK_PATH, 'binlog streaming'):
+            signal.signal(signal.SIGTERM, self._stop)
+            signal.signal(signal.SIGHUP, self._stop)
+            self._dir_path.mkdir(parents=True, exist_ok=True)
+
+            echo(f"Binary log streaming started (pid {os.getpid()})", author='Binlog')
+            logger.info(f"[{self._config.project_name}] Binary log streaming started (pid {os.getpid()})")
+
+            try:
+                while not self._stopped.is_set():
+                    if self._process is None or self._process.poll() is not None:
+                        self._start_stream()
+                    if monotonic() >= self._upload_retry_at:
+                        self._upload_closed_binlogs()
+                    self._flush_if_due()
+
+                    self._stopped.wait(self.POLL_INTERVAL)
+            finally:
+                self._stop_stream()
+
+                echo('Binary log streaming stopped', author='Binlog')
+                logger.info(f"[{self._config.project_name}] Binary log streaming stopped")
+
+    def _start_stream(self) -> None:
+        if self._process is not None:
+            # the stream broke (server restart, network), it's started again from the binary log being written
+            message = f"mysqlbinlog exited with code {self._process.returncode}, see {self._stream_log_path}"
+            echo_warning(message, author='Binlog')
+            logger.warning(f"[{self._config.project_name}] {message}")
+            self._process = None
+            if self._stopped.wait(self.RESTART_DELAY):
+                return
+
+        start_file = self._start_file()
+        command_options = (
+            '--read-from-remote-server',
+            '--raw',
+            '--stop-never',
+            f"--connection-server-id={self._config.binlog.server_id}",
+            f"--user={self._config.xtrabackup.user}",
+            f"--host={self._config.xtrabackup.host}",
+            # the raw binary logs are written under their own names into the dir
+            f"--result-file={self._dir_path}/",
+            start_file
+        )
+        with open(self._stream_log_path, 'ab') as stream_log:
+            self._process = subprocess.Popen(
+                ['mysqlbinlog', *command_options],
+                stdout=subprocess.DEVNULL,
+                stderr=stream_log,
+                env={**os.environ, 'MYSQL_PWD': self._config.xtrabackup.password}
+            )
+
+        echo(f"Streaming binary logs from {start_file}", author='Binlog')
+        logger.info(f"[{self._config.project_name}] Streaming binary logs from {start_file}")
+
+    def _start_file(self) -> str:
+        """ The binary log being written if any, otherwise the last one uploaded (it's skipped), the current one """
+
+        local_binlogs = self._local_binlogs()
+        if len(local_binlogs) > 0:
+            return local_binlogs[-1]
+
+        latest = BinlogIndex.load(self._index_path).latest()
+        if latest is not None:
+            return latest['name']
+        if self._config.binlog.start_file is not None:
+            return self._config.binlog.start_file
+
+        rows = self._query('SHOW BINARY LOGS')
+        if rows is None or len(rows) == 0:
+            raise RuntimeError('Failed to get the binary logs of the server. Is binary logging enabled?')
+
+        return rows[-1].split('\t')[0]
+
+    def _upload_closed_binlogs(self) -> None:
+        # the newest binary log is being written
+        for name in self._local_binlogs()[:-1]:
+            if self._stopped.is_set():
+                return
+            try:
+                self._upload_binlog(name)
+            except RuntimeError as e:
+                echo_warning(f"Failed to upload binary log {name}: {e}", author='Binlog')
+                logger.error(f"[{self._config.project_name}] Failed to upload binary log {name}: {e}")
+                self._upload_retry_at = monotonic() + self.RESTART_DELAY
+                return
+
+    def _upload_binlog(self, name: str) -> None:
+        path = Path(self._dir_path, name)
+        index = BinlogIndex.load(self._index_path)
+        if name in index.names:
+            # streamed again after a restart
+            path.unlink()
+            return
+
+        with open(path, 'rb') as binlog_file:
+            scanner = BinlogScanner(binlog_file).scan()
+
+        compressed_path = path.with_name(f"{name}.gz")
+        with open(path, 'rb') as binlog_file, open(compressed_path, 'wb') as compressed_file:
+            writer = HashingWriter(compressed_file, self._config.checksum_algorithm)
+            compress_level = self._config.binlog.compress_level
+            with gzip.GzipFile(filename=name, fileobj=writer, mode='wb', compresslevel=compress_level) as gzip_file:
+                shutil.copyfileobj(binlog_file, gzip_file)
+
+        index.add({
+            'name': name,
+            'filename': compressed_path.name,
+            'size': writer.size,
+            'algorithm': writer.algorithm,
+            'digest': writer.hexdigest(),
+            'first_event_at': scanner.first_event_at,
+            'last_event_at': scanner.last_event_at,
+            'gtids': scanner.gtids
+        })
+        # the local index is replaced once the storages have the binary log, so a failed upload is retried
+        new_index_path = self._index_path.with_suffix('.new')
+        index.save(new_index_path)
+
+        self._upload([(compressed_path, compressed_path.name), (new_index_path, BinlogIndex.FILENAME)])
+
+        os.replace(new_index_path, self._index_path)
+        compressed_path.unlink()
+        path.unlink()
+
+        message = (f"Binary log {name} uploaded: {scanner.first_event_at} - {scanner.last_event_at}, "
+                   f"{scanner.events_count} events")
+        echo(message, author='Binlog')
+        logger.info(f"[{self._config.project_name}] {message}")
+
+    def _upload(self, files: list) -> None:
+        """ Files in order ((local path, remote name), ...): the index goes after the binary log it refers to """
+
+        rate_limiter = self._throttle.network if self._throttle is not None else None
+        if self._config.sftp is not None:
+            upload = FanOutUpload(self._config.sftp_destinations, rate_limiter=rate_limiter, interactive=False)
+            upload.upload(*[[UploadFile(local_path, self._remote_dir_path / name)] for local_path, name in files])
+
+        for config in self._config.local_storages:
+            try:
+                with LocalStorage(config) as storage:
+                    for local_path, name in files:
+                        remote_path = Path(config.path, self._remote_dir_path, name)
+                        storage.upload(local_path, remote_path, display_progress=False)
+            except RuntimeError as e:
+                if config.required:
+                    raise RuntimeError(f"local storage {config.label}: {e}")
+                logger.warning(f"[{self._config.project_name}] Binary log copy to {config.label} failed: {e}")
+
+    def _flush_if_due(self) -> None:
+        """ Close the current binary log, so the events are uploaded at least every flush interval """
+
+        if self._config.binlog.flush_interval is None:
+            return
+        if monotonic() - self._flushed_at < self._config.binlog.flush_interval:
+            return
+
+        self._flushed_at = monotonic()
+        if self._query('FLUSH BINARY LOGS') is None:
+            logger.warning(f"[{self._config.project_name}] FLUSH BINARY LOGS failed (RELOAD privilege needed)")
+
+    def _query(self, query: str) -> Union[list, None]:
+        """ Rows of a query result (tab-separated), None if the server can't be queried """
+
+        command_options = (
+            f"--user={self._config.xtrabackup.user}",
+            f"--host={self._config.xtrabackup.host}",
+            '--batch',
+            '--skip-column-names',
+            '--execute', query
+        )
+        try:
+            command = subprocess.run(
+                ['mysql', *command_options],
+                capture_output=True,
+                timeout=self.QUERY_TIMEOUT,
+                env={**os.environ, 'MYSQL_PWD': self._config.xtrabackup.password}
+            )
+        except (OSError, subprocess.TimeoutExpired):
+            return None
+        if command.returncode != 0:
+            return None
+
+        return command.stdout.decode('utf-8', errors='replace').splitlines()
+
+    def _local_binlogs(self) -> list:
+        return sorted(path.name for path in self._dir_path.iterdir() if BINLOG_FILE_PATTERN.match(path.name))
+
+    @property
+    def _stream_log_path(self) -> Path:
+        return Path(self._dir_path, 'mysqlbinlog.log')
+
+    def _stop_stream(self) -> None:
+        if self._process is None or self._process.poll() is not None:
+            return
+
+        self._process.terminate()
+        try:
+            self._process.wait(self.STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+            self._process.wait()
+
+    # noinspection PyUnusedLocal
+    def _stop(self, signum, frame) -> None:
+        self._stopped.set()
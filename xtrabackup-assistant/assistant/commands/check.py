@@ -0,0 +1,229 @@
+import tarfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from time import monotonic
+from typing import Union, IO
+
+from humanize import naturalsize
+from rich.progress import Progress, TextColumn, SpinnerColumn, BarColumn, MofNCompleteColumn
+from rich.table import Column
+from rich.text import Text
+
+from common import Manifest, XbstreamScanner, ChunkIndex, ChunkStore, PartIndex, PartReader, ShardIndex, \
+    find_local_backups
+from configs import Config
+from constants import BACKUPS_DIR_PATH, CHUNKS_DIR_PATH
+from utils import echo, logger, Throttle, RateLimitedReader, HashingReader, print_summary, write_report
+
+# files every xtrabackup backup has, compressed/encrypted ones are stored with the compression/encryption suffix
+REQUIRED_FILES = ('xtrabackup_checkpoints', 'xtrabackup_info')
+COMPRESSION_SUFFIXES = ('', '.qp', '.zst', '.lz4')
+FILE_SUFFIXES = tuple(f"{suffix}{encryption}" for suffix in COMPRESSION_SUFFIXES for encryption in ('', '.xbcrypt'))
+
+
+@dataclass
+class CheckResult:
+    path: str
+    size: int
+    status: str = 'ok'
+    files_count: int = 0
+    data_size: int = 0
+    backup_type: Union[str, None] = None
+    from_lsn: Union[str, None] = None
+    to_lsn: Union[str, None] = None
+    checksum: str = '-'
+    seconds: float = 0
+    error: Union[str, None] = None
+
+
+class CheckCommand:
+    """
+    Checks that local backup archives are restorable without restoring them: every archive is read once as a stream,
+    validating the tar structure, the xbstream chunks and their checksums and the archive checksum (if there is
+    a manifest). Nothing is extracted to the disk. Archives are checked concurrently.
+    """
+
+    DEFAULT_WORKERS = 4
+
+    def __init__(
+        self,
+        config: Config,
+        archives: Union[list, None] = None,
+        workers: Union[int, None] = None,
+        throttle: Union[Throttle, None] = None
+    ):
+        if workers is not None and workers < 1:
+            raise RuntimeError('The number of check workers must be positive')
+        self._config = config
+        self._archives = archives
+        self._workers = workers or self.DEFAULT_WORKERS
+        self._throttle = throttle
+
+        self.results: list = []
+
+    def execute(self) -> None:
+        if self._archives:
+            paths = [Path(archive).absolute() for archive in self._archives]
+            missing = [str(path) for path in paths if not path.is_file()]
+            if len(missing) > 0:
+                raise RuntimeError(f"Backup archives not found: [default]{', '.join(missing)}")
+        else:
+            paths = sorted(backup.path for backup in find_local_backups(BACKUPS_DIR_PATH))
+
+        if len(paths) == 0:
+            echo(text='Not found local backups to check.', style='orange1', time=False)
+            return None
+
+        echo(f"Start checking {len(paths)} local backups ({self._workers} workers)", author='Check')
+
+        with Progress(
+            TextColumn('[blue]\\[Check][/blue]'),
+            SpinnerColumn(),
+            TextColumn('[progress.description]{task.description}'),
+            BarColumn(),
+            MofNCompleteColumn(),
+            transient=True
+        ) as progress:
+            checking = progress.add_task('[blue]Checking backups...', total=len(paths))
+
+            with ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix='check') as executor:
+                futures = [executor.submit(self._check_archive, path) for path in paths]
+                for future in as_completed(futures):
+                    self.results.append(future.result())
+                    progress.advance(checking)
+
+        self.results.sort(key=lambda result: result.path)
+        self._print_summary()
+        report_path = write_report('check', self.results)
+        echo(f"Report written: {report_path}", author='Check')
+
+        failed = [result for result in self.results if result.status != 'ok']
+        message = (f"Checked {len(self.results)} local backups: {len(self.results) - len(failed)} ok, "
+                   f"{len(failed)} failed")
+        if len(failed) > 0:
+            logger.error(message)
+            raise RuntimeError(f"{message}: [default]{', '.join(Path(result.path).name for result in failed)}")
+
+        logger.info(message)
+        echo(message, author='Check')
+
+    def _check_archive(self, path: Path) -> CheckResult:
+        result = CheckResult(path=str(path), size=path.stat().st_size)
+        started_at = monotonic()
+
+        try:
+            manifest_path = Manifest.path_for(path)
+            manifest = Manifest.load(manifest_path) if manifest_path.exists() else None
+
+            if path.suffix == ShardIndex.SUFFIX:
+                # a sharded backup: the index is verified by the manifest, every shard archive by the index
+                index = ShardIndex.load(path)
+                result.size = index.size
+                if manifest is not None:
+                    with open(path, 'rb') as index_file:
+                        index_reader = HashingReader(index_file, manifest.algorithm)
+                        index_reader.read_to_end()
+                    manifest.verify(index_reader.hexdigest(), index_reader.size)
+                scanners = [
+                    self._scan_archive(open(part_path, 'rb'), index.part_manifest(part))
+                    for part, part_path in zip(index.parts, index.part_paths(path.parent))
+                ]
+                result.checksum = 'verified'
+            else:
+                if path.suffix == ChunkIndex.SUFFIX:
+                    # a deduplicated backup is checked as the archive reassembled from its chunks
+                    index = ChunkIndex.load(path)
+                    result.size = index.size
+                    archive_file = ChunkStore(CHUNKS_DIR_PATH).open(index)
+                elif path.suffix == PartIndex.SUFFIX:
+                    # a split backup is checked as the archive its parts make up, read one after another
+                    index = PartIndex.load(path)
+                    result.size = index.size
+                    archive_file = PartReader(path.parent, index)
+                else:
+                    archive_file = open(path, 'rb')
+                scanners = [self._scan_archive(archive_file, manifest)]
+                result.checksum = 'verified' if manifest is not None else 'no manifest'
+
+            self._check_contents(scanners, result)
+        except (RuntimeError, tarfile.TarError, OSError, EOFError) as e:
+            result.status = 'failed'
+            result.error = str(e) or type(e).__name__
+        finally:
+            result.seconds = round(monotonic() - started_at, 2)
+
+        return result
+
+    def _scan_archive(self, archive_file: IO[bytes], manifest: Union[Manifest, None]) -> XbstreamScanner:
+        with archive_file:
+            archive = archive_file
+            if self._throttle is not None:
+                archive = RateLimitedReader(archive, self._throttle.disk)
+            if manifest is not None:
+                archive = HashingReader(archive, manifest.algorithm)
+
+            scanner = None
+            # stream mode: the archive is read once front to back, the xbstream member is validated on the way
+            with tarfile.open(fileobj=archive, mode='r|') as tar:
+                for member in tar:
+                    if member.name.endswith('.xbstream'):
+                        scanner = XbstreamScanner(tar.extractfile(member), capture=('xtrabackup_checkpoints',))
+                        scanner.scan()
+
+            if scanner is None:
+                raise RuntimeError('Not found .xbstream backup file in the archive')
+
+            if manifest is not None:
+                archive.read_to_end()
+                manifest.verify(archive.hexdigest(), archive.size)
+
+        return scanner
+
+    @staticmethod
+    def _check_contents(scanners: list, result: CheckResult) -> None:
+        # the shards of a sharded backup have the files of one backup between them
+        files = {path: size for scanner in scanners for path, size in scanner.files.items()}
+        captured = {path: content for scanner in scanners for path, content in scanner.captured.items()}
+        result.files_count = len(files)
+        result.data_size = sum(files.values())
+
+        missing = [
+            name for name in REQUIRED_FILES
+            if not any(f"{name}{suffix}" in files for suffix in FILE_SUFFIXES)
+        ]
+        if len(missing) > 0:
+            raise RuntimeError(f"Missing backup files: {', '.join(missing)}")
+
+        # backup_type = full-backuped / from_lsn = 0 / to_lsn = 18153472 ...
+        checkpoints = str(captured.get('xtrabackup_checkpoints', b''), 'utf-8', errors='replace')
+        for line in checkpoints.splitlines():
+            key, _, value = (part.strip() for part in line.partition('='))
+            if key in ('backup_type', 'from_lsn', 'to_lsn'):
+                setattr(result, key, value)
+
+    def _print_summary(self) -> None:
+        # LSNs and timings are in the report only, the table has to fit the terminal
+        checksum_styles = {'verified': 'green3', 'no manifest': 'dark_orange'}
+        print_summary(
+            'Local backups check',
+            (
+                Column('Backup', no_wrap=True),
+                Column('Status'),
+                Column('Files', justify='right'),
+                Column('Data', justify='right'),
+                Column('Checksum', no_wrap=True),
+                Column('Error')
+            ),
+            (
+                (
+                    Path(result.path).name,
+                    Text(result.status, 'green3' if result.status == 'ok' else 'bright_red'),
+                    str(result.files_count),
+                    naturalsize(result.data_size),
+                    Text(result.checksum, checksum_styles.get(result.checksum, 'default')),
+                    result.error or ''
+                )
+                for result in self.results
+            )
+        )
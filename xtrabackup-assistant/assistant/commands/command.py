@@ -6,6 +6,11 @@ class Command(enum.Enum):
     CREATE_UPLOAD = 'create_upload'
     RESTORE = 'restore'
     ROTATE = 'rotate'
+    VERIFY = 'verify'
+    CHECK = 'check'
+    DAEMON = 'daemon'
+    DAEMON_STATUS = 'daemon_status'
+    BINLOG = 'binlog'
 
     def __str__(self) -> str:
         return str(self.value)
@@ -1,98 +1,313 @@
+import hashlib
 import os
 import shutil
 import subprocess
 import tarfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
 from pathlib import Path, PurePath
-from typing import Union
+from time import monotonic
+from typing import Union, Any, IO, Iterator
 
+from humanize import naturalsize
 from rich.progress import Progress, TextColumn, SpinnerColumn, BarColumn, TaskProgressColumn, DownloadColumn
+from rich.table import Table
 from rich.text import Text
 
-from common import Environment, XtrabackupMessage, Backup
-from configs import Config
-from constants import BACKUPS_DIR_PATH, TEMP_DIR_PATH, LOGS_DIR_PATH
-from utils import now, Sftp, echo, echo_warning, logger
+from common import Environment, XtrabackupLogPipeline, Backup, DatadirEstimate, Manifest, ChunkIndex, ChunkStore, \
+    ChunkingWriter, RemoteChunkStore, CHUNKS_DIR_NAME, FanOutUpload, UploadFile, PartIndex, PartWriter, ShardIndex, \
+    ShardPlan, XbstreamSharder, BACKUP_INDEXES, RunHistory, CapacityPlan
+from configs import Config, LocalStorageConfig
+from constants import BACKUPS_DIR_PATH, TEMP_DIR_PATH, LOGS_DIR_PATH, CHUNKS_DIR_PATH, RUN_HISTORY_PATH
+from exceptions import SftpError
+from utils import now, Sftp, LocalStorage, echo, echo_warning, logger, TokenBucket, Throttle, RateLimitedReader, \
+    HashingWriter, HashingReader, IoPriority
 
 
 class CreateCommand:
-    def __init__(self, env: Environment, config: Config):
+    SLOWEST_FILES_COUNT = 10
+
+    def __init__(
+        self,
+        env: Environment,
+        config: Config,
+        throttle: Union[Throttle, None] = None,
+        interactive: bool = True,
+        upload_rate_limiter: Union[TokenBucket, None] = None
+    ):
         self._env = env
         self._config = config
+        self._throttle = throttle
+        # non-interactive commands (run side by side by the orchestrator) only log, without progress bars and echo
+        self._interactive = interactive
+        if upload_rate_limiter is None and throttle is not None:
+            upload_rate_limiter = throttle.network
+        self._upload_rate_limiter = upload_rate_limiter
+        # separate temp dir per project, so backups of several instances don't share files
+        self._temp_dir_path = Path(TEMP_DIR_PATH, self._config.project_name)
 
         self._temp_backup_file_path = None
+        self._temp_shard_paths = []
         self._temp_log_path = None
+        # recorded in the manifest, a point-in-time recovery checks the binary logs from there before it starts
+        self._binlog_position: Union[list, None] = None
+        self._backup_archive_path: Union[Path, None] = None
         self._backup: Union[Backup, None] = None
 
+        # recorded in the run history, the next backups are planned from them
+        self._uploads = True
+        # the low-disk pipeline: xtrabackup writes straight into the archive, there's no temp file
+        self._streamed = False
+        self._data_size: Union[int, None] = None
+        self._stream_size: Union[int, None] = None
+        self._durations: dict = {}
+
+    @property
+    def backup(self) -> Union[Backup, None]:
+        return self._backup
+
     def execute(self, upload: bool = True) -> None:
-        self._create_backup()
-        self._create_archive()
+        self._uploads = upload and (self._config.sftp is not None or len(self._config.local_storages) > 0)
+        with self._timed('backup'):
+            self._create_backup()
+        with self._timed('archive'):
+            self._create_archive()
 
         success_msg = Text.assemble(
             ('Backup successfully created: ', 'green3'),
             (f"{self._backup.filename} ", 'default italic'),
             (f"({self._backup.size})", 'default italic')
         )
-        echo(success_msg, time=False)
+        self._echo(success_msg, time=False)
 
         if upload:
-            if self._config.sftp is not None:
-                self._upload_to_sftp_storage()
-                echo('Dump successfully uploaded to SFTP backups storage!', style='green3', author='SFTP')
-                logger.info(Text.from_markup(str(success_msg.append('. Uploaded to SFTP storage.'))))
-            else:
+            if self._config.sftp is None and len(self._config.local_storages) == 0:
                 echo_warning("'sftp' option is missing in the config. Upload is skipped.")
-        else:
-            logger.info(Text.from_markup(str(success_msg)))
+            with self._timed('upload'):
+                if self._config.sftp is not None:
+                    self._upload_to_sftp_storage()
+                    self._echo('Dump successfully uploaded to SFTP backups storage!', style='green3', author='SFTP')
+                    success_msg.append('. Uploaded to SFTP storage.')
+                if len(self._config.local_storages) > 0:
+                    self._copy_to_local_storages()
+                    success_msg.append('. Copied to local storage.')
+        logger.info(Text.from_markup(str(success_msg)))
+
+        RunHistory.record(
+            RUN_HISTORY_PATH,
+            self._config.project_name,
+            'create',
+            pipeline='streamed' if self._streamed else 'standard',
+            data_size=self._data_size,
+            stream_size=self._stream_size,
+            archive_size=self._backup.size_bytes,
+            durations={phase: round(seconds, 1) for phase, seconds in self._durations.items()}
+        )
+
+    @contextmanager
+    def _timed(self, phase: str) -> Iterator[None]:
+        started_at = monotonic()
+        yield
+        self._durations[phase] = monotonic() - started_at
+
+    def _plan_capacity(self) -> bool:
+        """
+        Check the free space for the backup before it's started, the sizes and the duration are predicted from the
+        previous backups. Returns whether the backup is streamed straight into the archive (the low-disk pipeline),
+        which is the case when there's space for the archive but not for the temp file next to it.
+        """
+
+        history = RunHistory.load(RUN_HISTORY_PATH)
+        project = self._config.project_name
+        data_size = self._data_size or history.last(project, 'create', 'data_size')
+        if data_size is None:
+            # nothing to predict from: no estimate and no backups yet
+            return False
+
+        # compressed, the xbstream is taken as large as the data until a backup shows the compression ratio
+        stream_size = data_size * (history.compression_ratio(project) or 1)
+        phases = ('backup', 'archive', 'upload') if self._uploads else ('backup', 'archive')
+        rates = [history.seconds_per_byte(project, 'create', phase) for phase in phases]
+        rates = [rate for rate in rates if rate is not None]
+        seconds = sum(rates) * data_size if len(rates) > 0 else None
+
+        # a deduplicated backup is stored as chunks, it's planned as if none of them were stored already
+        archive_dir_path = CHUNKS_DIR_PATH if self._config.dedup is not None else BACKUPS_DIR_PATH
+        plan = CapacityPlan({self._temp_dir_path: stream_size, archive_dir_path: stream_size}, seconds)
+        shortages = plan.shortages()
+        if len(shortages) == 0:
+            self._echo(f"Predicted: {plan.describe()}", author='Capacity')
+            return False
+
+        # only a single archive is written as the xbstream comes
+        streamed_plan = CapacityPlan({BACKUPS_DIR_PATH: stream_size}, seconds)
+        can_stream = self._config.dedup is None and self._config.split is None and self._config.shard is None
+        if can_stream and streamed_plan.fits:
+            message = (f"Not enough free space for the temp file ({CapacityPlan.describe_shortages(shortages)}), "
+                       f"the backup is streamed straight into the archive. Predicted: {streamed_plan.describe()}")
+            echo_warning(message, author='Capacity')
+            logger.warning(f"[{self._config.project_name}] {message}")
+            return True
+
+        shortages = CapacityPlan.describe_shortages(streamed_plan.shortages() if can_stream else shortages)
+        raise RuntimeError(f"Not enough free space for the backup: [default]{shortages}")
 
     def _create_backup(self) -> None:
         """ Create compressed dump (xbstream) with log file in temp dir """
 
         backup_timestamp = now('%Y-%m-%d-%H-%M')
         backup_file_name = f"{backup_timestamp}_{self._config.project_name}_{self._env.mysql_version}"
-        temp_backup_file_path = Path(TEMP_DIR_PATH, f"{backup_file_name}.xbstream")
-        temp_log_path = Path(TEMP_DIR_PATH, 'xtrabackup.log')
-
-        with open(temp_backup_file_path, 'wb') as backup_file, open(temp_log_path, 'w') as log_file:
-            command_options = (
-                '--backup',
-                '--stream=xbstream',
-                '--compress',
-                f"--parallel={self._config.xtrabackup.parallel}",
-                '--compress-threads=5',
-                f"--user={self._config.xtrabackup.user}",
-                f"--password={self._config.xtrabackup.password}",
-                f"--host={self._config.xtrabackup.host}",
-                f"--target-dir={TEMP_DIR_PATH}"
-            )
-            command = subprocess.Popen(['xtrabackup', *command_options], stdout=backup_file, stderr=subprocess.PIPE)
-            for line in command.stderr:
-                message = XtrabackupMessage(str(line, 'utf-8'))
+        self._temp_dir_path.mkdir(exist_ok=True)
+        temp_backup_file_path = Path(self._temp_dir_path, f"{backup_file_name}.xbstream")
+        temp_log_path = Path(self._temp_dir_path, 'xtrabackup.log')
+        # in the dir of the month the backup is started in, even if it's finished in the next one
+        self._backup_archive_path = Path(
+            BACKUPS_DIR_PATH, backup_timestamp[:4], backup_timestamp[5:7], f"{backup_file_name}.tar"
+        )
 
-                log_file.write(f"{message.formatted}\n")
-                echo(message.formatted, author='XtraBackup', time=False)
+        datadir_estimate = DatadirEstimate(self._config.xtrabackup)
+        if datadir_estimate.is_available:
+            self._data_size = datadir_estimate.total_size
+            self._echo(
+                f"Estimated data size: {naturalsize(datadir_estimate.total_size)} "
+                f"({len(datadir_estimate.files)} files, from {datadir_estimate.source})",
+                author='XtraBackup',
+                time=False
+            )
+        self._streamed = self._plan_capacity()
 
-            return_code = command.wait()
+        # a sharded backup is split into the shard files on its way from xtrabackup, it's never written as a whole
+        sharded = self._config.shard is not None
+        if self._streamed:
+            # the xbstream goes right after the space for its tar header, the header is written once it's complete;
+            # it's not a backup until then, so it's written under a name the backup listings skip
+            backup_output = self._open_streamed_archive(self._backup_archive_path, temp_backup_file_path.name)
+        elif sharded:
+            backup_output = nullcontext(subprocess.PIPE)
+        else:
+            backup_output = open(temp_backup_file_path, 'wb')
+        try:
+            with backup_output as backup_file:
+                command_options = (
+                    '--backup',
+                    '--stream=xbstream',
+                    '--compress',
+                    f"--parallel={self._config.xtrabackup.parallel}",
+                    f"--compress-threads={self._config.xtrabackup.compress_threads}",
+                    f"--user={self._config.xtrabackup.user}",
+                    f"--password={self._config.xtrabackup.password}",
+                    f"--host={self._config.xtrabackup.host}",
+                    f"--target-dir={self._temp_dir_path}"
+                )
+                if self._config.xtrabackup.encrypt is not None:
+                    command_options += (
+                        f"--encrypt={self._config.xtrabackup.encrypt}",
+                        *self._config.xtrabackup.encryption_options
+                    )
+                if self._throttle is not None and self._throttle.xtrabackup_throttle is not None:
+                    command_options += (f"--throttle={self._throttle.xtrabackup_throttle}",)
+                command = subprocess.Popen(
+                    IoPriority.command(['xtrabackup', *command_options]),
+                    stdout=backup_file,
+                    stderr=subprocess.PIPE
+                )
+                log_pipeline = XtrabackupLogPipeline(
+                    command.stderr,
+                    temp_log_path,
+                    interactive=self._interactive,
+                    file_sizes=datadir_estimate.files if datadir_estimate.is_available else None
+                )
+                with log_pipeline:
+                    if sharded:
+                        self._split_into_shards(command, temp_backup_file_path, datadir_estimate.files)
+                    return_code = command.wait()
 
-        if return_code != 0:
-            error_log_path = Path(LOGS_DIR_PATH, f"{backup_timestamp}-error.log")
-            shutil.move(temp_log_path, error_log_path)
+            if return_code != 0:
+                error_log_path = Path(LOGS_DIR_PATH, f"{backup_timestamp}_{self._config.project_name}-error.log")
+                shutil.move(temp_log_path, error_log_path)
 
-            raise RuntimeError(f"Failed to create a backup! Error log: [default]{str(error_log_path)}")
+                raise RuntimeError(f"Failed to create a backup! Error log: [default]{str(error_log_path)}")
+        except BaseException:
+            if self._streamed:
+                # interrupted or failed, the written part of the stream is of no use
+                self._remove_archive(self._backup_archive_path)
+            raise
 
         self._temp_backup_file_path = temp_backup_file_path
         self._temp_log_path = temp_log_path
+        self._binlog_position = log_pipeline.binlog_position
+        if not self._streamed and not sharded:
+            self._stream_size = temp_backup_file_path.stat().st_size
+
+        self._report_slowest_files(log_pipeline.copy_times, datadir_estimate.files)
+
+    def _split_into_shards(self, command: subprocess.Popen, backup_file_path: Path, file_sizes: dict) -> None:
+        """ Split the xtrabackup stream into a stream per shard, the shard files are written concurrently """
+
+        plan = ShardPlan(self._config.shard.count, file_sizes)
+        self._temp_shard_paths = [
+            backup_file_path.with_name(f"{backup_file_path.stem}.shard{index + 1:02d}.xbstream")
+            for index in range(plan.count)
+        ]
+        try:
+            sharder = XbstreamSharder(command.stdout, plan, self._temp_shard_paths).split()
+        except BaseException:
+            # xtrabackup isn't left blocked on the pipe nobody reads anymore
+            command.kill()
+            command.wait()
+            raise
+        finally:
+            command.stdout.close()
+
+        self._stream_size = sum(sharder.sizes)
+        sizes = ', '.join(naturalsize(size) for size in sharder.sizes)
+        self._echo(f"Backup stream split into {plan.count} shards: {sizes}", author='XtraBackup')
+        logger.info(f"[{self._config.project_name}] Backup stream split into {plan.count} shards: {sizes}")
+
+    def _report_slowest_files(self, copy_times: dict, file_sizes: dict) -> None:
+        """ Files dominating the backup time, to the console and the log """
+
+        slowest_files = sorted(copy_times.items(), key=lambda item: item[1], reverse=True)[:self.SLOWEST_FILES_COUNT]
+        if len(slowest_files) == 0:
+            return
+
+        table = Table(title='Slowest copied files')
+        table.add_column('File', no_wrap=True)
+        table.add_column('Size', justify='right')
+        table.add_column('Time', justify='right')
+        table.add_column('Speed', justify='right')
+
+        log_lines = []
+        for file_path, seconds in slowest_files:
+            size = file_sizes.get(file_path)
+            size_text = naturalsize(size) if size is not None else '-'
+            speed_text = f"{naturalsize(size / seconds)}/s" if size is not None and seconds > 0 else '-'
+
+            table.add_row(file_path, size_text, f"{seconds:.1f}s", speed_text)
+            log_lines.append(f"{file_path}: {seconds:.1f}s, {size_text}, {speed_text}")
+
+        self._echo(table)
+        logger.info(f"[{self._config.project_name}] Slowest copied files:\n" + '\n'.join(log_lines))
+
+    @staticmethod
+    def _partial_path(backup_archive_path: Path) -> Path:
+        return backup_archive_path.with_name(f"{backup_archive_path.name}.partial")
 
     def _create_archive(self) -> None:
         """ Create a tarball for backup and log files """
 
-        # prepare a directory for today's backups
-        backup_archive_dir_path = Path(f"{BACKUPS_DIR_PATH}/{now('%Y')}/{now('%m')}")
-        if not os.path.exists(backup_archive_dir_path):
-            os.makedirs(backup_archive_dir_path)
-
         # create an archive in the final dir
-        backup_file_name = self._temp_backup_file_path.name.replace('xbstream', 'tar')
-        backup_archive_path = Path(backup_archive_dir_path, backup_file_name)
+        backup_archive_path = self._backup_archive_path
+        backup_archive_path.parent.mkdir(parents=True, exist_ok=True)
+        if self._config.dedup is not None:
+            # a chunk index in place of the archive, the chunks are shared with the other backups
+            backup_archive_path = backup_archive_path.with_suffix(ChunkIndex.SUFFIX)
+        if self._config.split is not None:
+            # a part index in place of the archive, the parts are stored next to it
+            backup_archive_path = backup_archive_path.with_suffix(PartIndex.SUFFIX)
+        if self._config.shard is not None:
+            # a shard index in place of the archive, the shard archives are stored next to it
+            backup_archive_path = backup_archive_path.with_suffix(ShardIndex.SUFFIX)
         with Progress(
             TextColumn('[blue]\\[tar][/blue]'),
             SpinnerColumn(),
@@ -100,24 +315,25 @@ class CreateCommand:
             BarColumn(),
             TaskProgressColumn(),
             DownloadColumn(),
-            transient=True
+            transient=True,
+            disable=not self._interactive
         ) as progress:
-            echo('Start creating archive', author='tar')
+            self._echo('Start creating archive', author='tar')
 
             try:
-                with progress.open(self._temp_backup_file_path, 'rb',) as backup:
-                    with tarfile.open(backup_archive_path, 'w') as tar:
-                        # add backup file
-                        file_info = tarfile.TarInfo(self._temp_backup_file_path.name)
-                        file_info.size = self._temp_backup_file_path.stat().st_size
-                        tar.addfile(file_info, fileobj=backup)
-                        # add log file
-                        tar.add(self._temp_log_path, arcname=self._temp_log_path.name)
+                if self._streamed:
+                    size, manifest = self._finish_streamed_archive(backup_archive_path)
+                elif self._config.shard is not None:
+                    size, manifest = self._write_shard_archives(progress, backup_archive_path)
+                else:
+                    size, manifest = self._write_archive(progress, backup_archive_path)
+                manifest.binlog_position = self._binlog_position
+                manifest.save(Manifest.path_for(backup_archive_path))
+                if self._streamed:
+                    # complete and with a manifest, it's listed as a backup from now on
+                    os.replace(self._partial_path(backup_archive_path), backup_archive_path)
             except BaseException as e:
-                if os.path.exists(backup_archive_path):
-                    os.remove(backup_archive_path)
-                if len(os.listdir(backup_archive_dir_path)) == 0:
-                    os.rmdir(backup_archive_path.parent)
+                self._remove_archive(backup_archive_path)
 
                 if e is KeyboardInterrupt:
                     raise
@@ -126,18 +342,341 @@ class CreateCommand:
             finally:
                 progress.stop()
 
-            echo('Archive created', author='tar')
+            self._echo('Archive created', author='tar')
+
+        self._backup = Backup(source='local', path=backup_archive_path, size=size)
+
+    @staticmethod
+    def _remove_archive(backup_archive_path: Path) -> None:
+        """ Remove a partly written archive (its parts or shards, the manifest) and the month dir if it's empty """
+
+        backup_archive_dir_path = backup_archive_path.parent
+        if not backup_archive_dir_path.exists():
+            return
+        part_paths = [
+            *backup_archive_dir_path.glob(f"{backup_archive_path.stem}.tar.part*"),
+            *backup_archive_dir_path.glob(f"{backup_archive_path.stem}.tar.shard*")
+        ]
+        for path in (
+            backup_archive_path,
+            CreateCommand._partial_path(backup_archive_path),
+            Manifest.path_for(backup_archive_path),
+            *part_paths
+        ):
+            if os.path.exists(path):
+                os.remove(path)
+        if len(os.listdir(backup_archive_dir_path)) == 0:
+            os.rmdir(backup_archive_dir_path)
+
+    @staticmethod
+    def _member_header(name: str, size: int) -> bytes:
+        """ The tar header of a file, of the same length whatever the size (GNU format: no extended header) """
+
+        file_info = tarfile.TarInfo(name)
+        file_info.size = size
+
+        return file_info.tobuf(format=tarfile.GNU_FORMAT)
+
+    @staticmethod
+    def _open_streamed_archive(backup_archive_path: Path, backup_file_name: str) -> IO[bytes]:
+        """ The partial archive xtrabackup streams the backup into, positioned after the space for the header """
+
+        partial_path = CreateCommand._partial_path(backup_archive_path)
+        partial_path.parent.mkdir(parents=True, exist_ok=True)
+        archive_file = open(partial_path, 'wb')
+        header_size = len(CreateCommand._member_header(backup_file_name, 0))
+        # the space is there even if nothing is streamed, the header never overlaps the log file
+        archive_file.truncate(header_size)
+        archive_file.seek(header_size)
+
+        return archive_file
+
+    def _finish_streamed_archive(self, backup_archive_path: Path) -> tuple:
+        """
+        (archive size, manifest) of the archive xtrabackup streamed the backup into: the backup file header goes
+        in front of it, the log file after it. The checksum takes another read, the header is written last.
+        """
+
+        header_size = len(self._member_header(self._temp_backup_file_path.name, 0))
+        partial_path = self._partial_path(backup_archive_path)
+        with open(partial_path, 'r+b') as archive_file:
+            archive_file.seek(0, os.SEEK_END)
+            self._stream_size = archive_file.tell() - header_size
+            archive_file.write(b'\0' * (-self._stream_size % tarfile.BLOCKSIZE))
+            # appended from the current position, closed with the end of archive blocks
+            with tarfile.open(fileobj=archive_file, mode='w', format=tarfile.GNU_FORMAT) as tar:
+                tar.add(self._temp_log_path, arcname=self._temp_log_path.name)
+            archive_file.seek(0)
+            archive_file.write(self._member_header(self._temp_backup_file_path.name, self._stream_size))
+
+        with IoPriority.uncached(open(partial_path, 'rb')) as archive_file:
+            archive_reader = HashingReader(archive_file, self._config.checksum_algorithm)
+            archive_reader.read_to_end()
+
+        manifest = Manifest(
+            filename=backup_archive_path.name,
+            size=archive_reader.size,
+            algorithm=archive_reader.algorithm,
+            digest=archive_reader.hexdigest(),
+            created_at=now('%Y-%m-%d %H:%M:%S')
+        )
+
+        return archive_reader.size, manifest
+
+    def _write_archive(self, progress: Progress, backup_archive_path: Path) -> tuple:
+        """ (archive size, manifest) of the archive with the backup and log files """
+
+        with IoPriority.uncached(progress.open(self._temp_backup_file_path, 'rb')) as backup:
+            if self._throttle is not None:
+                backup = RateLimitedReader(backup, self._throttle.disk)
+            # the checksum is computed from the bytes on their way to the disk, no second read
+            with self._open_archive(backup_archive_path) as archive_file:
+                archive_writer = HashingWriter(archive_file, self._config.checksum_algorithm)
+                with tarfile.open(fileobj=archive_writer, mode='w') as tar:
+                    # add backup file
+                    file_info = tarfile.TarInfo(self._temp_backup_file_path.name)
+                    file_info.size = self._temp_backup_file_path.stat().st_size
+                    tar.addfile(file_info, fileobj=backup)
+                    # add log file
+                    tar.add(self._temp_log_path, arcname=self._temp_log_path.name)
+
+        manifest = Manifest(
+            filename=backup_archive_path.name,
+            size=archive_writer.size,
+            algorithm=archive_writer.algorithm,
+            digest=archive_writer.hexdigest(),
+            created_at=now('%Y-%m-%d %H:%M:%S')
+        )
+
+        return archive_writer.size, manifest
+
+    def _write_shard_archives(self, progress: Progress, index_path: Path) -> tuple:
+        """
+        (size of all the shard archives, manifest of the index) of a sharded backup: an archive per shard, written
+        concurrently, the log file goes to the first one. The manifest covers the index, the index has the checksums
+        of the shard archives.
+        """
+
+        # a shard nothing went to (a few small schemas) is left out, the first one has the backup metadata
+        shards = [
+            (number, path) for number, path in enumerate(self._temp_shard_paths, start=1)
+            if number == 1 or path.stat().st_size > 0
+        ]
+        archiving = progress.add_task('', total=sum(path.stat().st_size for _, path in shards))
+
+        def write_shard_archive(number: int, shard_path: Path) -> list:
+            archive_path = index_path.with_name(f"{index_path.stem}.tar.shard{number:02d}")
+            with IoPriority.uncached(open(shard_path, 'rb')) as shard_file, \
+                    progress.wrap_file(shard_file, total=shard_path.stat().st_size, task_id=archiving) as shard:
+                if self._throttle is not None:
+                    shard = RateLimitedReader(shard, self._throttle.disk)
+                with IoPriority.uncached(open(archive_path, 'wb')) as archive_file:
+                    archive_writer = HashingWriter(archive_file, self._config.checksum_algorithm)
+                    with tarfile.open(fileobj=archive_writer, mode='w') as tar:
+                        file_info = tarfile.TarInfo(shard_path.name)
+                        file_info.size = shard_path.stat().st_size
+                        tar.addfile(file_info, fileobj=shard)
+                        if number == 1:
+                            tar.add(self._temp_log_path, arcname=self._temp_log_path.name)
+
+            return [archive_path.name, archive_writer.size, archive_writer.hexdigest()]
+
+        with ThreadPoolExecutor(max_workers=len(shards), thread_name_prefix='shard_archive') as executor:
+            # waits for all the shards, raises the first error
+            parts = list(executor.map(write_shard_archive, *zip(*shards)))
+
+        created_at = now('%Y-%m-%d %H:%M:%S')
+        index = ShardIndex(
+            filename=index_path.with_suffix('.tar').name,
+            size=sum(size for _, size, _ in parts),
+            algorithm=self._config.checksum_algorithm,
+            created_at=created_at,
+            parts=parts
+        )
+        index.save(index_path)
+        manifest = Manifest(
+            filename=index_path.name,
+            size=index_path.stat().st_size,
+            algorithm=self._config.checksum_algorithm,
+            digest=hashlib.new(self._config.checksum_algorithm, index_path.read_bytes()).hexdigest(),
+            created_at=created_at
+        )
+
+        self._echo(f"Archive written as {len(parts)} shards", author='tar')
+
+        return index.size, manifest
+
+    @contextmanager
+    def _open_archive(self, path: Path) -> Iterator[IO[bytes]]:
+        if self._config.split is not None:
+            yield from self._open_split_archive(path)
+            return
+
+        if self._config.dedup is None:
+            with IoPriority.uncached(open(path, 'wb')) as archive_file:
+                yield archive_file
+            return
+
+        writer = ChunkingWriter(ChunkStore(CHUNKS_DIR_PATH), self._config.dedup.average_chunk_size * 1024)
+        yield writer
+        writer.close()
+        ChunkIndex(filename=path.with_suffix('.tar').name, size=writer.size, chunks=writer.chunks).save(path)
+
+        message = (f"Deduplicated: {writer.new_chunks_count} new chunks ({naturalsize(writer.new_chunks_size)}) "
+                   f"of {len(writer.chunks)} ({naturalsize(writer.size)})")
+        self._echo(message, author='Dedup')
+        logger.info(f"[{self._config.project_name}] {message}")
 
-        self._backup = Backup(source='local', path=backup_archive_path, size=backup_archive_path.stat().st_size)
+    def _open_split_archive(self, path: Path) -> Iterator[IO[bytes]]:
+        writer = PartWriter(
+            path.parent,
+            path.with_suffix('.tar').name,
+            self._config.split.part_size_bytes,
+            self._config.checksum_algorithm
+        )
+        try:
+            yield writer
+        finally:
+            writer.close()
+        PartIndex(
+            filename=path.with_suffix('.tar').name,
+            size=writer.size,
+            part_size=self._config.split.part_size_bytes,
+            algorithm=self._config.checksum_algorithm,
+            created_at=now('%Y-%m-%d %H:%M:%S'),
+            parts=writer.parts
+        ).save(path)
+
+        message = f"Archive written as {len(writer.parts)} parts of up to {self._config.split.part_size} MB"
+        self._echo(message, author='tar')
 
     def _upload_to_sftp_storage(self) -> None:
-        """ Upload tarball to SFTP backups storage """
+        """ Upload tarball to every SFTP destination, the local files are read once for all of them """
+
+        destinations = self._config.sftp_destinations
+        self._echo(
+            f"Uploading to SFTP backups storage: {', '.join(destination.label for destination in destinations)}",
+            author='SFTP'
+        )
 
-        with Sftp(self._config.sftp) as sftp:
-            echo('Connected to SFTP backups storage.', author='SFTP')
+        # <year>/<month> of the local archive, the month the backup was started in
+        relative_path = PurePath(Path(self._backup.path).relative_to(BACKUPS_DIR_PATH))
+        data_files = []
+        if self._backup.is_deduplicated:
+            data_files = self._missing_chunk_files()
+        if self._backup.has_parts:
+            data_files = [
+                UploadFile(part_path, relative_path.with_name(part_path.name)) for part_path in self._part_paths()
+            ]
 
+        workers = 1
+        if self._backup.is_split:
+            workers = self._config.split.workers
+        if self._backup.is_sharded:
+            workers = len(data_files)
+        upload = FanOutUpload(
+            destinations,
+            rate_limiter=self._upload_rate_limiter,
+            interactive=self._interactive,
+            workers=workers
+        )
+        # an index goes after the chunks, parts or shards it refers to, the manifest goes last:
+        # its presence on the storage means the backup is complete
+        upload.upload(
+            data_files,
+            [UploadFile(Path(self._backup.path), relative_path)],
+            [UploadFile(Path(self._backup.manifest_path), Manifest.path_for(relative_path))]
+        )
+
+    def _part_paths(self) -> list:
+        backup_path = Path(self._backup.path)
+        return BACKUP_INDEXES[backup_path.suffix].load(backup_path).part_paths(backup_path.parent)
+
+    def _missing_chunk_files(self) -> list:
+        """ The chunks of a deduplicated backup the destinations don't have yet (the index goes after them) """
+
+        index = ChunkIndex.load(Path(self._backup.path))
+        chunk_sizes = dict(index.chunks)
+        # chunk id => destinations missing it
+        missing = {}
+        for destination in self._config.sftp_destinations:
             try:
-                remote_path = PurePath(self._config.sftp.path, now('%Y'), now('%m'), self._backup.filename)
-                sftp.upload(Path(self._backup.path), remote_path)
-            except IOError as e:
-                raise RuntimeError(f"Failed to upload the backup to SFTP backups storage: {e}")
+                with Sftp.session(destination) as sftp:
+                    remote_store = RemoteChunkStore(sftp, PurePath(destination.path, CHUNKS_DIR_NAME))
+                    missing_ids = remote_store.missing(index.chunk_ids)
+            except SftpError:
+                # the upload reports the failed connection
+                missing_ids = list(dict.fromkeys(index.chunk_ids))
+            for chunk_id in missing_ids:
+                missing.setdefault(chunk_id, []).append(destination)
+
+            self._echo(
+                f"{destination.label}: {len(missing_ids)} new chunks "
+                f"({naturalsize(sum(chunk_sizes[chunk_id] for chunk_id in missing_ids))}) of {len(index.chunks)}",
+                author='SFTP'
+            )
+
+        store = ChunkStore(CHUNKS_DIR_PATH)
+        return [
+            UploadFile(
+                store.path_for(chunk_id),
+                PurePath(CHUNKS_DIR_NAME, store.path_for(chunk_id).relative_to(CHUNKS_DIR_PATH)),
+                destinations=chunk_destinations
+            )
+            for chunk_id, chunk_destinations in missing.items()
+        ]
+
+    def _copy_to_local_storages(self) -> None:
+        """ Copy the backup to the mounted storages, the data is copied by the kernel (or shared with a reflink) """
+
+        rate_limiter = self._throttle.disk if self._throttle is not None else None
+        relative_path = Path(self._backup.path).relative_to(BACKUPS_DIR_PATH)
+        for config in self._config.local_storages:
+            try:
+                with LocalStorage(config) as storage:
+                    if self._backup.is_deduplicated:
+                        self._copy_missing_chunks(storage, config)
+                    for part_path in self._part_paths() if self._backup.has_parts else []:
+                        storage.upload(
+                            part_path,
+                            Path(config.path, relative_path).with_name(part_path.name),
+                            display_progress=self._interactive,
+                            rate_limiter=rate_limiter
+                        )
+                    storage.upload(
+                        Path(self._backup.path),
+                        Path(config.path, relative_path),
+                        display_progress=self._interactive,
+                        rate_limiter=rate_limiter
+                    )
+                    # the manifest goes last: its presence on the storage means the archive is complete
+                    storage.upload(
+                        Path(self._backup.manifest_path),
+                        Manifest.path_for(Path(config.path, relative_path)),
+                        display_progress=False
+                    )
+            except RuntimeError as e:
+                message = f"Failed to copy the backup to local storage {config.label}: {e}"
+                if config.required:
+                    raise RuntimeError(message)
+                echo_warning(message, author='Storage')
+                logger.warning(f"[{self._config.project_name}] {message}")
+                continue
+
+            self._echo(f"Backup copied to local storage {config.label}", style='green3', author='Storage')
+
+    def _copy_missing_chunks(self, storage: LocalStorage, config: LocalStorageConfig) -> None:
+        """ Copy the chunks of a deduplicated backup the storage doesn't have yet (the index goes after them) """
+
+        index = ChunkIndex.load(Path(self._backup.path))
+        store = ChunkStore(CHUNKS_DIR_PATH)
+        storage_store = ChunkStore(Path(config.path, CHUNKS_DIR_NAME))
+        missing_ids = [chunk_id for chunk_id in dict.fromkeys(index.chunk_ids) if not storage_store.has(chunk_id)]
+        self._echo(f"{config.label}: {len(missing_ids)} new chunks of {len(index.chunks)}", author='Storage')
+
+        for chunk_id in missing_ids:
+            storage.upload(store.path_for(chunk_id), storage_store.path_for(chunk_id), display_progress=False)
+
+    def _echo(self, text: Any, **kwargs) -> None:
+        if self._interactive:
+            echo(text, **kwargs)
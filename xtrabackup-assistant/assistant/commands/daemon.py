@@ -0,0 +1,174 @@
+import json
+import os
+import signal
+from datetime import datetime
+from time import sleep
+from typing import Callable
+
+from rich.table import Table
+from rich.text import Text
+
+from configs import Config
+from constants import DAEMON_LOCK_PATH, DAEMON_STATUS_PATH
+from utils import ProcessLock, Sftp, echo, echo_error, echo_warning, logger
+from .command import Command
+
+
+class DaemonCommand:
+    POLL_INTERVAL = 1
+
+    def __init__(self, config: Config):
+        if config.schedule is None:
+            raise RuntimeError("Required option 'schedule' is missing in the config")
+        self._config = config
+
+        self._started_at = datetime.now()
+        self._stopping = False
+        self._jobs = {
+            name: {
+                'cron': cron,
+                'next_run': cron.next_after(self._started_at),
+                'running': False,
+                'last_run': None,
+                'last_duration': None,
+                'last_status': None,
+                'last_error': None,
+            }
+            for name, cron in config.schedule.jobs.items()
+        }
+
+    def execute(self, run_job: Callable[[Command], None]) -> None:
+        with ProcessLock(DAEMON_LOCK_PATH, 'daemon'):
+            signal.signal(signal.SIGTERM, self._stop)
+            signal.signal(signal.SIGHUP, self._stop)
+
+            if self._config.sftp is not None:
+                Sftp.keep_sessions_warm()
+
+            echo(f"Daemon started (pid {os.getpid()}), jobs: {', '.join(self._jobs.keys())}", author='Daemon')
+            logger.info(f"Daemon started (pid {os.getpid()})")
+
+            try:
+                while not self._stopping:
+                    self._write_status()
+
+                    due_jobs = sorted(
+                        (name for name, job in self._jobs.items() if job['next_run'] <= datetime.now()),
+                        key=lambda name: self._jobs[name]['next_run']
+                    )
+                    for name in due_jobs:
+                        if self._stopping:
+                            break
+                        self._run_job(name, run_job)
+
+                    sleep(self.POLL_INTERVAL)
+            finally:
+                Sftp.close_sessions()
+                self._write_status(stopped=True)
+
+                echo('Daemon stopped', author='Daemon')
+                logger.info('Daemon stopped')
+
+    def _run_job(self, name: str, run_job: Callable[[Command], None]) -> None:
+        job = self._jobs[name]
+        job['running'] = True
+        job['last_run'] = datetime.now()
+        self._write_status()
+
+        echo(f"Start scheduled job '{name}'", author='Daemon')
+        try:
+            run_job(Command(name))
+            job['last_status'] = 'success'
+            job['last_error'] = None
+        except RuntimeError as e:
+            job['last_status'] = 'failed'
+            job['last_error'] = str(e)
+
+            echo_error(e)
+            logger.error(f"Scheduled job '{name}' failed: {e}")
+        except Exception as e:
+            # an unexpected error (a bug, an unhandled OS or SSH error) fails the job only, the schedule goes on
+            job['last_status'] = 'failed'
+            job['last_error'] = f"{type(e).__name__}: {e}"
+
+            echo_error(Text(job['last_error']))
+            logger.exception(f"Scheduled job '{name}' failed unexpectedly")
+        finally:
+            job['running'] = False
+            job['last_duration'] = (datetime.now() - job['last_run']).total_seconds()
+            # runs missed while the job was busy are skipped, not queued
+            job['next_run'] = job['cron'].next_after(datetime.now())
+
+        echo(f"Scheduled job '{name}' finished: {job['last_status']}, next run {job['next_run']}", author='Daemon')
+
+    # noinspection PyUnusedLocal
+    def _stop(self, signum, frame) -> None:
+        if not self._stopping:
+            echo_warning('Stop signal received, the daemon stops after the current job.', author='Daemon')
+        self._stopping = True
+
+    def _write_status(self, stopped: bool = False) -> None:
+        status = {
+            'pid': os.getpid(),
+            'state': 'stopped' if stopped else (
+                'running' if any(job['running'] for job in self._jobs.values()) else 'idle'
+            ),
+            'started_at': self._started_at.isoformat(timespec='seconds'),
+            'updated_at': datetime.now().isoformat(timespec='seconds'),
+            'jobs': {
+                name: {
+                    'cron': str(job['cron']),
+                    'running': job['running'],
+                    'next_run': job['next_run'].isoformat(timespec='seconds'),
+                    'last_run': job['last_run'].isoformat(timespec='seconds') if job['last_run'] else None,
+                    'last_duration': job['last_duration'],
+                    'last_status': job['last_status'],
+                    'last_error': job['last_error'],
+                }
+                for name, job in self._jobs.items()
+            }
+        }
+
+        temp_status_path = DAEMON_STATUS_PATH.with_suffix('.tmp')
+        with open(temp_status_path, 'w') as status_file:
+            json.dump(status, status_file, indent=2)
+        os.replace(temp_status_path, DAEMON_STATUS_PATH)
+
+    @staticmethod
+    def print_status() -> None:
+        try:
+            with open(DAEMON_STATUS_PATH, 'r') as status_file:
+                status = json.load(status_file)
+        except FileNotFoundError:
+            echo('The daemon has never been started.', author='Daemon', time=False)
+            return
+
+        # the status file outlives a killed daemon, so check the process as well
+        if status['state'] != 'stopped':
+            try:
+                os.kill(status['pid'], 0)
+            except ProcessLookupError:
+                status['state'] = 'dead'
+
+        echo(
+            f"Daemon pid {status['pid']}: {status['state']} "
+            f"(started {status['started_at']}, updated {status['updated_at']})",
+            author='Daemon',
+            time=False
+        )
+
+        table = Table(title='Scheduled jobs')
+        table.add_column('Job')
+        table.add_column('Schedule', no_wrap=True)
+        table.add_column('Next run', no_wrap=True)
+        table.add_column('Last run', no_wrap=True)
+        table.add_column('Last status')
+        table.add_column('Last error')
+
+        for name, job in status['jobs'].items():
+            last_status = 'running' if job['running'] else (job['last_status'] or '-')
+            table.add_row(
+                name, job['cron'], job['next_run'], job['last_run'] or '-', last_status, job['last_error'] or ''
+            )
+
+        echo(table)
@@ -0,0 +1,206 @@
+import copy
+import dataclasses
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Union
+
+from humanize import naturalsize, naturaldelta
+from rich.live import Live
+from rich.markup import escape
+from rich.table import Table
+from rich.text import Text
+
+from common import Environment, Backup
+from configs import Config
+from constants import TEMP_DIR_PATH
+from utils import TokenBucket, ThreadBudget, Throttle, console, echo, logger
+from .create import CreateCommand
+
+
+@dataclass
+class TargetState:
+    name: str
+    phase: str = 'queued'
+    started_at: Union[datetime, None] = None
+    finished_at: Union[datetime, None] = None
+    backup: Union[Backup, None] = None
+    error: Union[str, None] = None
+
+    @property
+    def duration(self) -> str:
+        if self.started_at is None:
+            return '-'
+        return naturaldelta((self.finished_at or datetime.now()) - self.started_at)
+
+
+class TargetCreateCommand(CreateCommand):
+    """ CreateCommand for one target of the orchestrator: reports its phase and respects the global limits """
+
+    def __init__(
+        self,
+        env: Environment,
+        config: Config,
+        throttle: Throttle,
+        state: TargetState,
+        backup_slots: threading.BoundedSemaphore,
+        thread_budget: Union[ThreadBudget, None],
+        upload_rate_limiter: Union[TokenBucket, None]
+    ):
+        super().__init__(env, config, throttle, interactive=False, upload_rate_limiter=upload_rate_limiter)
+
+        self._state = state
+        self._backup_slots = backup_slots
+        self._thread_budget = thread_budget
+
+    def _create_backup(self) -> None:
+        self._state.phase = 'waiting'
+
+        parallel = self._config.xtrabackup.parallel
+        with self._backup_slots, self._thread_budget.reserve(parallel) if self._thread_budget else nullcontext():
+            self._state.phase = 'backup'
+            super()._create_backup()
+
+    def _create_archive(self) -> None:
+        self._state.phase = 'archive'
+        super()._create_archive()
+
+    def _upload_to_sftp_storage(self) -> None:
+        self._state.phase = 'upload'
+        super()._upload_to_sftp_storage()
+
+
+class OrchestrateCommand:
+    REFRESH_INTERVAL = 0.5
+
+    def __init__(self, env: Environment, config: Config, target_names: list, throttle: Throttle):
+        if len(config.targets) == 0:
+            raise RuntimeError("Required option 'targets' is missing in the config")
+        self._env = env
+        self._config = config
+        self._throttle = throttle
+
+        targets = config.targets if len(target_names) == 0 else [config.target(name) for name in target_names]
+
+        orchestration = config.orchestration
+        self._backup_slots = threading.BoundedSemaphore(orchestration.max_concurrent_backups)
+        self._thread_budget = None
+        if orchestration.max_parallel_threads is not None:
+            self._thread_budget = ThreadBudget(orchestration.max_parallel_threads)
+            # a target asking for more threads than the whole budget would wait forever
+            targets = [
+                self._with_parallel(target, min(target.xtrabackup.parallel, orchestration.max_parallel_threads))
+                for target in targets
+            ]
+        # the orchestration cap is applied on top of the runtime network throttle
+        self._upload_rate_limiter = throttle.network
+        if orchestration.max_upload_speed is not None:
+            self._upload_rate_limiter = TokenBucket(orchestration.max_upload_speed * 1024 ** 2, parent=throttle.network)
+
+        self._targets = targets
+        self._states = {target.project_name: TargetState(target.project_name) for target in targets}
+
+    def execute(self, upload: bool = True) -> None:
+        echo(f"Start backups of {len(self._targets)} targets", author='Orchestrator')
+
+        executor = ThreadPoolExecutor(max_workers=len(self._targets), thread_name_prefix='target')
+        try:
+            futures = [executor.submit(self._run_target, target, upload) for target in self._targets]
+
+            with Live(self._render_progress(), console=console, transient=True) as live:
+                while len(wait(futures, timeout=self.REFRESH_INTERVAL).not_done) > 0:
+                    live.update(self._render_progress())
+        except KeyboardInterrupt:
+            # the queued targets are not started, the running ones are stopped by the interrupt of their subprocesses
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        executor.shutdown()
+
+        self._print_summary()
+
+        failed = [state.name for state in self._states.values() if state.phase == 'failed']
+        if len(failed) > 0:
+            raise RuntimeError(f"Failed to create backups of {len(failed)} of {len(self._targets)} targets: "
+                               f"[default]{', '.join(failed)}")
+
+    def _run_target(self, config: Config, upload: bool) -> None:
+        state = self._states[config.project_name]
+        state.started_at = datetime.now()
+
+        command = TargetCreateCommand(
+            self._env, config, self._throttle, state, self._backup_slots, self._thread_budget, self._upload_rate_limiter
+        )
+        try:
+            command.execute(upload)
+            state.phase = 'done'
+            state.backup = command.backup
+        except Exception as e:
+            state.phase = 'failed'
+            if isinstance(e, RuntimeError):
+                state.error = str(e)
+                logger.error(f"[{config.project_name}] {e}")
+            else:
+                # an unexpected error (a bug, an unhandled OS or SSH error) fails the target only
+                state.error = escape(f"{type(e).__name__}: {e}")
+                logger.exception(f"[{config.project_name}] Backup failed unexpectedly")
+            if config.slack is not None:
+                from utils import Slack
+                Slack(config.slack).notify(project=config.project_name, error=e)
+        finally:
+            state.finished_at = datetime.now()
+
+    def _render_progress(self) -> Table:
+        table = Table(title='Backups in progress', title_justify='left')
+        table.add_column('Target')
+        table.add_column('Phase')
+        table.add_column('Written', justify='right')
+        table.add_column('Elapsed', justify='right')
+
+        for state in self._states.values():
+            written = '-'
+            if state.phase == 'backup':
+                target_temp_dir = Path(TEMP_DIR_PATH, state.name)
+                written = naturalsize(sum(path.stat().st_size for path in target_temp_dir.glob('*.xbstream')))
+
+            table.add_row(state.name, self._styled_phase(state.phase), written, state.duration)
+
+        return table
+
+    def _print_summary(self) -> None:
+        table = Table(title='Backups summary')
+        table.add_column('Target')
+        table.add_column('Status')
+        table.add_column('Backup', no_wrap=True)
+        table.add_column('Size')
+        table.add_column('Duration', no_wrap=True)
+        table.add_column('Error')
+
+        for state in self._states.values():
+            table.add_row(
+                state.name,
+                self._styled_phase(state.phase),
+                state.backup.filename if state.backup else '-',
+                state.backup.size if state.backup else '-',
+                state.duration,
+                Text.from_markup(state.error) if state.error else ''
+            )
+
+        echo(table)
+
+    @staticmethod
+    def _styled_phase(phase: str) -> Text:
+        styles = {'done': 'green3', 'failed': 'bright_red', 'queued': 'default', 'waiting': 'dark_orange'}
+        return Text(phase, styles.get(phase, 'blue'))
+
+    @staticmethod
+    def _with_parallel(config: Config, parallel: int) -> Config:
+        if config.xtrabackup.parallel == parallel:
+            return config
+
+        # a copy, the target config is shared with the other commands of a long-lived process
+        target_config = copy.copy(config)
+        target_config.xtrabackup = dataclasses.replace(config.xtrabackup, parallel=parallel)
+        return target_config
@@ -1,87 +1,588 @@
+import hashlib
 import re
 import shutil
 import subprocess
 import tarfile
+import gzip
 import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, closing
+from datetime import datetime
 from pathlib import Path, PurePath
-from time import sleep
-from typing import Union
+from time import sleep, monotonic
+from typing import Union, IO, Iterator, Callable, Any
 
+from paramiko.ssh_exception import SSHException
+from rich.markup import escape
 from rich.panel import Panel
 from rich.progress import Progress, TextColumn, SpinnerColumn, BarColumn, TaskProgressColumn, DownloadColumn, \
-    MofNCompleteColumn
+    MofNCompleteColumn, TransferSpeedColumn
 from rich.prompt import IntPrompt
 from rich.text import Text
 
-from common import Environment, BackupList, Backup
-from configs import Config
-from constants import BACKUPS_DIR_PATH, TEMP_DIR_PATH, RESTORE_DIR_PATH
-from exceptions import SftpError
-from utils import now, Sftp, echo, clear_dir, echo_warning, logger
+from common import Environment, BackupList, Backup, Manifest, ChunkIndex, ChunkStore, RemoteChunkStore, PartIndex, \
+    PartReader, ShardIndex, BinlogIndex, RestoreState, DatadirMover, RunHistory, CapacityPlan, BACKUP_FILE_PATTERN, \
+    BACKUP_INDEXES, CHUNKS_DIR_NAME, BINLOGS_DIR_NAME, find_local_backups
+from configs import Config, SftpConfig, LocalStorageConfig
+from constants import BACKUPS_DIR_PATH, TEMP_DIR_PATH, RESTORE_DIR_PATH, CHUNKS_DIR_PATH, REPLAY_DIR_PATH, \
+    RESTORE_WORK_DIR_PATH, RESTORE_STATE_PATH, RESTORE_STAGES, RUN_HISTORY_PATH
+from exceptions import StorageError
+from utils import Storage, LocalStorage, storage_session, echo, clear_dir, echo_warning, logger, Throttle, \
+    IoPriority, TokenBucket, RateLimitedReader, HashingReader
+
+
+# the dirs of the backups: <path>/<year>/<month>/<backup>
+YEAR_PATTERN = re.compile(r'^\d{4}$')
 
 
 class RestoreCommand:
-    def __init__(self, env: Environment, config: Config):
+    # bytes read from every copy of a backup stored on several destinations to pick the fastest one
+    PROBE_SIZE = 1024 * 1024
+    # parts of a split backup downloaded concurrently (unless set by the 'split' config) and retries of each
+    PART_WORKERS = 4
+    PART_RETRIES = 2
+    # seconds every storage has to list its backups
+    DISCOVERY_TIMEOUT = 60
+    # the archive to the data size, the data is planned for as twice as large until a backup shows the ratio
+    DEFAULT_COMPRESSION_RATIO = 0.5
+
+    def __init__(self, env: Environment, config: Config, throttle: Union[Throttle, None] = None):
         self._env = env
         self._config = config
+        self._throttle = throttle
 
         self.backup_list = BackupList(xtrabackup_version=self._env.xtrabackup_version)
         self.target_backup: Union[Backup, None] = None
+        # set when the archive checksum was already verified on the way (while downloading)
+        self._verified = False
+        # filename => the copies of a backup on the SFTP destinations and local storages
+        self._remote_copies: dict = {}
+        self._manifest: Union[Manifest, None] = None
+        self._state: Union[RestoreState, None] = None
+        self._stages: tuple = RESTORE_STAGES
+        # the low-disk pipeline: the xbstream file is piped from the archive into xbstream, it's never written
+        self._streams_xbstream = False
+        # stage => seconds, recorded in the run history
+        self._durations: dict = {}
+        # the years with backups not listed yet, newest first
+        self._years: list = []
+        # the storages which failed or didn't answer in time, they're left out of the next listings
+        self._unavailable_sources: list = []
 
-    def execute(self) -> None:
-        # get available backups
-        self._set_backup_list()
+    def execute(
+        self,
+        at: Union[str, None] = None,
+        from_stage: Union[str, None] = None,
+        clean: bool = False,
+        apply: bool = False,
+        latest: bool = False,
+        filename: Union[str, None] = None,
+        pitr: bool = False
+    ) -> None:
+        """
+        Restore a backup chosen from the list, the newest one taken at or before the time given, the latest one
+        or the one with the filename given (the last ones don't prompt, for automation). With `pitr` the binary logs
+        from the backup up to the time are decoded for a replay (point-in-time recovery).
+        The completed stages are recorded, running it again on the same backup resumes it from the failed stage.
+        """
 
-        if len(self.backup_list) == 0:
-            echo(text='Not found available backups.', style='orange1', time=False)
-            return None
+        target_time = self._parse_target_time(at) if at is not None else None
+        if pitr and target_time is None:
+            raise RuntimeError('Point-in-time recovery (--pitr) needs the time to recover to (--at)')
+        if apply and self._config.xtrabackup.datadir is None:
+            raise RuntimeError("Option 'xtrabackup.datadir' is needed to apply the backup to the MySQL datadir")
+        # the prepared backup is left in the restore dir unless it's applied
+        self._stages = RESTORE_STAGES if apply else RESTORE_STAGES[:-1]
+        if from_stage is not None and from_stage not in self._stages:
+            raise RuntimeError(f"Stage '{from_stage}' is run with --apply only")
 
-        # ask choice a backup
-        self.backup_list.print(
-            title=f'Available backups (supported by Percona XtraBackup {self._env.xtrabackup_version})'
-        )
+        if clean:
+            self._clean()
 
-        target_backup_no = IntPrompt.ask(
-            prompt=Text('Please enter no of the target backup', 'blue'),
-            choices=self.backup_list.available_numbers,
-            show_choices=False
-        )
-        self.target_backup = self.backup_list[target_backup_no - 1]
+        # the years with backups on any storage, listed a year at a time (newest first) as far as it's needed
+        self._years = self._backup_years()
+
+        if target_time is not None:
+            self.target_backup = self._backup_before(target_time, pitr)
+        elif latest:
+            self.target_backup = self._latest_backup()
+        elif filename is not None:
+            self.target_backup = self._backup_by_filename(filename)
+        else:
+            self.target_backup = self._chosen_backup()
+
+        if self.target_backup is None:
+            echo(text='Not found available backups.', style='orange1', time=False)
+            return None
 
         echo(
             Text.assemble(('Target backup: ', 'green3'), (self.target_backup.filename, 'italic')),
             time=False
         )
 
-        if self.target_backup.source == 'sftp':
-            echo('Start downloading the backup', 'Assistant')
-            self.target_backup = self._download_backup(self.target_backup)
-            echo('The backup downloaded', 'Assistant')
+        self._manifest = self._target_manifest()
+        self._state = self._load_state()
+        start_stage = self._start_stage(from_stage)
+        if start_stage is None:
+            echo('All the stages are completed already, the backup is ready', 'Restore')
+        elif len(self._state.stages) > 0:
+            echo(f"Resuming the restore from stage '{start_stage}' (the previous ones are completed)", 'Restore')
+
+        # the binary logs to replay are checked before hours of extracting and preparing, not after
+        binlogs = self._resolve_binlogs(target_time) if pitr else None
+
+        self._streams_xbstream = self._plan_capacity(start_stage)
 
+        stage = start_stage
         try:
-            self._extract_xbstream_file_from_archive()
-            self._extract_qp_files_from_xbstream_file()
-            self._decompress_qp_files()
-            self._prepare_mysql_files()
-
-            echo(Panel.fit(
-                Text.assemble(
-                    ('The backup is ready to be imported!\n', 'green3 bold'),
-                    'The next time the container is started backup files will be moved to MySQL data dir.\n',
-                    'Please restart the container and follow the startup logs. \n\n',
-                    ("If you care about the current data, make a backup before the next start, "
-                     "otherwise it will be lost.", 'italic'),
-                    justify='center'
-                ),
-                title='SUCCESS',
-                border_style='green3'
-            ))
+            if self.target_backup.source != 'local' and self._reads_archive(start_stage):
+                stage = 'download'
+                started_at = monotonic()
+                self._download_stage(start_stage)
+                self._durations[stage] = round(monotonic() - started_at, 1)
+
+            for stage, run in (
+                ('extract_xbstream', self._extract_xbstream_file_from_archive),
+                ('extract_qp', self._extract_qp_files_from_xbstream_file),
+                ('decompress', self._decompress_qp_files),
+                ('prepare', self._prepare_mysql_files),
+                ('apply', self._apply_to_datadir)
+            ):
+                if self._runs(stage, start_stage):
+                    started_at = monotonic()
+                    run()
+                    self._complete(stage)
+                    self._durations[stage] = round(monotonic() - started_at, 1)
         except (RuntimeError, KeyboardInterrupt):
-            clear_dir(RESTORE_DIR_PATH)
+            if stage == 'decompress':
+                # the qpress files decompressed so far are removed, it's extracted from the xbstream file again
+                self._state.reset_from('extract_qp')
+                self._state.save(RESTORE_STATE_PATH)
+            echo_warning(
+                f"The restore failed at stage '{stage}', the completed stages are kept: run it again on the same "
+                f"backup to resume it (--clean to start over)",
+                author='Restore'
+            )
 
             raise
 
-    def _set_backup_list(self):
+        if start_stage is not None:
+            prepared = self._state.completed('prepare')
+            streamed = self._state.completed('extract_xbstream')['output'].get('streamed', False)
+            RunHistory.record(
+                RUN_HISTORY_PATH,
+                self._config.project_name,
+                'restore',
+                pipeline='streamed' if streamed else 'standard',
+                archive_size=self.target_backup.size_bytes,
+                data_size=prepared['output']['size'] if prepared is not None else None,
+                durations=self._durations
+            )
+
+        replay_text = ''
+        if pitr:
+            replay_path = self._prepare_binlog_replay(target_time, *binlogs)
+            replay_text = f"Once it's started, replay the binary logs up to {at}:\nmysql < {replay_path}\n\n"
+
+        if self._state.completed('apply') is not None:
+            success_text = Text.assemble(
+                ('The backup is applied!\n', 'green3 bold'),
+                f"Backup files are moved to MySQL data dir {self._state.completed('apply')['output']['datadir']}.\n",
+                'Please start MySQL and follow its logs.',
+                f"\n\n{replay_text.rstrip()}" if replay_text != '' else '',
+                justify='center'
+            )
+        else:
+            success_text = Text.assemble(
+                ('The backup is ready to be imported!\n', 'green3 bold'),
+                'The next time the container is started backup files will be moved to MySQL data dir.\n',
+                'Please restart the container and follow the startup logs. \n\n',
+                replay_text,
+                ("If you care about the current data, make a backup before the next start, "
+                 "otherwise it will be lost.", 'italic'),
+                justify='center'
+            )
+
+        echo(Panel.fit(
+            success_text,
+            title='SUCCESS',
+            border_style='green3'
+        ))
+
+    @staticmethod
+    def _clean() -> None:
+        """ Drop the restore state, the intermediate files and the restore dir: the next restore starts over """
+
+        clear_dir(RESTORE_WORK_DIR_PATH)
+        clear_dir(RESTORE_DIR_PATH)
+        echo('Restore state and files removed, the restore starts over', 'Restore')
+
+    def _load_state(self) -> RestoreState:
+        """ The state of the previous restore if it was of the same backup, a new one otherwise """
+
+        digest = self._manifest.digest if self._manifest is not None else None
+        state = RestoreState.load(RESTORE_STATE_PATH)
+        if state is not None and state.is_for(self.target_backup.filename, self.target_backup.size_bytes, digest):
+            return state
+
+        if state is not None:
+            echo_warning(f"Files of the restore of {state.backup} are removed, another backup is restored", 'Restore')
+        clear_dir(RESTORE_WORK_DIR_PATH)
+        clear_dir(RESTORE_DIR_PATH)
+
+        state = RestoreState(backup=self.target_backup.filename, size=self.target_backup.size_bytes, digest=digest)
+        state.save(RESTORE_STATE_PATH)
+
+        return state
+
+    def _start_stage(self, from_stage: Union[str, None]) -> Union[str, None]:
+        """ The first stage to run: the first one not completed, an earlier one if its input is gone """
+
+        if from_stage is not None:
+            missing_input = self._missing_input(from_stage)
+            if missing_input is not None:
+                raise RuntimeError(f"Stage '{from_stage}' can't be run, {missing_input}: [default]start earlier")
+            self._state.reset_from(from_stage)
+            self._state.save(RESTORE_STATE_PATH)
+            return from_stage
+
+        # a local backup isn't downloaded
+        stages = self._stages if self.target_backup.source != 'local' else self._stages[1:]
+        stage = next((stage for stage in stages if self._state.completed(stage) is None), None)
+        if stage is None:
+            # completed, unless the restore dir was imported (moved to MySQL) in the meantime
+            if self._state.completed('apply') is not None or self._missing_input('prepare') is None:
+                return None
+            stage = 'prepare'
+
+        while self._missing_input(stage) is not None:
+            stage = RESTORE_STAGES[RESTORE_STAGES.index(stage) - 1]
+        self._state.reset_from(stage)
+        self._state.save(RESTORE_STATE_PATH)
+
+        return stage
+
+    def _missing_input(self, stage: str) -> Union[str, None]:
+        """ Why the stage can't run on the output of the previous one, None if it can """
+
+        if stage == 'download':
+            return None
+
+        previous_stage = RESTORE_STAGES[RESTORE_STAGES.index(stage) - 1]
+        if stage == 'extract_xbstream' and self.target_backup.source == 'local':
+            return None
+
+        completed = self._state.completed(previous_stage)
+        if completed is None:
+            return f"stage '{previous_stage}' is not completed"
+
+        if stage == 'extract_xbstream' and not completed['output'].get('streamed', False):
+            if not Path(completed['output']['path']).exists():
+                return 'the downloaded backup is removed'
+        elif stage == 'extract_qp':
+            xbstream_file_paths = self._extracted_xbstream_file_paths(completed['output'])
+            if not all(path.exists() for path in xbstream_file_paths) or \
+                    sum(path.stat().st_size for path in xbstream_file_paths) != completed['output']['size']:
+                return 'the xbstream file is removed or changed'
+        elif stage in ('decompress', 'prepare', 'apply'):
+            if not Path(RESTORE_DIR_PATH, 'xtrabackup_checkpoints').exists():
+                return 'the restore dir is empty (imported or removed)'
+
+        return None
+
+    def _plan_capacity(self, start_stage: Union[str, None]) -> bool:
+        """
+        Check the free space for the stages to run before they're started, the sizes and the duration are predicted
+        from the archive size and the previous runs. Returns whether the xbstream file is piped from the archive into
+        xbstream instead of being extracted first (the low-disk pipeline), which is the case when there's no space for
+        the xbstream file but there's space for the rest.
+        """
+
+        if start_stage is None:
+            return False
+
+        history = RunHistory.load(RUN_HISTORY_PATH)
+        project = self._config.project_name
+        archive_size = self.target_backup.size_bytes
+        data_size = archive_size / (history.compression_ratio(project) or self.DEFAULT_COMPRESSION_RATIO)
+        rates = [
+            history.seconds_per_byte(project, 'restore', stage) for stage in self._stages
+            if self._runs(stage, start_stage)
+        ]
+        rates = [rate for rate in rates if rate is not None]
+        seconds = sum(rates) * archive_size if len(rates) > 0 else None
+
+        needs = {BACKUPS_DIR_PATH: 0, RESTORE_WORK_DIR_PATH: 0, RESTORE_DIR_PATH: 0}
+        if self.target_backup.source != 'local' and self._state.completed('download') is None and \
+                not self._is_streamed(self.target_backup):
+            needs[BACKUPS_DIR_PATH] = archive_size
+        if self._runs('extract_xbstream', start_stage):
+            needs[RESTORE_WORK_DIR_PATH] = archive_size
+        if self._runs('extract_qp', start_stage):
+            needs[RESTORE_DIR_PATH] = data_size
+        elif self._runs('decompress', start_stage):
+            # the compressed files are there already, they're removed as they're decompressed
+            needs[RESTORE_DIR_PATH] = data_size - archive_size
+        datadir_path = Path(self._config.xtrabackup.datadir or RESTORE_DIR_PATH)
+        if self._runs('apply', start_stage) and datadir_path.is_dir() and \
+                datadir_path.stat().st_dev != RESTORE_DIR_PATH.stat().st_dev:
+            # moved with a rename on the same filesystem, copied otherwise
+            needs[datadir_path] = data_size
+
+        plan = CapacityPlan(needs, seconds)
+        shortages = plan.shortages()
+        if len(shortages) == 0:
+            echo(f"Predicted: {plan.describe()}", 'Capacity')
+            return False
+
+        if self._runs('extract_xbstream', start_stage) and not self.target_backup.is_sharded:
+            streamed_plan = CapacityPlan({**needs, RESTORE_WORK_DIR_PATH: 0}, seconds)
+            if streamed_plan.fits:
+                echo_warning(
+                    f"Not enough free space for the xbstream file ({CapacityPlan.describe_shortages(shortages)}), "
+                    f"it's piped from the archive into xbstream. Predicted: {streamed_plan.describe()}",
+                    author='Capacity'
+                )
+                return True
+            shortages = streamed_plan.shortages()
+
+        shortages_text = CapacityPlan.describe_shortages(shortages)
+        raise RuntimeError(f"Not enough free space for the restore: [default]{shortages_text}")
+
+    def _reads_archive(self, start_stage: Union[str, None]) -> bool:
+        """ A stage to run reads the archive: the xbstream file is extracted or it's piped into xbstream """
+
+        if self._runs('extract_xbstream', start_stage):
+            return True
+
+        extracted = self._state.completed('extract_xbstream')
+        return self._runs('extract_qp', start_stage) and extracted is not None and \
+            extracted['output'].get('streamed', False)
+
+    def _runs(self, stage: str, start_stage: Union[str, None]) -> bool:
+        return start_stage is not None and stage in self._stages and \
+            RESTORE_STAGES.index(stage) >= RESTORE_STAGES.index(start_stage)
+
+    def _complete(self, stage: str) -> None:
+        """ Record the stage completed with its input (size/checksum) and output """
+
+        backup_input = {'size': self.target_backup.size_bytes, 'digest': self._state.digest}
+        if stage == 'extract_xbstream' and self._streams_xbstream:
+            # piped into xbstream at the next stage, nothing is written
+            details = {'input': backup_input, 'output': {'paths': [], 'size': 0, 'streamed': True}}
+        elif stage == 'extract_xbstream':
+            details = {
+                'input': backup_input,
+                'output': {
+                    'paths': [str(path) for path in self._xbstream_file_paths],
+                    'size': sum(path.stat().st_size for path in self._xbstream_file_paths)
+                }
+            }
+        elif stage == 'extract_qp':
+            # the xbstream file isn't needed once the files are decompressed, a failed decompression needs it
+            details = {'input': self._state.completed('extract_xbstream')['output'], 'output': self._restore_dir_stat()}
+        elif stage == 'decompress':
+            for path in self._extracted_xbstream_file_paths(self._state.completed('extract_xbstream')['output']):
+                path.unlink(missing_ok=True)
+            details = {'input': self._state.completed('extract_qp')['output'], 'output': self._restore_dir_stat()}
+        elif stage == 'prepare':
+            details = {'input': self._state.completed('decompress')['output'], 'output': self._restore_dir_stat()}
+        else:
+            details = {
+                'input': self._state.completed('prepare')['output'],
+                'output': {'datadir': self._config.xtrabackup.datadir}
+            }
+
+        self._state.complete(stage, **details)
+        self._state.save(RESTORE_STATE_PATH)
+
+    @staticmethod
+    def _restore_dir_stat() -> dict:
+        files = [path for path in RESTORE_DIR_PATH.rglob('*') if path.is_file() and path.name != '.gitignore']
+
+        return {'files': len(files), 'size': sum(path.stat().st_size for path in files)}
+
+    @staticmethod
+    def _extracted_xbstream_file_paths(output: dict) -> list:
+        # the state of a restore started before the sharded backups has the single file as 'path'
+        return [Path(path) for path in output['paths']] if 'paths' in output else [Path(output['path'])]
+
+    @property
+    def _xbstream_file_paths(self) -> list:
+        # kept until the files are decompressed, a failed restore is resumed from them
+        if not self.target_backup.is_sharded:
+            return [Path(RESTORE_WORK_DIR_PATH, f'{self.target_backup.path.stem}.xbstream')]
+
+        # <backup>.tar.shard01 => <backup>.shard01.xbstream
+        return [
+            Path(RESTORE_WORK_DIR_PATH, f"{self.target_backup.path.stem}{PurePath(name).suffix}.xbstream")
+            for name, _, _ in ShardIndex.load(self.target_backup.path).parts
+        ]
+
+    def _download_stage(self, start_stage: str) -> Union[SftpConfig, LocalStorageConfig]:
+        """ The target backup downloaded (streamed from the storage) or the copy downloaded by the previous run """
+
+        downloaded = self._state.completed('download')
+        if not self._runs('download', start_stage) and not downloaded['output'].get('streamed', False):
+            echo('The backup is downloaded already', 'Restore')
+            destination = self.target_backup.destination
+            self.target_backup = Backup(
+                source='local',
+                path=Path(downloaded['output']['path']),
+                size=self.target_backup.size_bytes
+            )
+            return destination
+
+        remote_backup = self._fastest_copy(self.target_backup)
+        if self._is_streamed(remote_backup):
+            # extracted straight from the storage host, the archive is never written locally
+            echo('The backup is streamed from the storage', 'Assistant')
+            self.target_backup = remote_backup
+            output = {'streamed': True}
+        else:
+            echo('Start downloading the backup', 'Assistant')
+            self.target_backup = self._download_backup(remote_backup)
+            echo('The backup downloaded', 'Assistant')
+            output = {'path': str(self.target_backup.path), 'size': self.target_backup.size_bytes}
+
+        self._state.complete(
+            'download',
+            input={'size': self.target_backup.size_bytes, 'digest': self._state.digest},
+            output=output
+        )
+        self._state.save(RESTORE_STATE_PATH)
+
+        return remote_backup.destination
+
+    @staticmethod
+    def _parse_target_time(at: str) -> datetime:
+        for time_format in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M'):
+            try:
+                return datetime.strptime(at, time_format)
+            except ValueError:
+                continue
+
+        raise RuntimeError(f"Invalid point-in-time, 'YYYY-MM-DD HH:MM[:SS]' expected: [default]{at}")
+
+    def _backup_before(self, target_time: datetime, pitr: bool) -> Backup:
+        """
+        The newest backup taken at or before the time. The one to replay the binary logs onto has to be started before
+        the time: its binary log position is taken as it ends
+        """
+
+        # the years after the time have nothing to offer
+        self._years = [year for year in self._years if year <= target_time.strftime('%Y')]
+        while True:
+            # the binary logs replayed are of this project, so is the backup they're replayed onto
+            backups = (backup for backup in self.backup_list if self._is_of_project(backup))
+            backup = next(
+                (
+                    backup for backup in backups
+                    if backup.datetime < target_time or (not pitr and backup.datetime == target_time)
+                ),
+                None
+            )
+            if backup is not None:
+                return backup
+            if not self._list_next_year():
+                raise RuntimeError(f"No backup found {'before' if pitr else 'at or before'} {target_time}")
+
+    def _is_of_project(self, backup: Backup) -> bool:
+        # a storage may be shared by several projects (targets): <time>_<project>_<MySQL version>.tar
+        return f"_{self._config.project_name}_" in backup.filename
+
+    def _latest_backup(self) -> Union[Backup, None]:
+        # never another project's backup, nobody is asked to confirm the choice
+        while True:
+            backup = next((backup for backup in self.backup_list if self._is_of_project(backup)), None)
+            if backup is not None or not self._list_next_year():
+                return backup
+
+    def _backup_by_filename(self, filename: str) -> Backup:
+        # named after the time it's created at: YYYY-MM-DD-HH-MM_<project>_<MySQL version>.tar
+        self._years = [year for year in self._years if year == filename[:4]]
+        self._list_next_year()
+
+        backup = next((backup for backup in self.backup_list if backup.filename == filename), None)
+        if backup is None:
+            raise RuntimeError(f"Backup not found (or not supported by this XtraBackup version): [default]{filename}")
+
+        return backup
+
+    def _chosen_backup(self) -> Union[Backup, None]:
+        """ The backup chosen from the list, the backups of an older year are listed on demand """
+
+        while len(self.backup_list) == 0 and self._list_next_year():
+            pass
+        if len(self.backup_list) == 0:
+            return None
+
+        while True:
+            self.backup_list.print(
+                title=f'Available backups (supported by Percona XtraBackup {self._env.xtrabackup_version})'
+            )
+
+            choices = self.backup_list.available_numbers
+            prompt = Text('Please enter no of the target backup', 'blue')
+            if len(self._years) > 0:
+                choices = ['0', *choices]
+                prompt.append(f" (0 to list the backups of {self._years[0]} as well)", 'blue')
+            target_backup_no = IntPrompt.ask(prompt=prompt, choices=choices, show_choices=False)
+            if target_backup_no > 0:
+                return self.backup_list[target_backup_no - 1]
+
+            self._list_next_year()
+
+    def _backup_years(self) -> list:
+        """ The years with backups on any of the storages (the dirs of the backups), newest first """
+
+        years = set()
+        for source_years in self._list_sources(self._local_years, self._remote_years).values():
+            years.update(source_years)
+
+        return sorted(years, reverse=True)
+
+    def _list_next_year(self) -> bool:
+        """ Add the backups of the newest year not listed yet to the list, False if there are no more years """
+
+        if len(self._years) == 0:
+            return False
+
+        year = self._years.pop(0)
+        for source_backups in self._list_sources(
+            lambda: find_local_backups(Path(BACKUPS_DIR_PATH, year)),
+            lambda destination: self._remote_backups(destination, year)
+        ).values():
+            for backup in source_backups:
+                if backup.source != 'local':
+                    self._remote_copies.setdefault(backup.filename, []).append(backup)
+            self.backup_list.extend(source_backups)
+
+        return True
+
+    def _list_sources(self, list_local: Callable[[], list], list_remote: Callable[[Any], list]) -> dict:
+        """
+        List the local backup dir and every storage side by side. A storage failing or not answering in
+        DISCOVERY_TIMEOUT seconds is left out (with a warning), its listing isn't waited for.
+        """
+
+        sources = ['local', *(
+            destination for destination in (*self._config.sftp_destinations, *self._config.local_storages)
+            if destination not in self._unavailable_sources
+        )]
+        results = {}
+
+        def list_source(source) -> None:
+            try:
+                results[source] = list_local() if source == 'local' else list_remote(source)
+            except (RuntimeError, IOError, EOFError, SSHException) as e:
+                # storage errors and invalid indexes or manifests
+                results[source] = e
+            except Exception as e:
+                # an unexpected error (a bug) is reported as it is, not as a storage not answering
+                logger.exception(f"Failed to list the backups of {source if source == 'local' else source.label}")
+                results[source] = escape(f"{type(e).__name__}: {e}")
+
         with Progress(
             SpinnerColumn(),
             TextColumn('[progress.description]{task.description}'),
@@ -89,78 +590,390 @@ class RestoreCommand:
         ) as progress:
             progress.add_task('[blue]Searching for available backups...')
 
-            self.backup_list.extend(self._local_this_year_backups())
+            # daemon threads: a storage hanging on the network doesn't hold up the exit
+            threads = {
+                source: threading.Thread(target=list_source, args=(source,), name='storage_list', daemon=True)
+                for source in sources
+            }
+            for thread in threads.values():
+                thread.start()
+            deadline = monotonic() + self.DISCOVERY_TIMEOUT
+            for thread in threads.values():
+                thread.join(max(deadline - monotonic(), 0))
 
-            if self._config.sftp is not None:
-                try:
-                    sftp_backups = self._sftp_this_year_backups()
-                    self.backup_list.extend(sftp_backups)
-                except SftpError as e:
-                    progress.stop()
+        listings = {}
+        for source in sources:
+            result = results.get(source)
+            if isinstance(result, list):
+                listings[source] = result
+                continue
 
-                    echo_warning(e, author='SFTP')
-                    echo_warning('Backups from SFTP storage not included to the list.', author='SFTP')
+            label = 'local backups' if source == 'local' else f"storage {source.label}"
+            reason = result if result is not None else f"no answer in {self.DISCOVERY_TIMEOUT} seconds"
+            echo_warning(f"Backups from {label} not included to the list: {reason}", author='Storage')
+            if source != 'local':
+                self._unavailable_sources.append(source)
+
+        return listings
 
     @staticmethod
-    def _local_this_year_backups() -> list:
-        current_year_backups_path = Path(BACKUPS_DIR_PATH, now('%Y'))
-        return list(map(
-            lambda path: Backup(source='local', path=path, size=path.stat().st_size),
-            current_year_backups_path.rglob('*.tar')
-        ))
+    def _local_years() -> list:
+        return [path.name for path in BACKUPS_DIR_PATH.iterdir() if path.is_dir() and YEAR_PATTERN.match(path.name)]
+
+    @staticmethod
+    def _remote_years(destination: Union[SftpConfig, LocalStorageConfig]) -> list:
+        with storage_session(destination) as storage:
+            if not storage.exists(destination.path):
+                return []
+            return [name for name in storage.listdir(destination.path) if YEAR_PATTERN.match(name)]
+
+    @staticmethod
+    def _remote_backups(destination: Union[SftpConfig, LocalStorageConfig], year: str) -> list:
+        source = 'sftp' if isinstance(destination, SftpConfig) else 'storage'
+        with storage_session(destination) as storage:
+            backups = []
+            for backup in storage.r_find_files(PurePath(destination.path, year), BACKUP_FILE_PATTERN):
+                size = backup['attr'].st_size
+                index_class = BACKUP_INDEXES.get(backup['path'].suffix)
+                if index_class is not None:
+                    size = index_class.loads(storage.read_text(backup['path']), backup['path']).size
+                backups.append(Backup(source=source, path=backup['path'], size=size, destination=destination))
 
-    def _sftp_this_year_backups(self) -> list:
-        with Sftp(self._config.sftp) as sftp:
-            current_year_backups_path = PurePath(self._config.sftp.path, now('%Y'))
-            return list(map(
-                lambda backup: Backup(source='sftp', path=backup['path'], size=backup['attr'].st_size),
-                sftp.r_find_files(current_year_backups_path, re.compile('.tar$'))
-            ))
+            return backups
+
+    def _fastest_copy(self, backup: Backup) -> Backup:
+        """ The copy of a backup on the destination reading the first megabyte the fastest """
+
+        copies = self._remote_copies.get(backup.filename, [backup])
+        if len(copies) == 1:
+            return copies[0]
+
+        with ThreadPoolExecutor(max_workers=len(copies), thread_name_prefix='storage_probe') as executor:
+            probe_times = list(executor.map(self._probe, copies))
+        fastest_index = min(range(len(copies)), key=lambda index: probe_times[index])
+        if probe_times[fastest_index] == float('inf'):
+            raise RuntimeError(f"No storage with the backup is reachable: [default]{backup.filename}")
+
+        fastest = copies[fastest_index]
+        echo(f"Downloading from {fastest.destination.label} (the fastest of {len(copies)} copies)", 'Storage')
+
+        return fastest
+
+    def _probe(self, backup: Backup) -> float:
+        """ Seconds to read the first bytes of a backup, infinity if the destination fails """
+
+        try:
+            with storage_session(backup.destination) as storage:
+                started_at = monotonic()
+                storage.read_head(backup.path, self.PROBE_SIZE)
+
+                return monotonic() - started_at
+        except (StorageError, IOError, EOFError, SSHException) as e:
+            logger.warning(f"[{backup.destination.label}] Failed to probe {backup.filename}: {e}")
+            return float('inf')
+
+    @staticmethod
+    def _is_streamed(backup: Backup) -> bool:
+        """ A single archive on an SFTP destination with SSH streams is restored without downloading it first """
+
+        return isinstance(backup.destination, SftpConfig) and backup.destination.ssh_streams and \
+            not backup.is_deduplicated and not backup.has_parts
 
     def _download_backup(self, backup: Backup) -> Backup:
         backup_year = backup.datetime.strftime('%Y')
         backup_month = backup.datetime.strftime('%m')
         local_path = Path(BACKUPS_DIR_PATH, backup_year, backup_month, backup.path.name)
 
-        with Sftp(self._config.sftp) as sftp:
-            sftp.download(backup.path, local_path)
+        with storage_session(backup.destination) as storage:
+            manifest = None
+            if storage.exists(backup.manifest_path):
+                storage.download(backup.manifest_path, Manifest.path_for(local_path), display_progress=False)
+                manifest = Manifest.load(Manifest.path_for(local_path))
+
+            if backup.is_deduplicated:
+                # the archive checksum is verified while the archive is reassembled from the chunks
+                storage.download(backup.path, local_path, display_progress=False)
+                index = ChunkIndex.load(local_path)
+                self._download_chunks(storage, backup.destination, index)
+                return Backup(source='local', path=local_path, size=index.size)
+
+            if backup.has_parts:
+                # every part (shard) is verified on its own, the archive checksum of a split backup is verified while
+                # the parts are read, the manifest of a sharded one is the checksum of the index
+                storage.download(
+                    backup.path,
+                    local_path,
+                    display_progress=False,
+                    manifest=manifest if backup.is_sharded else None
+                )
+                index = BACKUP_INDEXES[backup.path.suffix].load(local_path)
+                self._download_parts(backup, local_path.parent, index)
+                return Backup(source='local', path=local_path, size=index.size)
+
+            storage.download(
+                backup.path,
+                local_path,
+                rate_limiter=self._rate_limiter(storage),
+                manifest=manifest
+            )
+            # a copy from a local storage isn't read by the process, it's verified while being extracted
+            self._verified = manifest is not None and storage.VERIFIES_DOWNLOADS
 
         return Backup(source='local', path=local_path, size=local_path.stat().st_size)
 
+    def _download_chunks(
+        self,
+        storage: Storage,
+        destination: Union[SftpConfig, LocalStorageConfig],
+        index: ChunkIndex
+    ) -> None:
+        """ Download the chunks of a deduplicated backup missing in the local chunk store """
+
+        store = ChunkStore(CHUNKS_DIR_PATH)
+        missing_chunks = dict(chunk for chunk in index.chunks if not store.has(chunk[0]))
+        echo(f"Downloading {len(missing_chunks)} missing chunks of {len(index.chunks)}", 'Storage')
+
+        if isinstance(storage, LocalStorage):
+            # the chunk ids are checked while the archive is reassembled (against the archive checksum)
+            storage_store = ChunkStore(Path(destination.path, CHUNKS_DIR_NAME))
+            for chunk_id in missing_chunks:
+                storage.download(storage_store.path_for(chunk_id), store.path_for(chunk_id), display_progress=False)
+            return
+
+        with Progress(
+            TextColumn('[blue][SFTP][/blue]'),
+            SpinnerColumn(),
+            TextColumn('[progress.description]{task.description}'),
+            BarColumn(),
+            DownloadColumn(),
+            transient=True
+        ) as progress:
+            downloading = progress.add_task('[blue]Downloading chunks...', total=sum(missing_chunks.values()))
+            try:
+                RemoteChunkStore(storage, PurePath(destination.path, CHUNKS_DIR_NAME)).download(
+                    store,
+                    list(missing_chunks),
+                    rate_limiter=self._rate_limiter(storage),
+                    on_chunk=lambda size: progress.advance(downloading, size)
+                )
+            except IOError as e:
+                raise RuntimeError(f"Failed to download backup chunks: {e}")
+
+    def _download_parts(self, backup: Backup, local_dir_path: Path, index: Union[PartIndex, ShardIndex]) -> None:
+        """ Download the parts of a split backup (or the shards) side by side, each over its own connection """
+
+        workers = self._config.split.workers if self._config.split is not None else self.PART_WORKERS
+        if backup.is_sharded:
+            workers = len(index.parts)
+        echo(f"Downloading {len(index.parts)} parts ({workers} at a time)", 'Storage')
+
+        with Progress(
+            TextColumn('[blue]\\[Storage][/blue]'),
+            SpinnerColumn(),
+            TextColumn('[progress.description]{task.description}'),
+            BarColumn(),
+            MofNCompleteColumn(),
+            transient=True
+        ) as progress:
+            downloading = progress.add_task('[blue]Downloading parts...', total=len(index.parts))
+
+            def download_part(part: list) -> None:
+                self._download_part(backup, Path(local_dir_path, part[0]), index.part_manifest(part))
+                progress.advance(downloading)
+
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='part_download') as executor:
+                # waits for all the parts, raises the first error
+                list(executor.map(download_part, index.parts))
+
+    def _download_part(self, backup: Backup, local_path: Path, manifest: Manifest) -> None:
+        """ A failed part is downloaded again on its own, the parts already downloaded are kept """
+
+        remote_path = backup.path.with_name(manifest.filename)
+        for attempt in range(self.PART_RETRIES + 1):
+            try:
+                with storage_session(backup.destination) as storage:
+                    storage.download(
+                        remote_path,
+                        local_path,
+                        display_progress=False,
+                        rate_limiter=self._rate_limiter(storage),
+                        manifest=manifest
+                    )
+                return
+            except RuntimeError as e:
+                if attempt == self.PART_RETRIES:
+                    raise RuntimeError(f"Failed to download backup part {manifest.filename}: {e}")
+                logger.warning(
+                    f"Download of {manifest.filename} failed, retry {attempt + 1} of {self.PART_RETRIES}: {e}"
+                )
+
+    def _rate_limiter(self, storage: Storage) -> Union[TokenBucket, None]:
+        if self._throttle is None:
+            return None
+
+        return self._throttle.disk if isinstance(storage, LocalStorage) else self._throttle.network
+
     def _extract_xbstream_file_from_archive(self) -> None:
+        if self.target_backup.is_sharded:
+            self._extract_xbstream_files_from_shards()
+            return
+        if self._streams_xbstream:
+            echo('The xbstream file is piped from the archive into xbstream at the next stage', 'tar')
+            return
+
         echo('Start extracting xbstream file from the archive', 'tar')
+        with IoPriority.uncached(open(self._xbstream_file_paths[0], 'wb')) as destination:
+            self._copy_xbstream_file_from_archive(destination, '[blue]Extracting xbstream file...')
+        echo('xbstream file extracted', 'tar')
 
-        with tarfile.open(self.target_backup.path, 'r:') as tar:
-            backup_file = next(
-                (backup for backup in tar.getmembers() if re.search('.xbstream$', backup.name)),
-                None
-            )
-            if backup_file is None:
-                raise RuntimeError('Not found .xbstream backup file in the target archive')
-
-            with Progress(
-                TextColumn('[blue]\\[tar][/blue]'),
-                SpinnerColumn(),
-                TextColumn("[progress.description]{task.description}"),
-                BarColumn(),
-                TaskProgressColumn(),
-                DownloadColumn(),
-                transient=True
-            ) as progress:
-                # extract with progress bar
-                # noinspection PyTypeChecker
-                with progress.wrap_file(
-                    file=tar.extractfile(backup_file),
-                    total=backup_file.size,
-                    description='[blue]Extracting xbstream file...'
-                ) as source:
-                    with open(Path(TEMP_DIR_PATH, backup_file.name), 'wb') as destination:
+    def _copy_xbstream_file_from_archive(self, destination: IO[bytes], description: str) -> None:
+        """ Copy the xbstream file from the archive (to a file or xbstream), the archive checksum is verified too """
+
+        manifest = None
+        if not self._verified:
+            manifest = self._manifest
+            if manifest is None:
+                echo_warning('Backup manifest not found, the archive checksum is not verified', author='tar')
+
+        with self._open_archive() as archive_file:
+            archive = archive_file if manifest is None else HashingReader(archive_file, manifest.algorithm)
+
+            # stream mode reads the archive once front to back, so it's hashed while being extracted
+            with tarfile.open(fileobj=archive, mode='r|') as tar:
+                backup_file = next((member for member in tar if re.search('.xbstream$', member.name)), None)
+                if backup_file is None:
+                    raise RuntimeError('Not found .xbstream backup file in the target archive')
+
+                with Progress(
+                    TextColumn('[blue]\\[tar][/blue]'),
+                    SpinnerColumn(),
+                    TextColumn("[progress.description]{task.description}"),
+                    BarColumn(),
+                    TaskProgressColumn(),
+                    DownloadColumn(),
+                    transient=True
+                ) as progress:
+                    # extract with progress bar
+                    # noinspection PyTypeChecker
+                    with progress.wrap_file(
+                        file=tar.extractfile(backup_file),
+                        total=backup_file.size,
+                        description=description
+                    ) as source:
+                        if self._throttle is not None:
+                            source = RateLimitedReader(source, self._throttle.disk)
                         shutil.copyfileobj(source, destination)
 
-        echo('xbstream file extracted', 'tar')
+                if manifest is not None:
+                    # the rest of the archive (log file, padding) is a part of the checksum too
+                    archive.read_to_end()
+                    manifest.verify(archive.hexdigest(), archive.size)
+
+        if manifest is not None:
+            echo(f"Archive checksum verified ({manifest.algorithm})", 'tar')
+
+    def _extract_xbstream_files_from_shards(self) -> None:
+        """ The xbstream files of a sharded backup, extracted side by side, every shard verified against the index """
+
+        echo('Start extracting xbstream files from the shard archives', 'tar')
+
+        index_path = Path(self.target_backup.path)
+        if self._manifest is None:
+            echo_warning('Backup manifest not found, the shard index checksum is not verified', author='tar')
+        else:
+            index_digest = hashlib.new(self._manifest.algorithm, index_path.read_bytes()).hexdigest()
+            self._manifest.verify(index_digest, index_path.stat().st_size)
+        index = ShardIndex.load(index_path)
+
+        with Progress(
+            TextColumn('[blue]\\[tar][/blue]'),
+            SpinnerColumn(),
+            TextColumn("[progress.description]{task.description}"),
+            BarColumn(),
+            TaskProgressColumn(),
+            DownloadColumn(),
+            transient=True
+        ) as progress:
+            extracting = progress.add_task('[blue]Extracting xbstream files...', total=index.size)
+
+            def extract(part: list, part_path: Path, xbstream_file_path: Path) -> None:
+                manifest = index.part_manifest(part)
+                try:
+                    shard_file = IoPriority.uncached(open(part_path, 'rb'))
+                except FileNotFoundError:
+                    raise RuntimeError(f"Missing backup shard {part_path.name}")
+
+                with progress.wrap_file(shard_file, total=manifest.size, task_id=extracting) as source:
+                    if self._throttle is not None:
+                        source = RateLimitedReader(source, self._throttle.disk)
+                    archive = HashingReader(source, manifest.algorithm)
+                    with tarfile.open(fileobj=archive, mode='r|') as tar:
+                        backup_file = next((member for member in tar if member.name.endswith('.xbstream')), None)
+                        if backup_file is None:
+                            raise RuntimeError(f"Not found .xbstream backup file in the shard {part_path.name}")
+                        with IoPriority.uncached(open(xbstream_file_path, 'wb')) as destination:
+                            shutil.copyfileobj(tar.extractfile(backup_file), destination)
+
+                        archive.read_to_end()
+                        manifest.verify(archive.hexdigest(), archive.size)
+
+            with ThreadPoolExecutor(max_workers=len(index.parts), thread_name_prefix='shard_extract') as executor:
+                # waits for all the shards, raises the first error
+                list(executor.map(extract, index.parts, index.part_paths(index_path.parent), self._xbstream_file_paths))
+
+        echo(f"Shard checksums verified ({index.algorithm})", 'tar')
+        echo(f"xbstream files of {len(index.parts)} shards extracted", 'tar')
+
+    def _target_manifest(self) -> Union[Manifest, None]:
+        if self.target_backup.source != 'local':
+            manifest_path = self.target_backup.manifest_path
+            with storage_session(self.target_backup.destination) as storage:
+                if not storage.exists(manifest_path):
+                    return None
+                return Manifest.loads(storage.read_text(manifest_path), manifest_path)
+
+        manifest_path = Path(self.target_backup.manifest_path)
+        return Manifest.load(manifest_path) if manifest_path.exists() else None
+
+    @contextmanager
+    def _open_archive(self) -> Iterator[IO[bytes]]:
+        if self.target_backup.source != 'local':
+            # streamed from the storage host (an SSH stream, SFTP if the host can't run commands)
+            with storage_session(self.target_backup.destination) as storage, \
+                    closing(storage.open_stream(self.target_backup.path)) as stream:
+                yield stream if self._throttle is None else RateLimitedReader(stream, self._throttle.network)
+            return
+
+        if self.target_backup.is_deduplicated:
+            # reassembled from the chunks as a stream, the archive itself is never written
+            archive_file = ChunkStore(CHUNKS_DIR_PATH).open(ChunkIndex.load(self.target_backup.path))
+        elif self.target_backup.is_split:
+            # the parts are streamed one after another, never joined into a single file
+            archive_file = PartReader(Path(self.target_backup.path).parent, PartIndex.load(self.target_backup.path))
+        else:
+            archive_file = IoPriority.uncached(open(self.target_backup.path, 'rb'))
+
+        with archive_file:
+            yield archive_file
 
     def _extract_qp_files_from_xbstream_file(self) -> None:
-        echo('Start extracting qpress files from xbstream file', 'xbstream')
+        extracted = self._state.completed('extract_xbstream')['output']
+        if extracted.get('streamed', False):
+            self._extract_qp_files_from_archive()
+            return
+
+        xbstream_file_paths = self._extracted_xbstream_file_paths(extracted)
+        if len(xbstream_file_paths) == 1:
+            echo('Start extracting qpress files from xbstream file', 'xbstream')
+        else:
+            echo(f"Start extracting qpress files from {len(xbstream_file_paths)} shard xbstream files", 'xbstream')
+
+        # the files extracted by a failed run are extracted again
+        clear_dir(RESTORE_DIR_PATH)
+
+        # the shards have different files, they're extracted into the restore dir side by side
+        parallel = max(1, self._config.xtrabackup.parallel // len(xbstream_file_paths))
+        command_options = self._xbstream_options(parallel)
 
         with Progress(
             TextColumn('[blue]\\[xbstream][/blue]'),
@@ -168,29 +981,79 @@ class RestoreCommand:
             TextColumn('[blue]Extracting qpress files...'),
             transient=True
         ) as progress:
+            def extract(xbstream_file_path: Path) -> None:
+                try:
+                    with progress.open(xbstream_file_path, 'rb') as xbstream_file:
+                        command = subprocess.run(
+                            IoPriority.command(['xbstream', *command_options]),
+                            stdin=xbstream_file,
+                            capture_output=True
+                        )
+                        if command.returncode != 0:
+                            error = command.stdout.decode('utf-8').rstrip()
+                            raise RuntimeError(f'Failed to extract files from xbstream: {error}')
+                    IoPriority.drop_cache(xbstream_file_path)
+                except FileNotFoundError:
+                    raise RuntimeError(f'Failed to extract from xbstream: file not found {xbstream_file_path}')
+
+            with ThreadPoolExecutor(max_workers=len(xbstream_file_paths), thread_name_prefix='xbstream') as executor:
+                # waits for all the files, raises the first error
+                list(executor.map(extract, xbstream_file_paths))
+
+        echo('qpress files extracted', author='xbstream')
+
+    def _extract_qp_files_from_archive(self) -> None:
+        """ The low-disk pipeline: the xbstream file is piped from the archive into xbstream, it's never written """
+
+        echo('Start extracting qpress files from the archive', 'xbstream')
+
+        # the files extracted by a failed run are extracted again
+        clear_dir(RESTORE_DIR_PATH)
+
+        # unbuffered, so nothing is left to flush into a stopped xbstream
+        xbstream = subprocess.Popen(
+            IoPriority.command(['xbstream', *self._xbstream_options(self._config.xtrabackup.parallel)]),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            bufsize=0
+        )
+        try:
             try:
-                target_backup_name = self.target_backup.path.stem
-                xbstream_file_path = Path(TEMP_DIR_PATH, f'{target_backup_name}.xbstream')
-                with progress.open(xbstream_file_path, 'rb') as xbstream_file:
-                    command_options = (
-                        f'--parallel={self._config.xtrabackup.parallel}',
-                        '-C',
-                        RESTORE_DIR_PATH,
-                        '-x',
-                    )
-                    command = subprocess.run(
-                        ['xbstream', *command_options],
-                        stdin=xbstream_file,
-                        capture_output=True
-                    )
-                    if command.returncode != 0:
-                        error = command.stdout.decode('utf-8').rstrip()
-                        raise RuntimeError(f'Failed to extract files from xbstream: {error}')
-            except FileNotFoundError:
-                raise RuntimeError(f'Failed to extract from xbstream: file not found {xbstream_file_path}')
+                self._copy_xbstream_file_from_archive(xbstream.stdin, '[blue]Extracting qpress files...')
+            except BrokenPipeError:
+                # xbstream stopped reading, its error is raised below
+                pass
+            xbstream.stdin.close()
+            output = xbstream.stdout.read()
+            xbstream.wait()
+        except BaseException:
+            xbstream.kill()
+            xbstream.wait()
+            raise
+
+        if xbstream.returncode != 0:
+            error = output.decode('utf-8').rstrip()
+            raise RuntimeError(f'Failed to extract files from xbstream: {error}')
 
         echo('qpress files extracted', author='xbstream')
 
+    def _xbstream_options(self, parallel: int) -> tuple:
+        command_options = (
+            f'--parallel={parallel}',
+            '-C',
+            RESTORE_DIR_PATH,
+            '-x',
+        )
+        if self._config.xtrabackup.encrypt is not None:
+            # decrypted on the way, the files are written already decrypted (qpress compressed)
+            command_options += (
+                f'--decrypt={self._config.xtrabackup.encrypt}',
+                *self._config.xtrabackup.encryption_options
+            )
+
+        return command_options
+
     # noinspection PyMethodMayBeStatic
     def _decompress_qp_files(self) -> None:
         echo('Start decompressing qpress files', 'xtrabackup')
@@ -204,10 +1067,10 @@ class RestoreCommand:
             '--decompress',
             f'--target-dir={RESTORE_DIR_PATH}',
             f'--parallel={self._config.xtrabackup.parallel}',
-            '--decompress-threads=5',
+            f'--decompress-threads={self._config.xtrabackup.decompress_threads}',
             '--remove-original'
         )
-        command = subprocess.run(['xtrabackup', *command_options], capture_output=True)
+        command = subprocess.run(IoPriority.command(['xtrabackup', *command_options]), capture_output=True)
 
         # wait until progress disappear
         progress_thread.join()
@@ -218,6 +1081,167 @@ class RestoreCommand:
 
         echo('qpress files decompressed', 'xtrabackup')
 
+    def _apply_to_datadir(self) -> None:
+        datadir_path = Path(self._config.xtrabackup.datadir)
+        echo(f"Start moving backup files to MySQL data dir {datadir_path}", 'Restore')
+
+        if not datadir_path.is_dir():
+            raise RuntimeError(f"MySQL data dir not found: [default]{datadir_path}")
+        mover = DatadirMover(RESTORE_DIR_PATH, datadir_path, workers=self._config.xtrabackup.parallel)
+        # the files moved by an interrupted apply are in the data dir already, the rest is moved (copied over) now
+        if self._state.applying != str(datadir_path) and len(mover.datadir_entries()) > 0:
+            raise RuntimeError(f"MySQL data dir is not empty, stop MySQL and empty it first: [default]{datadir_path}")
+        self._state.applying = str(datadir_path)
+        self._state.save(RESTORE_STATE_PATH)
+
+        with Progress(
+            TextColumn('[blue]\\[Restore][/blue]'),
+            SpinnerColumn(),
+            TextColumn('[progress.description]{task.description}'),
+            BarColumn(),
+            TaskProgressColumn(),
+            DownloadColumn(),
+            TransferSpeedColumn(),
+            transient=True
+        ) as progress:
+            moving = progress.add_task('[blue]Moving backup files...', total=mover.total_size)
+            try:
+                method = mover.move(on_moved=lambda size: progress.advance(moving, size))
+            except OSError as e:
+                raise RuntimeError(f"Failed to move backup files to MySQL data dir: {e}")
+
+        if method == 'copy':
+            # removed once the whole backup is in place, the metadata is kept (the binary log position of a replay)
+            clear_dir(RESTORE_DIR_PATH, keep=mover.metadata_names)
+        self._state.applying = None
+
+        echo(f"Backup files moved to MySQL data dir ({method})", 'Restore')
+
+    def _resolve_binlogs(self, target_time: datetime) -> tuple:
+        """
+        (storage, binary log index) with the binary logs from the backup position up to the time, the position comes
+        from the manifest (the restored files of a resumed restore). The position of a backup without it in the
+        manifest is checked once the backup is prepared, the index must cover the time the backup was taken
+        """
+
+        # binary logs are looked for on the storage the backup comes from first
+        index_destination, index = self._binlog_index(self.target_backup.destination)
+        if index.latest() is None:
+            raise RuntimeError(f"No binary logs streamed to {index_destination.label} yet, the recovery can't be made")
+
+        until = target_time.strftime('%Y-%m-%d %H:%M:%S')
+        binlog_position = self._binlog_position()
+        if binlog_position is not None:
+            # fails if the binary log of the backup position isn't streamed
+            index.range(binlog_position[0], until)
+            return index_destination, index
+
+        # the binary log of the position is closed after the backup was taken, so its last event is later
+        backup_at = self.target_backup.datetime.strftime('%Y-%m-%d %H:%M:%S')
+        if (index.latest()['last_event_at'] or '') < backup_at:
+            raise RuntimeError(
+                f"The streamed binary logs end at {index.latest()['last_event_at']}, before the backup was taken "
+                f"({backup_at}): is the binlog service running?"
+            )
+        echo_warning('The backup manifest has no binary log position, it is checked once the backup is prepared',
+                     author='Binlog')
+
+        return index_destination, index
+
+    def _binlog_position(self) -> Union[list, None]:
+        """ [binary log name, position] of the backup, None if it isn't known before the backup is extracted """
+
+        binlog_info_path = Path(RESTORE_DIR_PATH, 'xtrabackup_binlog_info')
+        if binlog_info_path.exists():
+            name, position = binlog_info_path.read_text('utf-8').split()[:2]
+            return [name, int(position)]
+
+        return self._manifest.binlog_position if self._manifest is not None else None
+
+    def _prepare_binlog_replay(
+        self,
+        target_time: datetime,
+        index_destination: Union[SftpConfig, LocalStorageConfig],
+        index: BinlogIndex
+    ) -> Path:
+        """
+        Download the binary logs written since the backup (its position is in xtrabackup_binlog_info) up to the time
+        and decode them into a SQL script, to be replayed once the server is started on the restored data
+        """
+
+        binlog_info_path = Path(RESTORE_DIR_PATH, 'xtrabackup_binlog_info')
+        if not binlog_info_path.exists():
+            raise RuntimeError('The backup has no binary log position (xtrabackup_binlog_info), is binary logging on?')
+        start_name, start_position = binlog_info_path.read_text('utf-8').split()[:2]
+
+        until = target_time.strftime('%Y-%m-%d %H:%M:%S')
+        binlogs = index.range(start_name, until)
+        # the time is covered if a later binary log starts after it
+        if binlogs[-1] is index.latest() and (binlogs[-1]['last_event_at'] or '') < until:
+            echo_warning(
+                f"The streamed binary logs end at {binlogs[-1]['last_event_at']}, the recovery stops there",
+                author='Binlog'
+            )
+
+        echo(f"Downloading {len(binlogs)} binary logs from {index_destination.label}", 'Binlog')
+        binlogs_dir_path = Path(TEMP_DIR_PATH, BINLOGS_DIR_NAME)
+        binlog_paths = []
+        with storage_session(index_destination) as storage:
+            remote_dir_path = PurePath(index_destination.path, BINLOGS_DIR_NAME, self._config.project_name)
+            for binlog in binlogs:
+                compressed_path = Path(binlogs_dir_path, binlog['filename'])
+                storage.download(
+                    remote_dir_path / binlog['filename'],
+                    compressed_path,
+                    display_progress=False,
+                    rate_limiter=self._rate_limiter(storage),
+                    manifest=BinlogIndex.manifest(binlog)
+                )
+                binlog_path = Path(binlogs_dir_path, binlog['name'])
+                with gzip.open(compressed_path, 'rb') as compressed_file, open(binlog_path, 'wb') as binlog_file:
+                    shutil.copyfileobj(compressed_file, binlog_file)
+                compressed_path.unlink()
+                binlog_paths.append(binlog_path)
+
+        REPLAY_DIR_PATH.mkdir(exist_ok=True)
+        replay_name = f"{self.target_backup.path.stem}_until_{target_time:%Y-%m-%d-%H-%M-%S}.sql"
+        replay_path = Path(REPLAY_DIR_PATH, replay_name)
+        command_options = (
+            # the position applies to the first binary log, the time to the last one
+            f"--start-position={start_position}",
+            f"--stop-datetime={until}",
+            *binlog_paths
+        )
+        with open(replay_path, 'wb') as replay_file:
+            command = subprocess.run(['mysqlbinlog', *command_options], stdout=replay_file, stderr=subprocess.PIPE)
+        if command.returncode != 0:
+            replay_path.unlink()
+            error = command.stderr.decode('utf-8').rstrip()
+            raise RuntimeError(f'Failed to decode the binary logs: {error}')
+
+        echo(f"Binary logs from {start_name}:{start_position} up to {until} decoded: {replay_path}", 'Binlog')
+
+        return replay_path
+
+    def _binlog_index(self, destination: Union[SftpConfig, LocalStorageConfig, None]) -> tuple:
+        """ (storage, binary log index) of the first storage having the binary logs streamed """
+
+        destinations = [*self._config.sftp_destinations, *self._config.local_storages]
+        if destination in destinations:
+            destinations.remove(destination)
+            destinations.insert(0, destination)
+
+        for destination in destinations:
+            index_path = PurePath(destination.path, BINLOGS_DIR_NAME, self._config.project_name, BinlogIndex.FILENAME)
+            try:
+                with storage_session(destination) as storage:
+                    if storage.exists(index_path):
+                        return destination, BinlogIndex.loads(storage.read_text(index_path), index_path)
+            except (StorageError, IOError) as e:
+                echo_warning(f"Binary logs of {destination.label} are not available: {e}", author='Binlog')
+
+        raise RuntimeError('No streamed binary logs found on the storages (is the binlog service running?)')
+
     @staticmethod
     def _prepare_mysql_files() -> None:
         echo('Start preparing mysql files', 'xtrabackup')
@@ -235,7 +1259,7 @@ class RestoreCommand:
                 f'--target-dir={RESTORE_DIR_PATH}'
             )
             command = subprocess.run(
-                ['xtrabackup', *command_options],
+                IoPriority.command(['xtrabackup', *command_options]),
                 capture_output=True
             )
             if command.returncode != 0:
@@ -1,13 +1,18 @@
-import re
+from collections import Counter
 from datetime import datetime
 from operator import attrgetter
+from pathlib import Path, PurePath
+from typing import Union
 
 from dateutil.relativedelta import relativedelta
+from humanize import naturalsize
 
-from common import Backup, BackupList
-from configs import Config
-from constants import BACKUPS_DIR_PATH
-from utils import Sftp, rotation_logger, echo
+from common import Backup, BackupList, ChunkIndex, ChunkStore, RemoteChunkStore, BinlogIndex, BACKUP_INDEXES, \
+    BACKUP_FILE_PATTERN, CHUNKS_DIR_NAME, BINLOGS_DIR_NAME, find_local_backups
+from configs import Config, SftpConfig, LocalStorageConfig
+from constants import BACKUPS_DIR_PATH, CHUNKS_DIR_PATH
+from exceptions import StorageError
+from utils import Storage, LocalStorage, storage_session, rotation_logger, echo, echo_warning
 
 
 class RotateCommand:
@@ -19,16 +24,21 @@ class RotateCommand:
     def execute(self):
         self._rotate_local_backups()
 
-        if self._config.sftp is not None:
-            self._rotate_sftp_backups()
+        for destination in [*self._config.sftp_destinations, *self._config.local_storages]:
+            try:
+                self._rotate_remote_backups(destination)
+            except StorageError as e:
+                if destination.required:
+                    raise
+                # an unreachable optional storage is rotated the next time
+                echo_warning(f"{destination.label}: {e}", author='Storage')
+                rotation_logger.warning(f'Storage {destination.label} rotation skipped: {e}')
 
     def _rotate_local_backups(self) -> None:
         echo('Start local storage rotation')
         rotation_logger.info('Start LOCAL storage rotation')
 
-        local_backups = [
-            Backup(source='local', path=path, size=path.stat().st_size) for path in BACKUPS_DIR_PATH.rglob('*.tar')
-        ]
+        local_backups = find_local_backups(BACKUPS_DIR_PATH)
         pinned_backups_datetime = datetime.now() - relativedelta(days=self._config.rotation.keep_for_last_days_local)
 
         backups_to_delete = BackupList(
@@ -36,7 +46,12 @@ class RotateCommand:
         )
 
         for backup in backups_to_delete:
+            if backup.has_parts:
+                # the parts (shards) go first, so an interrupted rotation leaves the index to find them again
+                for part_path in BACKUP_INDEXES[backup.path.suffix].load(backup.path).part_paths(backup.path.parent):
+                    part_path.unlink(missing_ok=True)
             backup.path.unlink()
+            backup.manifest_path.unlink(missing_ok=True)
 
             msg = f'Local backup deleted: {backup.filename}'
             echo(msg)
@@ -60,19 +75,36 @@ class RotateCommand:
                 echo(msg)
                 rotation_logger.info(msg)
 
+        if CHUNKS_DIR_PATH.exists():
+            # chunks are deleted when no remaining backup refers to them
+            references = Counter(
+                chunk_id
+                for backup in local_backups if backup not in backups_to_delete and backup.is_deduplicated
+                for chunk_id in ChunkIndex.load(backup.path).chunk_ids
+            )
+            deleted_count, deleted_size = ChunkStore(CHUNKS_DIR_PATH).collect_garbage(set(references))
+            self._log_collected_chunks('Local', deleted_count, deleted_size)
+
         echo('End local storage rotation')
         rotation_logger.info('End LOCAL storage rotation')
 
-    def _rotate_sftp_backups(self) -> None:
-        echo('Start sftp storage rotation')
-        rotation_logger.info('Start SFTP storage rotation')
+    def _rotate_remote_backups(self, destination: Union[SftpConfig, LocalStorageConfig]) -> None:
+        """ Rotate an SFTP destination or a local storage, both by the SFTP rules """
+
+        with storage_session(destination) as storage:
+            echo(f'Start {storage.KIND.lower()} rotation: {destination.label}')
+            rotation_logger.info(f'Start {storage.KIND.upper()} rotation: {destination.label}')
 
-        with Sftp(self._config.sftp) as sftp:
             backups_to_delete = []
 
-            remote_path = self._config.sftp.path
-            backup_files = sftp.r_find_files(remote_path, re.compile('.tar$'))
+            remote_path = destination.path
+            backup_files = storage.r_find_files(
+                remote_path,
+                BACKUP_FILE_PATTERN,
+                skip_dirs=(CHUNKS_DIR_NAME, BINLOGS_DIR_NAME)
+            )
             backups = [Backup(source='sftp', path=file['path'], size=file['attr'].st_size) for file in backup_files]
+            all_backups = list(backups)
 
             # keep backups newer than N days
             current_day_start = datetime.strptime(datetime.now().strftime('%Y-%m-%d'), '%Y-%m-%d')
@@ -119,28 +151,112 @@ class RotateCommand:
 
             for backup in backups_to_delete:
                 try:
-                    sftp.delete(backup.path)
-                    msg = f'SFTP backup deleted: {backup.filename}'
+                    if backup.has_parts:
+                        index = BACKUP_INDEXES[backup.path.suffix].loads(storage.read_text(backup.path), backup.path)
+                        for part_path in index.part_paths(backup.path.parent):
+                            storage.delete(part_path, ignore_errors=True)
+                    storage.delete(backup.path)
+                    storage.delete(backup.manifest_path, ignore_errors=True)
+                    msg = f'{storage.KIND} backup deleted: {backup.filename}'
                     echo(msg)
                     rotation_logger.info(msg)
 
                     # delete month dir if empty
                     month_dir_path = backup.path.parent
-                    if not any(sftp.sftp_client.listdir(str(month_dir_path))):
-                        sftp.delete(month_dir_path)
-                        msg = f'SFTP empty month dir deleted: {month_dir_path}'
+                    if not any(storage.listdir(month_dir_path)):
+                        storage.delete(month_dir_path)
+                        msg = f'{storage.KIND} empty month dir deleted: {month_dir_path}'
                         echo(msg)
                         rotation_logger.info(msg)
 
                     # delete year dir if empty
                     year_dir_path = month_dir_path.parent
-                    if not any(sftp.sftp_client.listdir(str(year_dir_path))):
-                        sftp.delete(year_dir_path)
-                        msg = f'SFTP empty year dir deleted: {year_dir_path}'
+                    if not any(storage.listdir(year_dir_path)):
+                        storage.delete(year_dir_path)
+                        msg = f'{storage.KIND} empty year dir deleted: {year_dir_path}'
                         echo(msg)
                         rotation_logger.info(msg)
                 except IOError as e:
-                    raise RuntimeError(f'Failed to delete SFTP entity: {e}')
+                    raise RuntimeError(f'Failed to delete {storage.KIND} entity: {e}')
+
+            remaining_backups = [backup for backup in all_backups if backup not in backups_to_delete]
+            self._collect_remote_chunks(storage, destination, remaining_backups)
+            self._rotate_binlogs(storage, destination, remaining_backups)
+
+            echo(f'End {storage.KIND.lower()} rotation: {destination.label}')
+            rotation_logger.info(f'End {storage.KIND.upper()} rotation: {destination.label}\n')
+
+    def _collect_remote_chunks(
+        self,
+        storage: Storage,
+        destination: Union[SftpConfig, LocalStorageConfig],
+        remaining_backups: list
+    ) -> None:
+        """ Delete the chunks of the storage no remaining backup refers to """
+
+        chunks_path = PurePath(destination.path, CHUNKS_DIR_NAME)
+        if not storage.exists(chunks_path):
+            return
+
+        try:
+            # an unreadable index fails the rotation before anything is deleted, its chunks must survive
+            references = Counter(
+                chunk_id
+                for backup in remaining_backups if backup.is_deduplicated
+                for chunk_id in ChunkIndex.loads(storage.read_text(backup.path), backup.path).chunk_ids
+            )
+            if isinstance(storage, LocalStorage):
+                chunk_store = ChunkStore(Path(chunks_path))
+            else:
+                chunk_store = RemoteChunkStore(storage, chunks_path)
+            deleted_count, deleted_size = chunk_store.collect_garbage(set(references))
+        except IOError as e:
+            raise RuntimeError(f'Failed to collect {storage.KIND} chunks: {e}')
+
+        self._log_collected_chunks(f'{storage.KIND} {destination.label}', deleted_count, deleted_size)
+
+    def _rotate_binlogs(
+        self,
+        storage: Storage,
+        destination: Union[SftpConfig, LocalStorageConfig],
+        remaining_backups: list
+    ) -> None:
+        """ Delete the binary logs ending before the oldest remaining backup, no recovery starts before it """
+
+        binlogs_path = PurePath(destination.path, BINLOGS_DIR_NAME, self._config.project_name)
+        index_path = binlogs_path / BinlogIndex.FILENAME
+        project_backups = [
+            backup for backup in remaining_backups if f"_{self._config.project_name}_" in backup.filename
+        ]
+        if len(project_backups) == 0 or not storage.exists(index_path):
+            return
+
+        oldest_backup_at = min(backup.datetime for backup in project_backups).strftime('%Y-%m-%d %H:%M:%S')
+        try:
+            index = BinlogIndex.loads(storage.read_text(index_path), index_path)
+            # the index keeps listing them (the streaming service owns it), a replay never starts that early
+            outdated = [
+                binlog for binlog in index.binlogs
+                if binlog['last_event_at'] is not None and binlog['last_event_at'] < oldest_backup_at
+            ]
+            deleted_count = 0
+            for binlog in outdated:
+                if storage.exists(binlogs_path / binlog['filename']):
+                    storage.delete(binlogs_path / binlog['filename'])
+                    deleted_count += 1
+        except IOError as e:
+            raise RuntimeError(f'Failed to delete {storage.KIND} binary logs: {e}')
+
+        if deleted_count > 0:
+            msg = f'{storage.KIND} {destination.label} binary logs before {oldest_backup_at} deleted: {deleted_count}'
+            echo(msg)
+            rotation_logger.info(msg)
+
+    @staticmethod
+    def _log_collected_chunks(storage: str, deleted_count: int, deleted_size: int) -> None:
+        if deleted_count == 0:
+            return
 
-        echo('End sftp storage rotation')
-        rotation_logger.info('End SFTP storage rotation\n')
+        msg = f'{storage} unreferenced chunks deleted: {deleted_count} ({naturalsize(deleted_size)})'
+        echo(msg)
+        rotation_logger.info(msg)
@@ -0,0 +1,247 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import PurePath
+from time import monotonic
+from typing import Union
+
+from humanize import naturalsize
+from rich.progress import Progress, TextColumn, SpinnerColumn, BarColumn, MofNCompleteColumn
+from rich.table import Column
+from rich.text import Text
+
+from common import Backup, Manifest, ChunkIndex, PartIndex, ShardIndex, RemoteChunkStore, BACKUP_FILE_PATTERN, \
+    BACKUP_INDEXES, CHUNKS_DIR_NAME, BINLOGS_DIR_NAME
+from configs import Config, SftpConfig
+from exceptions import SftpError
+from utils import Sftp, Throttle, echo, logger, print_summary, write_report
+
+
+@dataclass
+class VerifyResult:
+    destination: str
+    path: str
+    size: int
+    status: str = 'ok'
+    method: Union[str, None] = None
+    seconds: float = 0
+    error: Union[str, None] = None
+
+
+class VerifyCommand:
+    """
+    Checks SFTP backups against their manifests without downloading them: the checksum is computed on the storage
+    host over SSH, or read over SFTP when the host can't run commands. The parts and shards of a backup stored as an
+    index are checked against the index. Backups of all destinations are checked concurrently.
+    """
+
+    DEFAULT_WORKERS = 4
+
+    def __init__(self, config: Config, workers: Union[int, None] = None, throttle: Union[Throttle, None] = None):
+        if config.sftp is None:
+            raise RuntimeError("Required option 'sftp' is missing in the config")
+        if workers is not None and workers < 1:
+            raise RuntimeError('The number of verify workers must be positive')
+        self._config = config
+        self._workers = workers or self.DEFAULT_WORKERS
+        self._throttle = throttle
+
+        # every worker thread uses its own connection (per destination), SFTP channels are not meant to be shared
+        # between threads
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+        self.results: list = []
+
+    def execute(self) -> None:
+        backups = []
+        for destination in self._config.sftp_destinations:
+            try:
+                backups.extend(self._find_backups(destination))
+            except SftpError as e:
+                # an unreachable destination fails the verification, the others are verified anyway
+                self.results.append(VerifyResult(
+                    destination=destination.label,
+                    path=str(destination.path),
+                    size=0,
+                    status='failed',
+                    error=str(e)
+                ))
+
+        if len(backups) == 0 and len(self.results) == 0:
+            echo(text='Not found SFTP backups to verify.', style='orange1', time=False)
+            return None
+
+        echo(
+            f"Start verifying {len(backups)} SFTP backups on {len(self._config.sftp_destinations)} destinations "
+            f"({self._workers} workers)",
+            author='Verify'
+        )
+
+        try:
+            with Progress(
+                TextColumn('[blue]\\[Verify][/blue]'),
+                SpinnerColumn(),
+                TextColumn('[progress.description]{task.description}'),
+                BarColumn(),
+                MofNCompleteColumn(),
+                transient=True
+            ) as progress:
+                verifying = progress.add_task('[blue]Verifying backups...', total=len(backups))
+
+                with ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix='verify') as executor:
+                    futures = [executor.submit(self._verify_backup, backup) for backup in backups]
+                    for future in as_completed(futures):
+                        self.results.append(future.result())
+                        progress.advance(verifying)
+        finally:
+            for sftp in self._connections:
+                sftp.close()
+
+        self.results.sort(key=lambda result: (result.destination, result.path))
+        self._print_summary()
+        report_path = write_report('verify', self.results)
+        echo(f"Report written: {report_path}", author='Verify')
+
+        passed = [result for result in self.results if result.status == 'ok']
+        unverifiable = [result for result in self.results if result.status == 'no manifest']
+        failed = [result for result in self.results if result.status not in ('ok', 'no manifest')]
+        message = (f"Verified {len(self.results)} SFTP backups: {len(passed)} passed, {len(failed)} failed, "
+                   f"{len(unverifiable)} without manifest")
+        if len(failed) > 0:
+            logger.error(message)
+            raise RuntimeError(f"{message}: [default]{', '.join(PurePath(result.path).name for result in failed)}")
+
+        logger.info(message)
+        echo(message, author='Verify')
+
+    @staticmethod
+    def _find_backups(destination: SftpConfig) -> list:
+        with Sftp.session(destination) as sftp:
+            return [
+                Backup(source='sftp', path=backup['path'], size=backup['attr'].st_size, destination=destination)
+                # the chunks of deduplicated backups are checked through their indexes
+                for backup in sftp.r_find_files(
+                    PurePath(destination.path), BACKUP_FILE_PATTERN, skip_dirs=(CHUNKS_DIR_NAME, BINLOGS_DIR_NAME)
+                )
+            ]
+
+    def _verify_backup(self, backup: Backup) -> VerifyResult:
+        result = VerifyResult(destination=backup.destination.label, path=str(backup.path), size=backup.size_bytes)
+        started_at = monotonic()
+
+        try:
+            sftp = self._sftp(backup.destination)
+            if not sftp.exists(backup.manifest_path):
+                result.status = 'no manifest'
+                return result
+
+            manifest = Manifest.loads(sftp.read_text(backup.manifest_path), backup.manifest_path)
+            if manifest.size != backup.size_bytes:
+                result.status = 'corrupted'
+                result.error = f"size {backup.size_bytes} bytes, expected {manifest.size} bytes"
+                return result
+
+            # the size is already known to match, only the digest is left to compare
+            digest, result.method = self._checksum(sftp, backup.path, manifest.algorithm)
+            if digest != manifest.digest:
+                result.status = 'corrupted'
+                result.error = f"{manifest.algorithm} checksum mismatch"
+                return result
+
+            if backup.path.suffix in BACKUP_INDEXES:
+                # the index matches its manifest, the files it refers to are checked against the index
+                index = BACKUP_INDEXES[backup.path.suffix].loads(sftp.read_text(backup.path), backup.path)
+                result.size = index.size
+                result.error = self._verify_index_files(sftp, backup, index)
+                if result.error is not None:
+                    result.status = 'corrupted'
+        except (SftpError, RuntimeError, IOError) as e:
+            result.status = 'failed'
+            result.error = str(e)
+        finally:
+            result.seconds = round(monotonic() - started_at, 2)
+
+        return result
+
+    def _verify_index_files(
+        self,
+        sftp: Sftp,
+        backup: Backup,
+        index: Union[ChunkIndex, PartIndex, ShardIndex]
+    ) -> Union[str, None]:
+        """ Why the parts, shards or chunks of a backup don't match its index, None if they do """
+
+        if isinstance(index, ChunkIndex):
+            # a chunk is named after its checksum and checked as it's downloaded, only its presence is checked here
+            chunk_store = RemoteChunkStore(sftp, PurePath(backup.destination.path, CHUNKS_DIR_NAME))
+            missing_ids = chunk_store.missing(index.chunk_ids)
+            chunks_count = len(set(index.chunk_ids))
+            return f"{len(missing_ids)} of {chunks_count} chunks missing" if len(missing_ids) > 0 else None
+
+        for part in index.parts:
+            part_manifest = index.part_manifest(part)
+            part_path = backup.path.parent / part_manifest.filename
+            try:
+                size = sftp.sftp_client.stat(str(part_path)).st_size
+            except IOError:
+                return f"{part_manifest.filename} missing"
+            if size != part_manifest.size:
+                return f"{part_manifest.filename}: size {size} bytes, expected {part_manifest.size} bytes"
+
+            digest, _ = self._checksum(sftp, part_path, part_manifest.algorithm)
+            if digest != part_manifest.digest:
+                return f"{part_manifest.filename}: {part_manifest.algorithm} checksum mismatch"
+
+        return None
+
+    def _checksum(self, sftp: Sftp, remote_path: PurePath, algorithm: str) -> tuple:
+        """ (digest, method) of a file on the storage, hashed on the storage host or read over SFTP """
+
+        digest = sftp.remote_checksum(remote_path, algorithm)
+        if digest is not None:
+            return digest, 'ssh'
+
+        rate_limiter = self._throttle.network if self._throttle else None
+        return sftp.read_checksum(remote_path, algorithm, rate_limiter=rate_limiter), 'sftp'
+
+    def _sftp(self, destination: SftpConfig) -> Sftp:
+        if not hasattr(self._local, 'connections'):
+            self._local.connections = {}
+
+        sftp = self._local.connections.get(destination)
+        if sftp is None or not sftp.is_active:
+            sftp = Sftp(destination)
+            self._local.connections[destination] = sftp
+            with self._connections_lock:
+                self._connections.append(sftp)
+
+        return sftp
+
+    def _print_summary(self) -> None:
+        styles = {'ok': 'green3', 'no manifest': 'dark_orange'}
+        print_summary(
+            'SFTP backups verification',
+            (
+                Column('Storage', no_wrap=True),
+                Column('Backup', no_wrap=True),
+                Column('Size', justify='right'),
+                Column('Status'),
+                Column('Method'),
+                Column('Time', justify='right'),
+                Column('Error')
+            ),
+            (
+                (
+                    result.destination,
+                    PurePath(result.path).name,
+                    naturalsize(result.size),
+                    Text(result.status, styles.get(result.status, 'bright_red')),
+                    result.method or '-',
+                    f"{result.seconds}s",
+                    result.error or ''
+                )
+                for result in self.results
+            )
+        )
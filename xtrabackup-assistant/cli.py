@@ -1,6 +1,7 @@
-from argparse import ArgumentParser
+from argparse import ArgumentParser, Namespace
 
 from assistant import Command
+from constants import RESTORE_STAGES
 
 
 class Cli:
@@ -9,6 +10,7 @@ class Cli:
         self._version = version
 
         self._parser = ArgumentParser(description=f"{self._name} v{self._version}")
+        self._args = None
 
     def register_arguments(self):
         self._parser.add_argument('--version', action='version', version=f"{self._name} v{self._version}")
@@ -21,14 +23,120 @@ class Cli:
             help="upload a dump to SFTP storage",
             dest='upload'
         )
+        create_subparser.add_argument(
+            '--targets',
+            nargs='*',
+            metavar='NAME',
+            help="back up the config targets concurrently (all of them if no names given)",
+            dest='targets'
+        )
 
-        subparsers.add_parser(str(Command.RESTORE), help='restore database dump')
+        restore_subparser = subparsers.add_parser(str(Command.RESTORE), help='restore database dump')
+        # the target backup without a prompt, for automation
+        target_group = restore_subparser.add_mutually_exclusive_group()
+        target_group.add_argument(
+            '--at',
+            metavar='DATETIME',
+            help="restore the newest backup taken at or before 'YYYY-MM-DD HH:MM:SS'",
+            dest='at'
+        )
+        target_group.add_argument(
+            '--latest',
+            action='store_true',
+            help="restore the latest backup found on the local disk and the storages",
+            dest='latest'
+        )
+        target_group.add_argument(
+            '--file',
+            metavar='FILENAME',
+            help="restore the backup with the filename, e.g. 2024-01-01-03-00_project_8.0.35-27.tar",
+            dest='filename'
+        )
+        restore_subparser.add_argument(
+            '--pitr',
+            action='store_true',
+            help="point-in-time recovery: decode the binary logs from the backup up to the --at time for a replay",
+            dest='pitr'
+        )
+        restore_subparser.add_argument(
+            '--from-stage',
+            choices=RESTORE_STAGES,
+            help="run the restore from the stage on, the stages before it are completed by a previous run",
+            dest='from_stage'
+        )
+        restore_subparser.add_argument(
+            '--clean',
+            action='store_true',
+            help="remove the state and the files of a previous restore and start over",
+            dest='clean'
+        )
+        restore_subparser.add_argument(
+            '--apply',
+            action='store_true',
+            help="move the prepared backup into the MySQL datadir ('xtrabackup.datadir', MySQL stopped)",
+            dest='apply'
+        )
         subparsers.add_parser(str(Command.ROTATE), help='rotate backups (remove old)')
+        verify_subparser = subparsers.add_parser(
+            str(Command.VERIFY),
+            help='verify SFTP backups against their checksums without downloading them'
+        )
+        verify_subparser.add_argument(
+            '--workers',
+            type=int,
+            metavar='N',
+            help="how many backups are verified at the same time (default 4)",
+            dest='workers'
+        )
+        check_subparser = subparsers.add_parser(
+            str(Command.CHECK),
+            help='check that local backups are restorable without restoring them'
+        )
+        check_subparser.add_argument(
+            'archives',
+            nargs='*',
+            metavar='ARCHIVE',
+            help="backup archives to check (all local backups if none given)"
+        )
+        check_subparser.add_argument(
+            '--workers',
+            type=int,
+            metavar='N',
+            help="how many backups are checked at the same time (default 4)",
+            dest='workers'
+        )
+
+        daemon_subparser = subparsers.add_parser(str(Command.DAEMON), help='run scheduled jobs in a long-lived process')
+        daemon_subparser.add_argument(
+            '--status',
+            action='store_true',
+            help="print the state of the running daemon and its jobs",
+            dest='status'
+        )
+
+        subparsers.add_parser(
+            str(Command.BINLOG),
+            help='stream binary logs to the backups storage continuously (point-in-time recovery)'
+        )
 
     def get_command(self) -> Command:
-        args = self._parser.parse_args()
+        args = self._parse_args()
         command = Command(args.command)
         if command is Command.CREATE and args.upload:
             command = Command.CREATE_UPLOAD
+        elif command is Command.DAEMON and args.status:
+            command = Command.DAEMON_STATUS
 
         return command
+
+    def get_options(self) -> dict:
+        """ Command options besides the ones mapped to the command itself """
+
+        args = vars(self._parse_args())
+        return {name: value for name, value in args.items() if name not in ('command', 'upload', 'status')}
+
+    def _parse_args(self) -> Namespace:
+        if self._args is None:
+            self._args = self._parser.parse_args()
+
+        return self._args
@@ -1,4 +1,26 @@
+from utils import lazy_getattr
 from .enviroment import Environment
 from .xtrabackup_message import XtrabackupMessage
-from .backup import Backup
-from .backup_list import BackupList
+from .datadir_estimate import DatadirEstimate
+from .datadir_mover import DatadirMover
+from .chunk_store import ChunkIndex, ChunkStore, ChunkingWriter, RemoteChunkStore, CHUNKS_DIR_NAME
+from .part_set import PartIndex, PartWriter, PartReader
+from .shard_set import ShardIndex, ShardPlan, XbstreamSharder
+from .backup import Backup, BACKUP_FILE_PATTERN, BACKUP_INDEXES, find_local_backups
+from .manifest import Manifest
+from .xbstream_scanner import XbstreamScanner
+from .binlog_scanner import BinlogScanner
+from .binlog_index import BinlogIndex, BINLOGS_DIR_NAME
+from .restore_state import RestoreState
+from .run_history import RunHistory
+from .capacity_plan import CapacityPlan
+
+# the upload pulls in paramiko, the pipeline and the list rich widgets, so they are imported on first use only
+_LAZY_ATTRIBUTES = {
+    'XtrabackupLogPipeline': '.xtrabackup_log_pipeline',
+    'BackupList': '.backup_list',
+    'FanOutUpload': '.fan_out_upload',
+    'UploadFile': '.fan_out_upload',
+}
+
+__getattr__ = lazy_getattr(__name__, _LAZY_ATTRIBUTES)
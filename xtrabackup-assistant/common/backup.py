@@ -1,14 +1,30 @@
+import re
 from datetime import datetime
-from pathlib import PurePath
+from pathlib import Path, PurePath
+from typing import Union
 
 from humanize import naturalsize
 
+from configs import SftpConfig
+from .chunk_store import ChunkIndex
+from .manifest import Manifest
+from .part_set import PartIndex
+from .shard_set import ShardIndex
+
+# tar archives, chunk indexes of deduplicated backups, part indexes of split backups and shard indexes
+BACKUP_FILE_PATTERN = re.compile(r'\.(tar|chunks|parts|shards)$')
+# backups stored as an index, as large as the archive(s) the index refers to
+BACKUP_INDEXES = {ChunkIndex.SUFFIX: ChunkIndex, PartIndex.SUFFIX: PartIndex, ShardIndex.SUFFIX: ShardIndex}
+
 
 class Backup:
-    def __init__(self, source: str, path: PurePath, size: int):
+    def __init__(self, source: str, path: PurePath, size: int, destination: Union[SftpConfig, None] = None):
         self.source = source
         self.path = path
         self.size = naturalsize(size)
+        self.size_bytes = size
+        # the SFTP destination a backup is stored on
+        self.destination = destination
 
     @property
     def date(self) -> str:
@@ -22,6 +38,40 @@ class Backup:
     def filename(self) -> str:
         return self.path.name
 
+    @property
+    def is_deduplicated(self) -> bool:
+        return self.path.suffix == ChunkIndex.SUFFIX
+
+    @property
+    def is_split(self) -> bool:
+        return self.path.suffix == PartIndex.SUFFIX
+
+    @property
+    def is_sharded(self) -> bool:
+        return self.path.suffix == ShardIndex.SUFFIX
+
+    @property
+    def has_parts(self) -> bool:
+        """ Stored as files listed by its index (the parts of a split backup, the shards of a sharded one) """
+
+        return self.is_split or self.is_sharded
+
+    @property
+    def manifest_path(self) -> PurePath:
+        return Manifest.path_for(self.path)
+
     @property
     def mysql_version(self) -> str:
         return self.path.stem.split('_')[-1]
+
+
+def find_local_backups(dir_path: Path) -> list:
+    backups = []
+    for path in dir_path.rglob('*'):
+        if BACKUP_FILE_PATTERN.search(path.name) is None:
+            continue
+        # a deduplicated, split or sharded backup is as large as the archive(s) its index refers to
+        size = BACKUP_INDEXES[path.suffix].load(path).size if path.suffix in BACKUP_INDEXES else path.stat().st_size
+        backups.append(Backup(source='local', path=path, size=size))
+
+    return backups
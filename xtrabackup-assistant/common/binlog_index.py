@@ -0,0 +1,76 @@
+import json
+from dataclasses import dataclass, asdict, field
+from pathlib import Path, PurePath
+from typing import Union
+
+from .manifest import Manifest
+
+BINLOGS_DIR_NAME = 'binlogs'
+
+
+@dataclass
+class BinlogIndex:
+    """
+    The binary logs streamed from a server, in order, with the time range and the GTIDs of each.
+    Stored next to the (compressed) binary logs: <storage path>/binlogs/<project name>/index.json
+    """
+
+    FILENAME = 'index.json'
+
+    # [{name, filename, size, algorithm, digest, first_event_at, last_event_at, gtids}, ...]
+    binlogs: list = field(default_factory=list)
+
+    @property
+    def names(self) -> list:
+        return [binlog['name'] for binlog in self.binlogs]
+
+    def add(self, binlog: dict) -> None:
+        self.binlogs = [entry for entry in self.binlogs if entry['name'] != binlog['name']]
+        self.binlogs.append(binlog)
+        self.binlogs.sort(key=lambda entry: entry['name'])
+
+    def range(self, start_name: str, until: str) -> list:
+        """ The binary logs to replay from the given one up to the time (the last of them may go past it) """
+
+        if start_name not in self.names:
+            raise RuntimeError(f"Binary log {start_name} is not streamed (not in the binary log index)")
+
+        binlogs = []
+        for binlog in self.binlogs[self.names.index(start_name):]:
+            if len(binlogs) > 0 and binlog['first_event_at'] is not None and binlog['first_event_at'] > until:
+                break
+            binlogs.append(binlog)
+
+        return binlogs
+
+    @staticmethod
+    def manifest(binlog: dict) -> Manifest:
+        return Manifest(
+            filename=binlog['filename'],
+            size=binlog['size'],
+            algorithm=binlog['algorithm'],
+            digest=binlog['digest'],
+            created_at=binlog['last_event_at'] or ''
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> 'BinlogIndex':
+        if not path.exists():
+            return cls()
+
+        with open(path, 'r') as index_file:
+            return cls.loads(index_file.read(), path)
+
+    @classmethod
+    def loads(cls, data: str, path: PurePath) -> 'BinlogIndex':
+        try:
+            return cls(**json.loads(data))
+        except (ValueError, TypeError) as e:
+            raise RuntimeError(f"Invalid binary log index {path}: {e}")
+
+    def save(self, path: Path) -> None:
+        with open(path, 'w') as index_file:
+            json.dump(asdict(self), index_file, indent=2)
+
+    def latest(self) -> Union[dict, None]:
+        return self.binlogs[-1] if len(self.binlogs) > 0 else None
@@ -0,0 +1,79 @@
+import struct
+import uuid
+from datetime import datetime
+from typing import IO, Union
+
+# event layout (binlog format v4): timestamp, type, server id, event size, next event position, flags, body;
+# GTID events start with the commit flag, the source UUID and the transaction number
+BINLOG_MAGIC = b'\xfebin'
+EVENT_HEADER = struct.Struct('<IBIIIH')
+GTID_BODY = struct.Struct('<B16sq')
+GTID_LOG_EVENT = 33
+
+
+class BinlogScanner:
+    """
+    Reads a binary log event headers only (the bodies are skipped, except of the GTID events) and collects the time
+    range of its events and the GTIDs of its transactions.
+    """
+
+    TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+    def __init__(self, stream: IO[bytes]):
+        self._stream = stream
+
+        self.events_count = 0
+        self.first_event_at: Union[str, None] = None
+        self.last_event_at: Union[str, None] = None
+
+        # source UUID => [[first transaction, last transaction], ...]
+        self._gtids = {}
+
+    @property
+    def gtids(self) -> str:
+        """ The GTID set of the transactions, in the MySQL notation: 'uuid:1-10:12,uuid:5' """
+
+        return ','.join(
+            f"{source}:" + ':'.join(str(first) if first == last else f"{first}-{last}" for first, last in intervals)
+            for source, intervals in sorted(self._gtids.items())
+        )
+
+    def scan(self) -> "BinlogScanner":
+        if self._stream.read(len(BINLOG_MAGIC)) != BINLOG_MAGIC:
+            raise RuntimeError('Not a binary log (invalid magic number)')
+
+        first_timestamp, last_timestamp = None, None
+        while True:
+            header = self._stream.read(EVENT_HEADER.size)
+            if len(header) == 0:
+                break
+            if len(header) < EVENT_HEADER.size:
+                raise RuntimeError(f"Binary log is truncated after {self.events_count} events")
+
+            timestamp, event_type, _, event_size, _, _ = EVENT_HEADER.unpack(header)
+            body_size = event_size - EVENT_HEADER.size
+            if event_type == GTID_LOG_EVENT:
+                body = self._stream.read(GTID_BODY.size)
+                self._add_gtid(*GTID_BODY.unpack(body)[1:])
+                body_size -= len(body)
+            self._stream.seek(body_size, 1)
+            self.events_count += 1
+
+            # events generated by the server itself (e.g. the rotate event of a fresh stream) have no timestamp
+            if timestamp > 0:
+                first_timestamp = timestamp if first_timestamp is None else min(first_timestamp, timestamp)
+                last_timestamp = timestamp if last_timestamp is None else max(last_timestamp, timestamp)
+
+        if first_timestamp is not None:
+            self.first_event_at = datetime.fromtimestamp(first_timestamp).strftime(self.TIME_FORMAT)
+            self.last_event_at = datetime.fromtimestamp(last_timestamp).strftime(self.TIME_FORMAT)
+
+        return self
+
+    def _add_gtid(self, source: bytes, transaction: int) -> None:
+        intervals = self._gtids.setdefault(str(uuid.UUID(bytes=source)), [])
+        # transactions of a source come in order, so the last interval is extended most of the time
+        if len(intervals) > 0 and intervals[-1][1] + 1 == transaction:
+            intervals[-1][1] = transaction
+        else:
+            intervals.append([transaction, transaction])
@@ -0,0 +1,74 @@
+import os
+import shutil
+from pathlib import Path
+from typing import Union
+
+from humanize import naturalsize, naturaldelta
+
+from constants import ROOT_DIR
+
+
+class CapacityPlan:
+    """
+    The space a run is going to write to every dir, checked against the free space of their filesystems (the dirs on
+    the same filesystem add up), and the time it's expected to take.
+    """
+
+    # on top of the predicted sizes: the prediction is a median of the previous runs, the data grows meanwhile
+    MARGIN = 1.1
+
+    def __init__(self, needs: dict, seconds: Union[float, None] = None):
+        # dir => bytes
+        self.needs = {path: int(size) for path, size in needs.items() if size > 0}
+        self.seconds = seconds
+
+    @property
+    def fits(self) -> bool:
+        return len(self.shortages()) == 0
+
+    def shortages(self) -> list:
+        """ [(dirs, bytes needed, bytes free), ...] of the filesystems without enough free space """
+
+        filesystems = {}
+        for path, size in self.needs.items():
+            device = os.stat(self._existing(path)).st_dev
+            paths, needed = filesystems.get(device, ([], 0))
+            filesystems[device] = ([*paths, path], needed + int(size * self.MARGIN))
+
+        shortages = []
+        for paths, needed in filesystems.values():
+            free = shutil.disk_usage(self._existing(paths[0])).free
+            if needed > free:
+                shortages.append((paths, needed, free))
+
+        return shortages
+
+    def describe(self) -> str:
+        needs = ', '.join(f"{naturalsize(size)} in {self._name(path)}" for path, size in self.needs.items())
+        description = needs if needs != '' else 'no extra space'
+        if self.seconds is not None:
+            description += f", about {naturaldelta(self.seconds)}"
+
+        return description
+
+    @staticmethod
+    def describe_shortages(shortages: list) -> str:
+        return '; '.join(
+            f"{', '.join(CapacityPlan._name(path) for path in paths)}: {naturalsize(needed)} needed, "
+            f"{naturalsize(free)} free"
+            for paths, needed, free in shortages
+        )
+
+    @staticmethod
+    def _existing(path: Path) -> Path:
+        # a dir created by the run itself is on the filesystem of its nearest existing parent
+        path = Path(path)
+        while not path.exists() and path != path.parent:
+            path = path.parent
+
+        return path
+
+    @staticmethod
+    def _name(path: Path) -> str:
+        # the data dirs relative to the assistant (data/tmp/<project>), the others (a datadir) in full
+        return str(Path(path).relative_to(ROOT_DIR)) if Path(path).is_relative_to(ROOT_DIR) else str(path)
@@ -0,0 +1,285 @@
+import hashlib
+import io
+import json
+import os
+import stat
+import tempfile
+import time
+from dataclasses import dataclass, asdict
+from pathlib import Path, PurePath
+from typing import Callable, Union
+
+from utils import Chunker, TokenBucket
+
+# chunks are addressed by the hash of their content, independently of the configured archive checksum
+CHUNK_HASH = 'sha256'
+CHUNK_ID_LENGTH = hashlib.new(CHUNK_HASH).digest_size * 2
+CHUNKS_DIR_NAME = 'chunks'
+
+
+def is_chunk_id(name: str) -> bool:
+    return len(name) == CHUNK_ID_LENGTH and all(char in '0123456789abcdef' for char in name)
+
+
+@dataclass
+class ChunkIndex:
+    """ A deduplicated backup: the chunks its archive is made of, stored in place of the archive itself """
+
+    SUFFIX = '.chunks'
+
+    # the archive the chunks make up
+    filename: str
+    size: int
+    # [[chunk id, size], ...] in the archive order
+    chunks: list
+
+    @property
+    def chunk_ids(self) -> list:
+        return [chunk_id for chunk_id, _ in self.chunks]
+
+    @classmethod
+    def load(cls, path: Path) -> 'ChunkIndex':
+        with open(path, 'r') as index_file:
+            return cls.loads(index_file.read(), path)
+
+    @classmethod
+    def loads(cls, data: str, path: PurePath) -> 'ChunkIndex':
+        try:
+            return cls(**json.loads(data))
+        except (ValueError, TypeError) as e:
+            raise RuntimeError(f"Invalid backup chunk index {path}: {e}")
+
+    def save(self, path: Path) -> None:
+        with open(path, 'w') as index_file:
+            json.dump(asdict(self), index_file)
+
+
+class ChunkStore:
+    """ Local content-addressed chunk storage: <root>/<first 2 chars of the id>/<id> """
+
+    # seconds a chunk is kept unreferenced: a backup started while the chunks are collected has no index yet
+    GARBAGE_GRACE_PERIOD = 24 * 60 * 60
+
+    def __init__(self, root_path: Path):
+        self._root_path = root_path
+
+    def path_for(self, chunk_id: str) -> Path:
+        return Path(self._root_path, chunk_id[:2], chunk_id)
+
+    def has(self, chunk_id: str) -> bool:
+        return self.path_for(chunk_id).exists()
+
+    def put(self, chunk_id: str, data: bytes) -> bool:
+        """ Store a chunk unless it's stored already, True if it's new """
+
+        chunk_path = self.path_for(chunk_id)
+        if chunk_path.exists():
+            try:
+                # reused by a backup without an index yet, the chunk is in the grace period again
+                os.utime(chunk_path)
+                return False
+            except FileNotFoundError:
+                # collected in the meantime, it's written again
+                pass
+
+        chunk_path.parent.mkdir(parents=True, exist_ok=True)
+        # written aside and renamed, so a chunk under its id is always complete (even if backups run side by side)
+        with tempfile.NamedTemporaryFile(dir=chunk_path.parent, prefix='.', suffix='.tmp', delete=False) as temp_file:
+            temp_file.write(data)
+        os.replace(temp_file.name, chunk_path)
+
+        return True
+
+    def open(self, index: ChunkIndex) -> 'ChunkReader':
+        return ChunkReader(self, index)
+
+    def collect_garbage(self, referenced_ids: set) -> tuple:
+        """
+        Delete the chunks no backup refers to, (count, size) of the deleted ones. The chunks written or reused within
+        the grace period are kept.
+        """
+
+        deleted_count, deleted_size = 0, 0
+        if not self._root_path.exists():
+            return deleted_count, deleted_size
+
+        collected_before = time.time() - self.GARBAGE_GRACE_PERIOD
+        for prefix_dir_path in self._root_path.iterdir():
+            if not prefix_dir_path.is_dir():
+                continue
+            for chunk_path in prefix_dir_path.iterdir():
+                if not is_chunk_id(chunk_path.name) or chunk_path.name in referenced_ids:
+                    continue
+                chunk_stat = chunk_path.stat()
+                if chunk_stat.st_mtime > collected_before:
+                    continue
+                chunk_path.unlink()
+                deleted_count += 1
+                deleted_size += chunk_stat.st_size
+            if not any(prefix_dir_path.iterdir()):
+                prefix_dir_path.rmdir()
+
+        return deleted_count, deleted_size
+
+
+class ChunkingWriter:
+    """ File object splitting everything written into content-defined chunks, stored in the chunk store """
+
+    def __init__(self, store: ChunkStore, average_chunk_size: int):
+        self._store = store
+        self._chunker = Chunker(average_chunk_size)
+
+        self.chunks = []
+        self.size = 0
+        self.new_chunks_count = 0
+        self.new_chunks_size = 0
+
+    def write(self, data: bytes) -> int:
+        for chunk in self._chunker.feed(data):
+            self._store_chunk(chunk)
+        self.size += len(data)
+
+        return len(data)
+
+    def tell(self) -> int:
+        return self.size
+
+    def close(self) -> None:
+        for chunk in self._chunker.finish():
+            self._store_chunk(chunk)
+
+    def _store_chunk(self, chunk: bytes) -> None:
+        chunk_id = hashlib.new(CHUNK_HASH, chunk).hexdigest()
+        if self._store.put(chunk_id, chunk):
+            self.new_chunks_count += 1
+            self.new_chunks_size += len(chunk)
+        self.chunks.append([chunk_id, len(chunk)])
+
+
+class ChunkReader:
+    """ Read-only file object reassembling an archive from its chunks """
+
+    def __init__(self, store: ChunkStore, index: ChunkIndex):
+        self._store = store
+        self._chunk_ids = index.chunk_ids
+
+        self._next_chunk = 0
+        self._file = None
+
+    def read(self, size: int = -1) -> bytes:
+        data = bytearray()
+        while size < 0 or len(data) < size:
+            if self._file is None:
+                if self._next_chunk == len(self._chunk_ids):
+                    break
+                self._file = self._open_chunk(self._chunk_ids[self._next_chunk])
+                self._next_chunk += 1
+
+            chunk_data = self._file.read(-1 if size < 0 else size - len(data))
+            if len(chunk_data) == 0:
+                self._file.close()
+                self._file = None
+                continue
+            data += chunk_data
+
+        return bytes(data)
+
+    def _open_chunk(self, chunk_id: str):
+        try:
+            return open(self._store.path_for(chunk_id), 'rb')
+        except FileNotFoundError:
+            raise RuntimeError(f"Missing backup chunk {chunk_id}")
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> "ChunkReader":
+        return self
+
+    def __exit__(self, e_type, value, traceback):
+        self.close()
+
+
+class RemoteChunkStore:
+    """ The chunk store on SFTP storage, the same layout as the local one """
+
+    # seconds a chunk is kept unreferenced: it may be uploaded by a backup of another host or target right now, whose
+    # index isn't there yet (the job lock is local)
+    GARBAGE_GRACE_PERIOD = ChunkStore.GARBAGE_GRACE_PERIOD
+    PARTIAL_SUFFIX = '.partial'
+
+    def __init__(self, sftp, root_path: PurePath):
+        self._sftp = sftp
+        self._root_path = root_path
+
+    def path_for(self, chunk_id: str) -> PurePath:
+        return PurePath(self._root_path, chunk_id[:2], chunk_id)
+
+    def missing(self, chunk_ids: list) -> list:
+        """ The chunks the storage doesn't have yet, one listing per id prefix instead of a request per chunk """
+
+        existing_ids = set()
+        for prefix in sorted({chunk_id[:2] for chunk_id in chunk_ids}):
+            try:
+                existing_ids.update(self._sftp.sftp_client.listdir(str(PurePath(self._root_path, prefix))))
+            except IOError:
+                continue
+
+        return list(dict.fromkeys(chunk_id for chunk_id in chunk_ids if chunk_id not in existing_ids))
+
+    def download(
+        self,
+        store: ChunkStore,
+        chunk_ids: list,
+        rate_limiter: Union[TokenBucket, None] = None,
+        on_chunk: Union[Callable[[int], None], None] = None
+    ) -> None:
+        for chunk_id in chunk_ids:
+            buffer = io.BytesIO()
+            self._sftp.sftp_client.getfo(str(self.path_for(chunk_id)), buffer)
+            data = buffer.getvalue()
+            if rate_limiter is not None:
+                rate_limiter.consume(len(data))
+
+            # the id is the checksum, a damaged chunk never gets into the local store
+            if hashlib.new(CHUNK_HASH, data).hexdigest() != chunk_id:
+                raise RuntimeError(f"Checksum mismatch of the downloaded backup chunk {chunk_id}")
+            store.put(chunk_id, data)
+
+            if on_chunk is not None:
+                on_chunk(len(data))
+
+    def collect_garbage(self, referenced_ids: set) -> tuple:
+        """
+        Delete the chunks no backup refers to, (count, size) of the deleted chunks. The uploads in progress
+        (.partial files) and the chunks written within the grace period are kept.
+        """
+
+        deleted_count, deleted_size = 0, 0
+        collected_before = time.time() - self.GARBAGE_GRACE_PERIOD
+        try:
+            prefix_dirs = self._sftp.sftp_client.listdir_attr(str(self._root_path))
+        except IOError:
+            return deleted_count, deleted_size
+
+        for prefix_dir in prefix_dirs:
+            if not stat.S_ISDIR(prefix_dir.st_mode):
+                continue
+            prefix_dir_path = PurePath(self._root_path, prefix_dir.filename)
+            entries = self._sftp.sftp_client.listdir_attr(str(prefix_dir_path))
+            kept_count = 0
+            for entry in entries:
+                if entry.filename in referenced_ids or entry.filename.endswith(self.PARTIAL_SUFFIX) or \
+                        (entry.st_mtime or 0) > collected_before:
+                    kept_count += 1
+                    continue
+                self._sftp.sftp_client.remove(str(PurePath(prefix_dir_path, entry.filename)))
+                if is_chunk_id(entry.filename):
+                    deleted_count += 1
+                    deleted_size += entry.st_size
+            if kept_count == 0:
+                self._sftp.sftp_client.rmdir(str(prefix_dir_path))
+
+        return deleted_count, deleted_size
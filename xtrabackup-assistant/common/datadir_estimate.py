@@ -0,0 +1,95 @@
+import os
+import subprocess
+from pathlib import Path
+from typing import Union
+
+from configs import XtrabackupConfig
+
+LOCAL_HOSTS = ('localhost', '127.0.0.1', '::1')
+
+# tablespace files as xtrabackup names them (./db/table.ibd) with their allocated size
+FILES_QUERY = (
+    "SELECT FILE_NAME, TOTAL_EXTENTS * EXTENT_SIZE FROM information_schema.FILES "
+    "WHERE FILE_NAME IS NOT NULL AND FILE_TYPE <> 'TEMPORARY'"
+)
+
+
+class DatadirEstimate:
+    """
+    Sizes of the files xtrabackup is going to copy, keyed by the path relative to the datadir ('./db/table.ibd').
+    Scanned from the datadir itself on local hosts, taken from information_schema otherwise.
+    """
+
+    QUERY_TIMEOUT = 30
+
+    def __init__(self, config: XtrabackupConfig):
+        self._config = config
+
+        self.source: Union[str, None] = None
+        self.files: dict = {}
+
+        datadir, tablespaces = self._query_server()
+        if datadir is not None and self._config.host in LOCAL_HOSTS and os.access(datadir, os.R_OK | os.X_OK):
+            self.files = self._scan_datadir(Path(datadir))
+            self.source = 'datadir'
+        elif len(tablespaces) > 0:
+            self.files = tablespaces
+            self.source = 'information_schema'
+
+    @property
+    def is_available(self) -> bool:
+        return self.source is not None
+
+    @property
+    def total_size(self) -> int:
+        return sum(self.files.values())
+
+    def _query_server(self) -> tuple:
+        """ (datadir, tablespace sizes) from the server, (None, {}) if it can't be queried """
+
+        command_options = (
+            f"--user={self._config.user}",
+            f"--host={self._config.host}",
+            '--batch',
+            '--skip-column-names',
+            '--execute', f"SELECT '@@datadir', @@datadir; {FILES_QUERY};"
+        )
+        try:
+            command = subprocess.run(
+                ['mysql', *command_options],
+                capture_output=True,
+                timeout=self.QUERY_TIMEOUT,
+                # keeps the password out of the process list and the 'insecure password' warning out of stderr
+                env={**os.environ, 'MYSQL_PWD': self._config.password}
+            )
+        except (OSError, subprocess.TimeoutExpired):
+            return None, {}
+        if command.returncode != 0:
+            return None, {}
+
+        datadir = None
+        tablespaces = {}
+        for row in command.stdout.decode('utf-8', errors='replace').splitlines():
+            name, _, size = row.partition('\t')
+            if name == '@@datadir':
+                datadir = size
+            elif size.isdigit():
+                tablespaces[name] = tablespaces.get(name, 0) + int(size)
+
+        return datadir, tablespaces
+
+    @staticmethod
+    def _scan_datadir(datadir: Path) -> dict:
+        files = {}
+
+        for dir_path, _, file_names in os.walk(datadir):
+            relative_dir = os.path.relpath(dir_path, datadir)
+            for file_name in file_names:
+                try:
+                    size = os.stat(os.path.join(dir_path, file_name)).st_size
+                except OSError:
+                    continue
+                relative_path = file_name if relative_dir == '.' else os.path.join(relative_dir, file_name)
+                files[f"./{relative_path}"] = size
+
+        return files
@@ -0,0 +1,166 @@
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Union, Callable
+
+# left in the restore dir: the backup metadata (binary log position for a replay, ...), not a part of the datadir
+METADATA_FILE_PATTERN = re.compile(r'^(xtrabackup_.*|backup-my\.cnf)$')
+# a datadir on a volume of its own has it, it doesn't make the datadir not empty
+IGNORED_DATADIR_ENTRIES = ('lost+found',)
+
+
+class DatadirMover:
+    """
+    Moves a prepared backup into the MySQL datadir. On the same filesystem the entries are renamed (seconds whatever
+    the size), otherwise the files are copied by parallel workers (copy_file: reflink, copy_file_range, sendfile) and
+    fsynced in batches, the copied files are removed by the caller once the whole backup is in place.
+    """
+
+    # bytes copied between the fsyncs of the files, the dirty pages don't pile up till the end
+    FSYNC_BATCH_SIZE = 1024 * 1024 * 1024
+
+    def __init__(self, source_dir_path: Path, datadir_path: Path, workers: int):
+        self._source_dir_path = source_dir_path
+        self._datadir_path = datadir_path
+        self._workers = workers
+
+        # the files are owned by the owner of the datadir (mysql), if the assistant can give them away
+        datadir_stat = datadir_path.stat()
+        self._owner = (datadir_stat.st_uid, datadir_stat.st_gid) \
+            if os.geteuid() == 0 and datadir_stat.st_uid != 0 else None
+
+        self._fsync_lock = threading.Lock()
+        self._fsync_batch: list = []
+        self._fsync_batch_size = 0
+
+    @property
+    def is_same_filesystem(self) -> bool:
+        return self._source_dir_path.stat().st_dev == self._datadir_path.stat().st_dev
+
+    @property
+    def entries(self) -> list:
+        """ The top level files and dirs moved, the names kept in the restore dir are the rest """
+
+        return sorted(
+            path for path in self._source_dir_path.iterdir()
+            if path.name != '.gitignore' and METADATA_FILE_PATTERN.match(path.name) is None
+        )
+
+    @property
+    def metadata_names(self) -> tuple:
+        return tuple(name for name in os.listdir(self._source_dir_path) if METADATA_FILE_PATTERN.match(name))
+
+    @property
+    def total_size(self) -> int:
+        return sum(os.lstat(path).st_size for path in self._files())
+
+    def datadir_entries(self) -> list:
+        return [name for name in os.listdir(self._datadir_path) if name not in IGNORED_DATADIR_ENTRIES]
+
+    def move(self, on_moved: Union[Callable[[int], None], None] = None) -> str:
+        """ Move the backup into the datadir, returns the method used """
+
+        if self.is_same_filesystem:
+            for path in self.entries:
+                size = sum(os.lstat(file_path).st_size for file_path in self._files(path))
+                target_path = Path(self._datadir_path, path.name)
+                os.rename(path, target_path)
+                self._chown_tree(target_path)
+                if on_moved is not None:
+                    on_moved(size)
+            self._fsync_dir(self._datadir_path)
+
+            return 'rename'
+
+        self._copy(on_moved)
+
+        return 'copy'
+
+    def _copy(self, on_moved: Union[Callable[[int], None], None]) -> None:
+        from utils import copy_file
+
+        # the dirs are created up front, the files of a dir are copied by several workers
+        target_dir_paths = [self._datadir_path]
+        for path in self.entries:
+            for dir_path, _, _ in os.walk(path):
+                target_dir_path = Path(self._datadir_path, Path(dir_path).relative_to(self._source_dir_path))
+                target_dir_path.mkdir(exist_ok=True)
+                self._chown(target_dir_path)
+                target_dir_paths.append(target_dir_path)
+
+        def copy(file_path: Path) -> None:
+            target_path = Path(self._datadir_path, file_path.relative_to(self._source_dir_path))
+            if file_path.is_symlink():
+                target_path.unlink(missing_ok=True)
+                target_path.symlink_to(os.readlink(file_path))
+                return
+
+            copy_file(file_path, target_path, on_copied=on_moved)
+            self._chown(target_path)
+            self._add_to_fsync_batch(target_path)
+
+        with ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix='datadir_copy') as executor:
+            # waits for all the files, raises the first error
+            list(executor.map(copy, self._files()))
+
+        self._fsync(self._fsync_batch)
+        for target_dir_path in target_dir_paths:
+            self._fsync_dir(target_dir_path)
+
+    def _files(self, path: Union[Path, None] = None) -> list:
+        """ The files (and symlinks) of an entry, of all the entries by default """
+
+        files = []
+        for entry_path in ([path] if path is not None else self.entries):
+            if entry_path.is_symlink() or not entry_path.is_dir():
+                files.append(entry_path)
+                continue
+            for dir_path, dirnames, filenames in os.walk(entry_path):
+                files += [Path(dir_path, filename) for filename in filenames]
+                files += [Path(dir_path, dirname) for dirname in dirnames if Path(dir_path, dirname).is_symlink()]
+
+        return files
+
+    def _add_to_fsync_batch(self, path: Path) -> None:
+        with self._fsync_lock:
+            self._fsync_batch.append(path)
+            self._fsync_batch_size += path.stat().st_size
+            if self._fsync_batch_size < self.FSYNC_BATCH_SIZE:
+                return
+            batch, self._fsync_batch, self._fsync_batch_size = self._fsync_batch, [], 0
+
+        # by the worker filling the batch up, the other ones keep copying
+        self._fsync(batch)
+
+    @staticmethod
+    def _fsync(paths: list) -> None:
+        for path in paths:
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    @staticmethod
+    def _fsync_dir(dir_path: Path) -> None:
+        fd = os.open(dir_path, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _chown(self, path: Path) -> None:
+        if self._owner is not None:
+            os.lchown(path, *self._owner)
+
+    def _chown_tree(self, path: Path) -> None:
+        if self._owner is None:
+            return
+
+        self._chown(path)
+        if path.is_dir() and not path.is_symlink():
+            for dir_path, dirnames, filenames in os.walk(path):
+                for name in (*dirnames, *filenames):
+                    self._chown(Path(dir_path, name))
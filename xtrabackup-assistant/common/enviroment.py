@@ -1,16 +1,25 @@
+import json
+import os
 import re
+import shutil
 import subprocess
+from typing import Union
 
 from rich.text import Text
 
+from constants import ENVIRONMENT_CACHE_PATH
 from utils import echo
 
 
 class Environment:
     def __init__(self):
+        self._cache = self._load_cache()
+
         self.mysql_version = self._get_mysql_server_version()
         self.xtrabackup_version = self._get_xtrabackup_version()
 
+        self._save_cache()
+
     def print_versions(self):
         echo(
             Text.assemble(
@@ -22,10 +31,17 @@ class Environment:
             time=False
         )
 
-    @staticmethod
-    def _get_mysql_server_version() -> str:
+    def _get_mysql_server_version(self) -> str:
+        binary_path = shutil.which('mysql')
+        if binary_path is None:
+            raise RuntimeError('Percona MySQL Server is missing!')
+
+        cached_version = self._cached_version(binary_path)
+        if cached_version is not None:
+            return cached_version
+
         try:
-            command = subprocess.run(['mysql', '--version'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            command = subprocess.run([binary_path, '--version'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
             mysql_server_about = command.stdout.decode('utf-8')
             mysql_server_version_match = re.search(r'Ver (\S+) for Linux', mysql_server_about)
             if mysql_server_version_match is None:
@@ -33,12 +49,19 @@ class Environment:
         except FileNotFoundError:
             raise RuntimeError('Percona MySQL Server is missing!')
 
-        return mysql_server_version_match.group(1)
+        return self._cache_version(binary_path, mysql_server_version_match.group(1))
+
+    def _get_xtrabackup_version(self) -> str:
+        binary_path = shutil.which('xtrabackup')
+        if binary_path is None:
+            raise RuntimeError('XtraBackup tool is missing!')
+
+        cached_version = self._cached_version(binary_path)
+        if cached_version is not None:
+            return cached_version
 
-    @staticmethod
-    def _get_xtrabackup_version() -> str:
         try:
-            command = subprocess.run(['xtrabackup', '--version'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            command = subprocess.run([binary_path, '--version'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
             xtrabackup_about = command.stdout.decode('utf-8')
             xtrabackup_version_match = re.search(r'xtrabackup version (\S+) based on MySQL server', xtrabackup_about)
             if xtrabackup_version_match is None:
@@ -46,4 +69,45 @@ class Environment:
         except FileNotFoundError:
             raise RuntimeError('XtraBackup tool is missing!')
 
-        return xtrabackup_version_match.group(1)
+        return self._cache_version(binary_path, xtrabackup_version_match.group(1))
+
+    def _cached_version(self, binary_path: str) -> Union[str, None]:
+        """ Return the cached version if the binary wasn't replaced since it was detected """
+
+        entry = self._cache.get(os.path.realpath(binary_path))
+        if entry is None or entry.get('fingerprint') != self._fingerprint(binary_path):
+            return None
+
+        return entry.get('version')
+
+    def _cache_version(self, binary_path: str, version: str) -> str:
+        self._cache[os.path.realpath(binary_path)] = {'fingerprint': self._fingerprint(binary_path), 'version': version}
+
+        return version
+
+    @staticmethod
+    def _fingerprint(binary_path: str) -> list:
+        # the cache is keyed on the resolved path and os.stat follows symlinks (e.g. /usr/bin/mysql -> alternatives),
+        # so both repointing the link and an upgrade of the target are noticed
+        binary_stat = os.stat(binary_path)
+        return [binary_stat.st_mtime_ns, binary_stat.st_size]
+
+    @staticmethod
+    def _load_cache() -> dict:
+        try:
+            with open(ENVIRONMENT_CACHE_PATH, 'r') as cache_file:
+                cache = json.load(cache_file)
+        except (OSError, ValueError):
+            return {}
+
+        return cache if isinstance(cache, dict) else {}
+
+    def _save_cache(self) -> None:
+        temp_cache_path = ENVIRONMENT_CACHE_PATH.with_suffix(f'.{os.getpid()}.tmp')
+        try:
+            with open(temp_cache_path, 'w') as cache_file:
+                json.dump(self._cache, cache_file)
+            os.replace(temp_cache_path, ENVIRONMENT_CACHE_PATH)
+        except OSError:
+            # the cache is an optimization only, a read-only data dir must not break the run
+            pass
@@ -0,0 +1,294 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from pathlib import Path, PurePath
+from typing import Union, Iterable, Iterator
+
+from paramiko.ssh_exception import SSHException
+from rich.progress import Progress, TextColumn, SpinnerColumn, BarColumn, DownloadColumn, TransferSpeedColumn
+
+from configs import SftpConfig
+from exceptions import SftpError
+from utils import Sftp, IoPriority, TokenBucket, echo_warning, logger
+
+
+class _Aborted(Exception):
+    pass
+
+
+@dataclass
+class UploadFile:
+    local_path: Path
+    # relative to the path of a destination
+    remote_path: PurePath
+    # all destinations if not set
+    destinations: Union[list, None] = None
+
+
+@dataclass
+class DestinationState:
+    config: SftpConfig
+    error: Union[str, None] = None
+    # connections not used by a file upload at the moment
+    idle_connections: list = field(default_factory=list)
+    created_dirs: set = field(default_factory=set)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    @property
+    def failed(self) -> bool:
+        return self.error is not None
+
+
+class FanOutUpload:
+    """
+    Uploads files to several SFTP destinations reading every file once: the blocks read are handed over to a writer
+    thread per destination through bounded queues, so memory stays bounded and the slowest destination sets the pace.
+    A destination failing a file retries it on its own (reading the file again), a destination out of retries is
+    skipped for the rest of the files. The upload fails if a required destination failed or no destination succeeded.
+
+    Files go in batches: a batch starts when the previous one is uploaded (e.g. an index after the files it refers to),
+    the files of a batch are uploaded by several workers concurrently, each with its own connections.
+    """
+
+    BLOCK_SIZE = 1024 * 1024
+    QUEUE_BLOCKS = 16
+
+    _END = None
+    _ABORT = object()
+
+    def __init__(
+        self,
+        destinations: list,
+        rate_limiter: Union[TokenBucket, None] = None,
+        interactive: bool = True,
+        workers: int = 1
+    ):
+        self._states = [DestinationState(destination) for destination in destinations]
+        self._rate_limiter = rate_limiter
+        self._interactive = interactive
+        self._workers = workers
+
+        self._progress: Union[Progress, None] = None
+        self._tasks = {}
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+    def upload(self, *batches: list) -> None:
+        files = [file for batch in batches for file in batch]
+
+        with ExitStack() as connections, Progress(
+            TextColumn('[blue][SFTP][/blue]'),
+            SpinnerColumn(),
+            TextColumn('[progress.description]{task.description}'),
+            BarColumn(),
+            DownloadColumn(),
+            TransferSpeedColumn(),
+            transient=True,
+            disable=not self._interactive
+        ) as progress:
+            self._progress = progress
+            for state in self._states:
+                total = sum(file.local_path.stat().st_size for file in files if self._is_destination(state, file))
+                self._tasks[state.config] = progress.add_task(
+                    f"[blue]Uploading to {state.config.label}...",
+                    total=total
+                )
+                try:
+                    # the job connection (a warm one in the daemon) is the first one of the pool
+                    state.idle_connections.append(connections.enter_context(Sftp.session(state.config)))
+                except SftpError as e:
+                    self._fail(state, e)
+
+            # connections opened by the workers and retries are closed along with the sessions
+            connections.callback(lambda: [sftp.close() for sftp in self._connections])
+
+            with ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix='sftp_upload') as executor:
+                for batch in batches:
+                    # waits for the whole batch, raises the first error of it
+                    list(executor.map(self._fan_out, batch))
+
+        self._check_results()
+
+    def _fan_out(self, file: UploadFile) -> None:
+        targets = [state for state in self._states if not state.failed and self._is_destination(state, file)]
+        if len(targets) == 0:
+            return
+
+        queues = {state.config: queue.Queue(maxsize=self.QUEUE_BLOCKS) for state in targets}
+        threads = [
+            threading.Thread(
+                target=self._receive,
+                args=(state, file, queues[state.config]),
+                name=f"sftp_upload_{state.config.label}_thread"
+            )
+            for state in targets
+        ]
+        for thread in threads:
+            thread.start()
+
+        end = self._ABORT
+        try:
+            with IoPriority.uncached(open(file.local_path, 'rb')) as local_file:
+                for block in iter(lambda: local_file.read(self.BLOCK_SIZE), b''):
+                    for block_queue in queues.values():
+                        block_queue.put(block)
+            end = self._END
+        finally:
+            # an aborted read (error, terminate signal) never gets a partial file renamed on the storage
+            for block_queue in queues.values():
+                block_queue.put(end)
+            for thread in threads:
+                thread.join()
+
+    def _blocks(self, block_queue: queue.Queue) -> Iterator[bytes]:
+        while True:
+            block = block_queue.get()
+            if block is self._END:
+                return
+            if block is self._ABORT:
+                raise _Aborted()
+            yield block
+
+    def _receive(self, state: DestinationState, file: UploadFile, block_queue: queue.Queue) -> None:
+        remote_path = PurePath(state.config.path, file.remote_path)
+        blocks = self._blocks(block_queue)
+        uploaded = [0]
+
+        sftp = None
+        try:
+            sftp = self._acquire(state)
+            self._write(state, sftp, remote_path, blocks, uploaded)
+            self._release(state, sftp)
+            return
+        except _Aborted:
+            self._release(state, sftp)
+            return
+        except (IOError, EOFError, SSHException, SftpError) as e:
+            error = e
+            if not self._drain(blocks):
+                return
+        except BaseException as e:
+            # not a transfer error, so it's not retried; the reader still waits to put the rest of the blocks
+            logger.exception(f"[SFTP {state.config.label}] Unexpected error uploading {file.local_path.name}")
+            self._fail(state, e)
+            self._drain(blocks)
+            return
+
+        for attempt in range(1, state.config.retries + 1):
+            logger.warning(f"[SFTP {state.config.label}] Upload of {file.local_path.name} failed, "
+                           f"retry {attempt} of {state.config.retries}: {error}")
+            self._progress.advance(self._tasks[state.config], -uploaded[0])
+            uploaded[0] = 0
+            # the failed connection is dropped, the retry goes over a new one
+            if sftp is not None:
+                sftp.close()
+                sftp = None
+            try:
+                sftp = self._connect(state)
+                with IoPriority.uncached(open(file.local_path, 'rb')) as local_file:
+                    blocks = iter(lambda: local_file.read(self.BLOCK_SIZE), b'')
+                    self._write(state, sftp, remote_path, blocks, uploaded)
+                self._release(state, sftp)
+                return
+            except (IOError, EOFError, SSHException, SftpError) as e:
+                error = e
+            except Exception as e:
+                error = e
+                break
+
+        self._fail(state, error)
+
+    @staticmethod
+    def _drain(blocks: Iterator[bytes]) -> bool:
+        """ Keep the reader going, the rest of the blocks are not needed anymore. False if the read is aborted """
+
+        try:
+            for _ in blocks:
+                pass
+        except _Aborted:
+            return False
+
+        return True
+
+    def _write(
+        self,
+        state: DestinationState,
+        sftp: Sftp,
+        remote_path: PurePath,
+        blocks: Iterable,
+        uploaded: list
+    ) -> None:
+        with state.lock:
+            if remote_path.parent not in state.created_dirs:
+                sftp.mkdir_p(remote_path.parent)
+                state.created_dirs.add(remote_path.parent)
+
+        if sftp.stream is not None:
+            # written aside, checked on the storage host and renamed by the stream itself
+            sftp.stream.write(remote_path, self._counted(state, blocks, uploaded))
+            return
+
+        # uploaded aside and renamed, so a file under its name is always complete
+        partial_path = f"{remote_path}.partial"
+        with sftp.sftp_client.open(partial_path, 'wb') as remote_file:
+            remote_file.set_pipelined(True)
+            for block in self._counted(state, blocks, uploaded):
+                remote_file.write(block)
+        sftp.sftp_client.posix_rename(partial_path, str(remote_path))
+
+    def _counted(self, state: DestinationState, blocks: Iterable, uploaded: list) -> Iterator[bytes]:
+        """ The blocks throttled, counted and reported as they're written """
+
+        for block in blocks:
+            if self._rate_limiter is not None:
+                self._rate_limiter.consume(len(block))
+            yield block
+            uploaded[0] += len(block)
+            self._progress.advance(self._tasks[state.config], len(block))
+
+    def _acquire(self, state: DestinationState) -> Sftp:
+        with state.lock:
+            if len(state.idle_connections) > 0:
+                return state.idle_connections.pop()
+
+        return self._connect(state)
+
+    @staticmethod
+    def _release(state: DestinationState, sftp: Union[Sftp, None]) -> None:
+        if sftp is None:
+            return
+
+        with state.lock:
+            state.idle_connections.append(sftp)
+
+    def _connect(self, state: DestinationState) -> Sftp:
+        sftp = Sftp(state.config)
+        with self._connections_lock:
+            self._connections.append(sftp)
+
+        return sftp
+
+    @staticmethod
+    def _is_destination(state: DestinationState, file: UploadFile) -> bool:
+        return file.destinations is None or state.config in file.destinations
+
+    @staticmethod
+    def _fail(state: DestinationState, error: Exception) -> None:
+        with state.lock:
+            if state.failed:
+                return
+            state.error = str(error) or type(error).__name__
+        logger.error(f"[SFTP {state.config.label}] Upload failed: {state.error}")
+
+    def _check_results(self) -> None:
+        failed = [state for state in self._states if state.failed]
+        succeeded = [state for state in self._states if not state.failed]
+
+        for state in failed:
+            echo_warning(f"Upload to {state.config.label} failed: {state.error}", author='SFTP')
+
+        if len(succeeded) == 0 or any(state.config.required for state in failed):
+            errors = '; '.join(f"{state.config.label}: {state.error}" for state in failed)
+            raise RuntimeError(f"Failed to upload the backup to SFTP backups storage: [default]{errors}")
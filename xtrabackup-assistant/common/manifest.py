@@ -0,0 +1,48 @@
+import json
+from dataclasses import dataclass, asdict
+from pathlib import Path, PurePath
+from typing import Union
+
+
+@dataclass
+class Manifest:
+    """ Checksum of a backup archive, stored in a sidecar file next to it (locally and on SFTP storage) """
+
+    SUFFIX = '.manifest.json'
+
+    filename: str
+    size: int
+    algorithm: str
+    digest: str
+    created_at: str
+    # [binary log name, position] the backup is consistent with, a point-in-time recovery replays from there
+    binlog_position: Union[list, None] = None
+
+    @classmethod
+    def path_for(cls, archive_path: PurePath) -> PurePath:
+        """ Sidecar path for an archive, the same type as the given path (local Path or remote PurePath) """
+
+        return archive_path.with_name(f"{archive_path.name}{cls.SUFFIX}")
+
+    @classmethod
+    def load(cls, path: Path) -> 'Manifest':
+        with open(path, 'r') as manifest_file:
+            return cls.loads(manifest_file.read(), path)
+
+    @classmethod
+    def loads(cls, data: str, path: PurePath) -> 'Manifest':
+        try:
+            return cls(**json.loads(data))
+        except (ValueError, TypeError) as e:
+            raise RuntimeError(f"Invalid backup manifest {path}: {e}")
+
+    def save(self, path: Path) -> None:
+        with open(path, 'w') as manifest_file:
+            json.dump(asdict(self), manifest_file, indent=2)
+
+    def verify(self, digest: str, size: int) -> None:
+        if size != self.size or digest != self.digest:
+            raise RuntimeError(
+                f"Checksum mismatch for {self.filename}: expected {self.algorithm} {self.digest} ({self.size} bytes), "
+                f"got {digest} ({size} bytes)"
+            )
@@ -0,0 +1,149 @@
+import hashlib
+import json
+from dataclasses import dataclass, asdict
+from pathlib import Path, PurePath
+
+from utils import IoPriority
+from .manifest import Manifest
+
+
+@dataclass
+class PartIndex:
+    """ A split backup: the fixed-size parts its archive is written as, stored next to the index instead of it """
+
+    SUFFIX = '.parts'
+
+    # the archive the parts make up
+    filename: str
+    size: int
+    part_size: int
+    algorithm: str
+    created_at: str
+    # [[part file name, size, digest], ...] in the archive order
+    parts: list
+
+    def part_paths(self, dir_path: PurePath) -> list:
+        return [dir_path / name for name, _, _ in self.parts]
+
+    def part_manifest(self, part: list) -> Manifest:
+        """ Every part is verified on its own, so a damaged one is transferred again alone """
+
+        name, size, digest = part
+        return Manifest(filename=name, size=size, algorithm=self.algorithm, digest=digest, created_at=self.created_at)
+
+    @classmethod
+    def load(cls, path: Path) -> 'PartIndex':
+        with open(path, 'r') as index_file:
+            return cls.loads(index_file.read(), path)
+
+    @classmethod
+    def loads(cls, data: str, path: PurePath) -> 'PartIndex':
+        try:
+            return cls(**json.loads(data))
+        except (ValueError, TypeError) as e:
+            raise RuntimeError(f"Invalid backup part index {path}: {e}")
+
+    def save(self, path: Path) -> None:
+        with open(path, 'w') as index_file:
+            json.dump(asdict(self), index_file)
+
+
+class PartWriter:
+    """ File object writing the archive as consecutive parts of a fixed size: <archive>.part0001, ... """
+
+    def __init__(self, dir_path: Path, filename: str, part_size: int, algorithm: str):
+        self._dir_path = dir_path
+        self._filename = filename
+        self._part_size = part_size
+        self._algorithm = algorithm
+
+        self.parts = []
+        self.paths = []
+        self.size = 0
+
+        self._file = None
+        self._hash = None
+        self._written = 0
+
+    def write(self, data: bytes) -> int:
+        view = memoryview(data)
+        while len(view) > 0:
+            if self._file is None:
+                self._open_part()
+
+            size = min(len(view), self._part_size - self._written)
+            self._file.write(view[:size])
+            self._hash.update(view[:size])
+            self._written += size
+            view = view[size:]
+
+            if self._written == self._part_size:
+                self._close_part()
+
+        self.size += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.size
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._close_part()
+
+    def _open_part(self) -> None:
+        path = Path(self._dir_path, f"{self._filename}.part{len(self.parts) + 1:04d}")
+        self.paths.append(path)
+        self._file = IoPriority.uncached(open(path, 'wb'))
+        self._hash = hashlib.new(self._algorithm)
+        self._written = 0
+
+    def _close_part(self) -> None:
+        self._file.close()
+        self.parts.append([self.paths[-1].name, self._written, self._hash.hexdigest()])
+        self._file = None
+
+
+class PartReader:
+    """ Read-only file object streaming the archive back from its parts in order """
+
+    def __init__(self, dir_path: Path, index: PartIndex):
+        self._paths = index.part_paths(dir_path)
+
+        self._next_part = 0
+        self._file = None
+
+    def read(self, size: int = -1) -> bytes:
+        data = bytearray()
+        while size < 0 or len(data) < size:
+            if self._file is None:
+                if self._next_part == len(self._paths):
+                    break
+                self._file = self._open_part(self._paths[self._next_part])
+                self._next_part += 1
+
+            part_data = self._file.read(-1 if size < 0 else size - len(data))
+            if len(part_data) == 0:
+                self._file.close()
+                self._file = None
+                continue
+            data += part_data
+
+        return bytes(data)
+
+    @staticmethod
+    def _open_part(path: Path):
+        try:
+            return IoPriority.uncached(open(path, 'rb'))
+        except FileNotFoundError:
+            raise RuntimeError(f"Missing backup part {path.name}")
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> "PartReader":
+        return self
+
+    def __exit__(self, e_type, value, traceback):
+        self.close()
@@ -0,0 +1,57 @@
+import json
+from dataclasses import dataclass, asdict, field
+from pathlib import Path
+from typing import Union
+
+from constants import RESTORE_STAGES
+from utils import now
+
+
+@dataclass
+class RestoreState:
+    """
+    The stages of a restore completed so far, so a failed restore is resumed by running it again on the same backup.
+    Stored next to the intermediate files of the restore: data/restore-work/state.json
+    """
+
+    # the backup restored: the archive filename, its size and the manifest digest (None without a manifest)
+    backup: str
+    size: int
+    digest: Union[str, None] = None
+    # stage => {completed_at, the size/checksum of the stage input, ...}
+    stages: dict = field(default_factory=dict)
+    # the datadir the backup is being moved into, the files of an interrupted apply are there already
+    applying: Union[str, None] = None
+
+    def is_for(self, backup: str, size: int, digest: Union[str, None]) -> bool:
+        return (self.backup, self.size, self.digest) == (backup, size, digest)
+
+    def completed(self, stage: str) -> Union[dict, None]:
+        return self.stages.get(stage)
+
+    def complete(self, stage: str, **details) -> None:
+        self.stages[stage] = {'completed_at': now('%Y-%m-%d %H:%M:%S'), **details}
+
+    def reset_from(self, stage: str) -> None:
+        """ Forget the stage and the ones after it, they work on its output """
+
+        for reset_stage in RESTORE_STAGES[RESTORE_STAGES.index(stage):]:
+            self.stages.pop(reset_stage, None)
+
+    @classmethod
+    def load(cls, path: Path) -> Union['RestoreState', None]:
+        if not path.exists():
+            return None
+
+        try:
+            with open(path, 'r') as state_file:
+                return cls(**json.load(state_file))
+        except (ValueError, TypeError) as e:
+            raise RuntimeError(f"Invalid restore state {path}, run restore with --clean to start over: {e}")
+
+    def save(self, path: Path) -> None:
+        # written aside and renamed: a restore killed while saving doesn't leave a broken state
+        temp_path = path.with_name(f"{path.name}.tmp")
+        with open(temp_path, 'w') as state_file:
+            json.dump(asdict(self), state_file, indent=2)
+        temp_path.replace(path)
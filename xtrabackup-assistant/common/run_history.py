@@ -0,0 +1,88 @@
+import json
+import os
+import statistics
+import threading
+from dataclasses import dataclass, asdict, field
+from pathlib import Path
+from typing import Union
+
+from utils import now
+
+# the backups of several targets run side by side in one process, each records its run
+_RECORD_LOCK = threading.Lock()
+
+
+@dataclass
+class RunHistory:
+    """
+    Sizes and phase durations of the last runs of every project, the space and the time the next run needs are
+    predicted from them. Stored in the cache: data/cache/run-history.json
+    """
+
+    # runs kept per project and command
+    MAX_RUNS = 30
+
+    # [{project, command, finished_at, pipeline, data_size, stream_size, archive_size, durations: {phase: seconds}}]
+    runs: list = field(default_factory=list)
+
+    def of(self, project: str, command: str) -> list:
+        return [run for run in self.runs if run['project'] == project and run['command'] == command]
+
+    def compression_ratio(self, project: str) -> Union[float, None]:
+        """ Median xbstream (compressed) size to the data size of the backups, None without a backup recorded """
+
+        ratios = [
+            run['stream_size'] / run['data_size'] for run in self.of(project, 'create')
+            if run.get('data_size') and run.get('stream_size')
+        ]
+
+        return statistics.median(ratios) if len(ratios) > 0 else None
+
+    def seconds_per_byte(self, project: str, command: str, phase: str) -> Union[float, None]:
+        """ Median duration of the phase per byte of data (of the archive for the restore phases) """
+
+        size_key = 'data_size' if command == 'create' else 'archive_size'
+        rates = [
+            run['durations'][phase] / run[size_key] for run in self.of(project, command)
+            if run.get(size_key) and phase in run.get('durations', {})
+        ]
+
+        return statistics.median(rates) if len(rates) > 0 else None
+
+    def last(self, project: str, command: str, key: str) -> Union[int, None]:
+        values = [run[key] for run in self.of(project, command) if run.get(key)]
+
+        return values[-1] if len(values) > 0 else None
+
+    @classmethod
+    def record(cls, path: Path, project: str, command: str, **run) -> None:
+        with _RECORD_LOCK:
+            history = cls.load(path)
+            history.runs.append({
+                'project': project,
+                'command': command,
+                'finished_at': now('%Y-%m-%d %H:%M:%S'),
+                **run
+            })
+            # the oldest runs of the project and command go
+            runs = history.of(project, command)
+            for stale_run in runs[:max(0, len(runs) - cls.MAX_RUNS)]:
+                history.runs.remove(stale_run)
+            history.save(path)
+
+    @classmethod
+    def load(cls, path: Path) -> 'RunHistory':
+        try:
+            with open(path, 'r') as history_file:
+                return cls(**json.load(history_file))
+        except FileNotFoundError:
+            return cls()
+        except (ValueError, TypeError):
+            # only the predictions are lost, it's filled again by the next runs
+            return cls()
+
+    def save(self, path: Path) -> None:
+        temp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+        with open(temp_path, 'w') as history_file:
+            json.dump(asdict(self), history_file)
+        os.replace(temp_path, path)
@@ -0,0 +1,227 @@
+import json
+import queue
+import re
+import threading
+import zlib
+from dataclasses import dataclass, asdict
+from pathlib import Path, PurePath
+from typing import IO, Union
+
+from utils import IoPriority
+from .manifest import Manifest
+from .xbstream_scanner import HEADER, PAYLOAD_HEADER, SPARSE_MAP_SIZE, SPARSE_MAP_ENTRY, CHUNK_MAGIC, \
+    CHUNK_TYPE_EOF, CHUNK_TYPE_SPARSE
+
+# the suffixes xtrabackup adds to the compressed/encrypted files in the stream: db/table.ibd.qp.xbcrypt
+STREAM_FILE_SUFFIX_PATTERN = re.compile(r'(\.(qp|zst|lz4))?(\.xbcrypt)?$')
+
+
+@dataclass
+class ShardIndex:
+    """
+    A sharded backup: the archives its stream is split into, each with an xbstream stream of its own files, stored
+    next to the index instead of a single archive. The shards are restored into the same dir and prepared together.
+    """
+
+    SUFFIX = '.shards'
+
+    # the archive name a single stream backup would have
+    filename: str
+    # of all the shard archives
+    size: int
+    algorithm: str
+    created_at: str
+    # [[shard archive name, size, digest], ...]
+    parts: list
+
+    def part_paths(self, dir_path: PurePath) -> list:
+        return [dir_path / name for name, _, _ in self.parts]
+
+    def part_manifest(self, part: list) -> Manifest:
+        """ Every shard is verified on its own, so a damaged one is transferred again alone """
+
+        name, size, digest = part
+        return Manifest(filename=name, size=size, algorithm=self.algorithm, digest=digest, created_at=self.created_at)
+
+    @classmethod
+    def load(cls, path: Path) -> 'ShardIndex':
+        with open(path, 'r') as index_file:
+            return cls.loads(index_file.read(), path)
+
+    @classmethod
+    def loads(cls, data: str, path: PurePath) -> 'ShardIndex':
+        try:
+            return cls(**json.loads(data))
+        except (ValueError, TypeError) as e:
+            raise RuntimeError(f"Invalid backup shard index {path}: {e}")
+
+    def save(self, path: Path) -> None:
+        with open(path, 'w') as index_file:
+            json.dump(asdict(self), index_file)
+
+
+class ShardPlan:
+    """
+    The shard every file of the stream goes to. The schemas are spread over the shards by their estimated size, the
+    largest first, each to the least loaded shard; a schema larger than the share of a shard is spread by table.
+    The files outside the schema dirs (system tablespace, undo and redo logs, metadata) go to the first shard.
+    """
+
+    def __init__(self, count: int, file_sizes: dict):
+        self.count = count
+        # estimated bytes per shard
+        self.sizes = [0] * count
+
+        self._schema_shards = {}
+        self._file_shards = {}
+        self._spread_schemas = set()
+
+        schemas = {}
+        for path, size in file_sizes.items():
+            schema, separator, _ = self._normalized(path).partition('/')
+            if separator == '':
+                self.sizes[0] += size
+                continue
+            schemas.setdefault(schema, {})[self._normalized(path)] = size
+
+        share = sum(file_sizes.values()) / count
+        # (size, schema, a file of a schema spread by table)
+        units = []
+        for schema, files in schemas.items():
+            if sum(files.values()) <= share:
+                units.append((sum(files.values()), schema, None))
+            else:
+                units += [(size, schema, path) for path, size in files.items()]
+                self._spread_schemas.add(schema)
+
+        for size, schema, path in sorted(units, key=lambda unit: unit[0], reverse=True):
+            shard = min(range(count), key=lambda index: self.sizes[index])
+            self.sizes[shard] += size
+            if path is None:
+                self._schema_shards[schema] = shard
+            else:
+                self._file_shards[path] = shard
+
+    def shard_for(self, stream_path: str) -> int:
+        path = STREAM_FILE_SUFFIX_PATTERN.sub('', self._normalized(stream_path))
+        if path in self._file_shards:
+            return self._file_shards[path]
+
+        schema, separator, _ = path.partition('/')
+        if separator == '':
+            return 0
+        if schema in self._schema_shards:
+            return self._schema_shards[schema]
+
+        # a schema without an estimate or a table created after it, the same shard whichever run it is
+        return zlib.crc32(bytes(path if schema in self._spread_schemas else schema, 'utf-8')) % self.count
+
+    @staticmethod
+    def _normalized(path: str) -> str:
+        # the estimate names the files as xtrabackup logs them: ./db/table.ibd
+        return path[2:] if path.startswith('./') else path
+
+
+class XbstreamSharder:
+    """
+    Splits an xbstream stream into a stream per shard, chunk by chunk: the chunks of a file go to the shard the plan
+    gives it in the stream order, so every shard is an xbstream stream of its own (extracted with xbstream -x).
+    The shards are written by a thread each, the stream is read on while a shard file is being written.
+    """
+
+    QUEUE_SIZE = 16
+
+    _END = None
+
+    def __init__(self, stream: IO[bytes], plan: ShardPlan, paths: list):
+        self._stream = stream
+        self._plan = plan
+        self._paths = paths
+
+        # bytes written per shard
+        self.sizes = [0] * plan.count
+
+        self._queues = [queue.Queue(maxsize=self.QUEUE_SIZE) for _ in paths]
+        self._error: Union[BaseException, None] = None
+
+    def split(self) -> 'XbstreamSharder':
+        threads = [
+            threading.Thread(target=self._write, args=(path, chunks), name=f"xbstream_shard_{index + 1}_thread")
+            for index, (path, chunks) in enumerate(zip(self._paths, self._queues))
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                chunk = self._read_chunk()
+                if chunk is None:
+                    break
+                path, data = chunk
+                shard = self._plan.shard_for(path)
+                self._queues[shard].put(data)
+                self.sizes[shard] += sum(len(piece) for piece in data)
+                if self._error is not None:
+                    break
+        finally:
+            for chunks in self._queues:
+                chunks.put(self._END)
+            for thread in threads:
+                thread.join()
+
+        if self._error is not None:
+            raise RuntimeError(f"Failed to write a backup shard: {self._error}")
+
+        return self
+
+    def _read_chunk(self) -> Union[tuple, None]:
+        """ (file path, the raw chunk pieces), None at the end of the stream """
+
+        header = self._stream.read(HEADER.size)
+        if len(header) == 0:
+            return None
+        if len(header) < HEADER.size:
+            raise RuntimeError('xbstream is truncated (incomplete chunk header)')
+
+        magic, _, chunk_type, path_length = HEADER.unpack(header)
+        if magic != CHUNK_MAGIC:
+            raise RuntimeError('Invalid xbstream chunk magic')
+        raw_path = self._read_exactly(path_length)
+        path = str(raw_path, 'utf-8', errors='replace')
+        if chunk_type == CHUNK_TYPE_EOF:
+            return path, (header, raw_path)
+
+        sparse_map_header = b''
+        sparse_map_size = 0
+        if chunk_type == CHUNK_TYPE_SPARSE:
+            sparse_map_header = self._read_exactly(SPARSE_MAP_SIZE.size)
+            sparse_map_size, = SPARSE_MAP_SIZE.unpack(sparse_map_header)
+        payload_header = self._read_exactly(PAYLOAD_HEADER.size)
+        payload_length, _, _ = PAYLOAD_HEADER.unpack(payload_header)
+        sparse_map = self._read_exactly(sparse_map_size * SPARSE_MAP_ENTRY.size)
+
+        payload = self._read_exactly(payload_length)
+
+        return path, (header, raw_path, sparse_map_header, payload_header, sparse_map, payload)
+
+    def _read_exactly(self, size: int) -> bytes:
+        data = self._stream.read(size)
+        if len(data) < size:
+            raise RuntimeError('xbstream is truncated (incomplete chunk)')
+
+        return data
+
+    def _write(self, path: Path, chunks: queue.Queue) -> None:
+        try:
+            with IoPriority.uncached(open(path, 'wb')) as shard_file:
+                while True:
+                    data = chunks.get()
+                    if data is self._END:
+                        return
+                    for piece in data:
+                        shard_file.write(piece)
+        except BaseException as e:
+            self._error = e
+            # drained till the end, so the reader never waits for a full queue
+            while chunks.get() is not self._END:
+                pass
@@ -0,0 +1,114 @@
+import struct
+import zlib
+from typing import IO
+
+# chunk layout (xbstream.h): magic, flags, type, path length, path, [sparse map size], payload length,
+# payload offset, CRC32 of the payload, [sparse map], payload; EOF chunks end right after the path
+CHUNK_MAGIC = b'XBSTCK01'
+FLAG_IGNORABLE = 0x01
+CHUNK_TYPE_PAYLOAD, CHUNK_TYPE_SPARSE, CHUNK_TYPE_EOF = b'P', b'S', b'E'
+
+HEADER = struct.Struct('<8sBcI')
+PAYLOAD_HEADER = struct.Struct('<QQI')
+SPARSE_MAP_SIZE = struct.Struct('<I')
+SPARSE_MAP_ENTRY = struct.Struct('<II')
+
+
+class XbstreamScanner:
+    """
+    Validates an xbstream stream without extracting it: chunk framing, payload checksums, chunk order and that every
+    file is complete. Collects the file sizes and the content of small files asked for (e.g. xtrabackup_checkpoints).
+    """
+
+    READ_SIZE = 1024 * 1024
+
+    def __init__(self, stream: IO[bytes], capture: tuple = ()):
+        self._stream = stream
+        self._capture = capture
+
+        # path => payload size
+        self.files: dict = {}
+        # path => content, for the captured files
+        self.captured: dict = {}
+        self.chunks_count = 0
+
+        self._incomplete = set()
+
+    def scan(self) -> "XbstreamScanner":
+        while True:
+            header = self._stream.read(HEADER.size)
+            if len(header) == 0:
+                break
+            if len(header) < HEADER.size:
+                raise RuntimeError('xbstream is truncated (incomplete chunk header)')
+
+            magic, flags, chunk_type, path_length = HEADER.unpack(header)
+            if magic != CHUNK_MAGIC:
+                raise RuntimeError(f"Invalid xbstream chunk magic after {self.chunks_count} chunks")
+            path = str(self._read_exactly(path_length), 'utf-8', errors='replace')
+            self.chunks_count += 1
+
+            if chunk_type == CHUNK_TYPE_EOF:
+                self._incomplete.discard(path)
+                continue
+            if chunk_type not in (CHUNK_TYPE_PAYLOAD, CHUNK_TYPE_SPARSE) and not flags & FLAG_IGNORABLE:
+                raise RuntimeError(f"Unknown xbstream chunk type {chunk_type!r} of {path}")
+
+            self._scan_payload(path, chunk_type)
+
+        if len(self._incomplete) > 0:
+            raise RuntimeError(f"xbstream is truncated, incomplete files: {', '.join(sorted(self._incomplete))}")
+
+        return self
+
+    def _scan_payload(self, path: str, chunk_type: bytes) -> None:
+        sparse_map_size = 0
+        if chunk_type == CHUNK_TYPE_SPARSE:
+            sparse_map_size, = SPARSE_MAP_SIZE.unpack(self._read_exactly(SPARSE_MAP_SIZE.size))
+        payload_length, payload_offset, checksum = PAYLOAD_HEADER.unpack(self._read_exactly(PAYLOAD_HEADER.size))
+        sparse_map = self._read_exactly(sparse_map_size * SPARSE_MAP_ENTRY.size)
+
+        # ignorable chunks of unknown types are skipped the same way xbstream does
+        if chunk_type not in (CHUNK_TYPE_PAYLOAD, CHUNK_TYPE_SPARSE):
+            self._skip(payload_length)
+            return
+
+        size = self.files.get(path, 0)
+        if chunk_type == CHUNK_TYPE_PAYLOAD and payload_offset != size:
+            raise RuntimeError(f"Out of order xbstream chunk of {path}: offset {payload_offset}, expected {size}")
+
+        content = bytearray() if path in self._capture else None
+        actual_checksum = 0
+        left = payload_length
+        while left > 0:
+            data = self._read_exactly(min(left, self.READ_SIZE))
+            actual_checksum = zlib.crc32(data, actual_checksum)
+            if content is not None:
+                content += data
+            left -= len(data)
+        if actual_checksum != checksum:
+            raise RuntimeError(f"Checksum mismatch in xbstream chunk of {path} at offset {payload_offset}")
+
+        if chunk_type == CHUNK_TYPE_SPARSE:
+            # the offset of a sparse chunk counts the holes too
+            holes = sum(skip for skip, _ in SPARSE_MAP_ENTRY.iter_unpack(sparse_map))
+            self.files[path] = payload_offset + holes + payload_length
+        else:
+            self.files[path] = size + payload_length
+        if content is not None:
+            self.captured[path] = self.captured.get(path, b'') + bytes(content)
+        self._incomplete.add(path)
+
+    def _read_exactly(self, size: int) -> bytes:
+        data = self._stream.read(size)
+        while len(data) < size:
+            more = self._stream.read(size - len(data))
+            if len(more) == 0:
+                raise RuntimeError('xbstream is truncated (incomplete chunk)')
+            data += more
+
+        return data
+
+    def _skip(self, size: int) -> None:
+        while size > 0:
+            size -= len(self._read_exactly(min(size, self.READ_SIZE)))
@@ -0,0 +1,218 @@
+import queue
+import re
+import threading
+from pathlib import Path
+from time import monotonic
+from typing import IO, Union
+
+from rich.live import Live
+from rich.progress import Progress, TextColumn, SpinnerColumn, BarColumn, TaskProgressColumn, DownloadColumn, \
+    TransferSpeedColumn, TimeRemainingColumn
+from rich.text import Text
+
+from utils import console, echo, logger
+from .xtrabackup_message import XtrabackupMessage
+
+# [Xtrabackup] Copying ./db/table.ibd to <STDOUT> / [Xtrabackup] Done: Copying ./db/table.ibd to <STDOUT>,
+# the action is 'Compressing and streaming' with --compress and 'Compressing, encrypting and streaming' with --encrypt
+COPY_PATTERN = re.compile(
+    rb'(Done: )?(?:Copying|Streaming|(?:Compressing(?:, encrypting)?|Encrypting) and streaming) (\S+)'
+)
+# [Xtrabackup] MySQL binlog position: filename 'binlog.000003', position '157', GTID of the last change '...'
+BINLOG_POSITION_PATTERN = re.compile(rb"MySQL binlog position: filename '([^']+)', position '?(\d+)")
+
+
+class XtrabackupLogPipeline:
+    """
+    Drains xtrabackup stderr without ever waiting for the console, so xtrabackup is not back-pressured:
+    a reader thread appends raw lines to the log file in bulk and counts per-file copy messages, other lines
+    are handed over to a renderer thread via a bounded queue. The renderer prints them and keeps one live
+    aggregate progress line for the copied files (a byte progress bar with ETA if the file sizes are known).
+    Lines not fitting into the queue are skipped on the console only (the log has everything).
+    """
+
+    QUEUE_SIZE = 10000
+    LOG_BUFFER_SIZE = 1024 * 1024
+    RENDER_INTERVAL = 0.25
+
+    _END = None
+
+    def __init__(
+        self,
+        stream: IO[bytes],
+        log_path: Path,
+        interactive: bool = True,
+        file_sizes: Union[dict, None] = None
+    ):
+        self._stream = stream
+        self._log_path = log_path
+        self._interactive = interactive
+        self._file_sizes = file_sizes
+
+        self._queue = queue.Queue(maxsize=self.QUEUE_SIZE)
+        self._skipped_lines = 0
+
+        self._started_files_count = 0
+        self._copied_files_count = 0
+        self._last_copy_message: Union[bytes, None] = None
+        self._copied_bytes = 0
+
+        self._copy_started_at = {}
+        # file path => seconds, in order of completion
+        self.copy_times = {}
+        # [binary log name, position] of the backup (as in xtrabackup_binlog_info), None if binary logging is off
+        self.binlog_position: Union[list, None] = None
+
+        self._reader_thread = threading.Thread(target=self._read, name='xtrabackup_log_reader_thread')
+        self._renderer_thread = threading.Thread(target=self._render, name='xtrabackup_log_renderer_thread')
+
+    def start(self) -> None:
+        # the renderer is running before the reader may end the rendering
+        if self._interactive:
+            self._renderer_thread.start()
+        self._reader_thread.start()
+
+    def join(self) -> None:
+        """ Wait until the stream is closed (the process exited) and everything is written and rendered """
+
+        self._reader_thread.join()
+        if self._interactive:
+            self._renderer_thread.join()
+
+    def _read(self) -> None:
+        try:
+            with open(self._log_path, 'wb', buffering=self.LOG_BUFFER_SIZE) as log_file:
+                for line in self._stream:
+                    log_file.write(line)
+
+                    copy_message = COPY_PATTERN.search(line)
+                    if copy_message is not None:
+                        self._on_copy_message(line, copy_message)
+                        continue
+
+                    binlog_position = BINLOG_POSITION_PATTERN.search(line) if b'binlog position' in line else None
+                    if binlog_position is not None:
+                        self.binlog_position = [str(binlog_position.group(1), 'utf-8'), int(binlog_position.group(2))]
+                    if self._interactive:
+                        try:
+                            self._queue.put_nowait(line)
+                        except queue.Full:
+                            self._skipped_lines += 1
+        except Exception as e:
+            # xtrabackup blocks on a full stderr pipe, so the stream is read to the end whatever failed here
+            logger.error(f"Failed to process xtrabackup messages, the rest of them is skipped: {e}")
+            for _ in self._stream:
+                pass
+        finally:
+            if self._interactive:
+                self._end_rendering()
+
+    def _end_rendering(self) -> None:
+        while True:
+            try:
+                self._queue.put(self._END, timeout=self.RENDER_INTERVAL)
+                return
+            except queue.Full:
+                if not self._renderer_thread.is_alive():
+                    # the renderer died, nobody empties the queue: the reader must not wait on it forever
+                    logger.error('The xtrabackup messages renderer stopped, the last messages are not printed')
+                    return
+
+    def _on_copy_message(self, line: bytes, copy_message: re.Match) -> None:
+        file_path = copy_message.group(2)
+        if copy_message.group(1) is None:
+            self._started_files_count += 1
+            self._copy_started_at[file_path] = monotonic()
+        else:
+            self._copied_files_count += 1
+            file_path = str(file_path, 'utf-8', errors='replace')
+            started_at = self._copy_started_at.pop(copy_message.group(2), None)
+            if started_at is not None:
+                self.copy_times[file_path] = monotonic() - started_at
+            if self._file_sizes is not None:
+                self._copied_bytes += self._file_sizes.get(file_path, 0)
+        self._last_copy_message = line
+
+    def _render(self) -> None:
+        if self._file_sizes is None:
+            with Live(self, console=console, transient=True, refresh_per_second=1 / self.RENDER_INTERVAL):
+                self._print_messages()
+        else:
+            self._render_with_progress_bar()
+
+        if self._copied_files_count > 0:
+            echo(f"Copied files: {self._copied_files_count}", author='XtraBackup', time=False)
+        if self._skipped_lines > 0:
+            echo(
+                f"{self._skipped_lines} messages skipped on the console, see the log for all of them",
+                author='XtraBackup',
+                style='dark_orange',
+                time=False
+            )
+
+    def _print_messages(self, on_idle=None) -> None:
+        while True:
+            try:
+                line = self._queue.get(timeout=self.RENDER_INTERVAL)
+            except queue.Empty:
+                line = None
+            else:
+                if line is self._END:
+                    break
+
+            if line is not None:
+                echo(XtrabackupMessage(str(line, 'utf-8', errors='replace')).formatted, author='XtraBackup', time=False)
+            if on_idle is not None:
+                on_idle()
+
+    def _render_with_progress_bar(self) -> None:
+        with Progress(
+            TextColumn('[blue]\\[XtraBackup][/blue]'),
+            SpinnerColumn(),
+            TextColumn('[progress.description]{task.description}'),
+            BarColumn(),
+            TaskProgressColumn(),
+            DownloadColumn(),
+            TransferSpeedColumn(),
+            TimeRemainingColumn(),
+            console=console,
+            transient=True
+        ) as progress:
+            total_size = sum(self._file_sizes.values())
+            copying = progress.add_task('[blue]Copying files...', total=total_size or None)
+
+            def update_progress():
+                # the estimate may be short (e.g. files created during the backup), the bar stops at 100%
+                progress.update(
+                    copying,
+                    completed=min(self._copied_bytes, total_size),
+                    description=f"[blue]Copying files ({self._copied_files_count} done)..."
+                )
+
+            self._print_messages(on_idle=update_progress)
+
+    def __rich__(self) -> Text:
+        """ Live progress line, rendered by the Live refresh thread so copy messages cost nothing on the console """
+
+        if self._started_files_count == 0:
+            return Text()
+
+        last_file = ''
+        if self._last_copy_message is not None:
+            last_file = str(COPY_PATTERN.search(self._last_copy_message).group(2), 'utf-8', errors='replace')
+
+        in_progress = max(0, self._started_files_count - self._copied_files_count)
+        return Text.assemble(
+            ('[XtraBackup] ', 'blue'),
+            (f"Copying files: {self._copied_files_count} done, {in_progress} in progress", 'default'),
+            (f" | {last_file}", 'italic'),
+            no_wrap=True,
+            overflow='ellipsis'
+        )
+
+    def __enter__(self) -> "XtrabackupLogPipeline":
+        self.start()
+        return self
+
+    def __exit__(self, e_type, value, traceback):
+        self.join()
@@ -1,5 +1,9 @@
 import re
-from datetime import datetime
+
+# 2024-03-01T10:00:00.123456+02:00 ...
+ISO_TIMESTAMP_PATTERN = re.compile(r'(\d{4}-\d{2}-\d{2})T(\d{2}:\d{2}:\d{2})\S*\s+')
+# 'version_check' utility date: 240301 10:00:00 ...
+VERSION_CHECK_TIMESTAMP_PATTERN = re.compile(r'(\d{2})(\d{2})(\d{2}) (\d{2}:\d{2}:\d{2})\s+')
 
 
 class XtrabackupMessage:
@@ -8,16 +12,19 @@ class XtrabackupMessage:
         self.formatted = self._format()
 
     def _format(self) -> str:
-        message = self.original.split()
-
         # format timestamp if this is ISO 8601 date at start
-        try:
-            message[0] = f"[{datetime.fromisoformat(message[0]).strftime('%Y-%m-%d %H:%M:%S')}]"
-        except ValueError:
-            # format timestamp if it's 'version_check' utility date at start
-            version_check_timestamp = re.match(r'\d{6} \d{2}:\d{2}:\d{2}', self.original)
-            if version_check_timestamp is not None:
-                timestamp = datetime.strptime(version_check_timestamp.group(), '%y%m%d %H:%M:%S')
-                message[0:2] = [f"[{timestamp.strftime('%Y-%m-%d %H:%M:%S')}]"]
+        iso_timestamp = ISO_TIMESTAMP_PATTERN.match(self.original)
+        if iso_timestamp is not None:
+            timestamp = f"[{iso_timestamp.group(1)} {iso_timestamp.group(2)}]"
+            return f"{timestamp} {' '.join(self.original[iso_timestamp.end():].split())}".rstrip()
+
+        # format timestamp if it's 'version_check' utility date at start
+        version_check_timestamp = VERSION_CHECK_TIMESTAMP_PATTERN.match(self.original)
+        if version_check_timestamp is not None:
+            year, month, day, time = version_check_timestamp.groups()
+            # the same pivot as strptime('%y'): 69-99 => 19xx
+            century = '19' if int(year) >= 69 else '20'
+            timestamp = f"[{century}{year}-{month}-{day} {time}]"
+            return f"{timestamp} {' '.join(self.original[version_check_timestamp.end():].split())}".rstrip()
 
-        return ' '.join(message)
+        return ' '.join(self.original.split())
@@ -1,5 +1,14 @@
 from .sftp_config import SftpConfig
+from .local_storage_config import LocalStorageConfig
 from .slack_config import SlackConfig
 from .xtrabackup_config import XtrabackupConfig
 from .rotation_config import RotationConfig
+from .schedule_config import ScheduleConfig
+from .orchestration_config import OrchestrationConfig
+from .throttle_config import ThrottleConfig
+from .dedup_config import DedupConfig
+from .split_config import SplitConfig
+from .shard_config import ShardConfig
+from .binlog_config import BinlogConfig
+from .io_priority_config import IoPriorityConfig
 from .assistant_config import Config
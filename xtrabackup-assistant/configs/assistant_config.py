@@ -1,11 +1,13 @@
+import copy
 import json
 
 from rich.text import Text
 
-from configs import XtrabackupConfig, SftpConfig, SlackConfig, RotationConfig
+from configs import XtrabackupConfig, SftpConfig, LocalStorageConfig, SlackConfig, RotationConfig, ScheduleConfig, \
+    OrchestrationConfig, ThrottleConfig, DedupConfig, SplitConfig, ShardConfig, BinlogConfig, IoPriorityConfig
 from constants import CONFIG_PATH
 from exceptions import ConfigError
-from utils import echo_warning, echo
+from utils import echo_warning, echo, CHECKSUM_ALGORITHMS
 
 
 class Config:
@@ -20,8 +22,16 @@ class Config:
         },
         'sftp': {
             'optional': True,
+            # a single destination or a list of them
+            'multiple': True,
             'required_fields': {'host', 'user', 'password'}
         },
+        'local_storage': {
+            'optional': True,
+            # a single storage or a list of them
+            'multiple': True,
+            'required_fields': {'path'}
+        },
         'slack': {
             'optional': True,
             'required_fields': {'token', 'channel'}
@@ -29,16 +39,70 @@ class Config:
         'rotation': {
             'optional': True,
             'required_fields': {'max_store_time_years', 'keep_for_last_days_local', 'keep_for_last_days_sftp'}
+        },
+        'schedule': {
+            'optional': True,
+            'required_fields': {}
+        },
+        'targets': {
+            'optional': True,
+            'required_fields': {}
+        },
+        'orchestration': {
+            'optional': True,
+            'required_fields': {}
+        },
+        'throttle': {
+            'optional': True,
+            'required_fields': {}
+        },
+        'checksum_algorithm': {
+            'optional': True,
+            'required_fields': {}
+        },
+        'dedup': {
+            'optional': True,
+            'required_fields': {}
+        },
+        'split': {
+            'optional': True,
+            'required_fields': {}
+        },
+        'shard': {
+            'optional': True,
+            'required_fields': {}
+        },
+        'binlog': {
+            'optional': True,
+            'required_fields': {}
+        },
+        'io_priority': {
+            'optional': True,
+            'required_fields': {}
         }
     }
 
     project_name: str = None
     xtrabackup: XtrabackupConfig = None
     sftp: SftpConfig = None
+    # all SFTP destinations, 'sftp' is the first of them
+    sftp_destinations: list = []
+    local_storages: list = []
     slack: SlackConfig = None
     rotation: RotationConfig = None
+    schedule: ScheduleConfig = None
+    targets: list = None
+    orchestration: OrchestrationConfig = OrchestrationConfig()
+    throttle: ThrottleConfig = ThrottleConfig()
+    checksum_algorithm: str = 'sha256'
+    dedup: DedupConfig = None
+    split: SplitConfig = None
+    shard: ShardConfig = None
+    binlog: BinlogConfig = None
+    io_priority: IoPriorityConfig = IoPriorityConfig()
 
     _raw_config: dict = None
+    _untuned: list = []
 
     def __init__(self):
         try:
@@ -55,11 +119,47 @@ class Config:
         self.project_name = self._raw_config['project_name']
         self.xtrabackup = XtrabackupConfig(**self._raw_config['xtrabackup'])
         if 'sftp' in self._raw_config:
-            self.sftp = SftpConfig(**self._raw_config['sftp'])
+            raw_destinations = self._raw_config['sftp']
+            if not isinstance(raw_destinations, list):
+                raw_destinations = [raw_destinations]
+            self.sftp_destinations = [SftpConfig(**raw_destination) for raw_destination in raw_destinations]
+            self.sftp = self.sftp_destinations[0]
+        if 'local_storage' in self._raw_config:
+            raw_storages = self._raw_config['local_storage']
+            if not isinstance(raw_storages, list):
+                raw_storages = [raw_storages]
+            self.local_storages = [LocalStorageConfig(**raw_storage) for raw_storage in raw_storages]
         if 'slack' in self._raw_config:
             self.slack = SlackConfig(**self._raw_config['slack'])
         if 'rotation' in self._raw_config:
             self.rotation = RotationConfig(**self._raw_config['rotation'])
+        if 'schedule' in self._raw_config:
+            self.schedule = ScheduleConfig(**self._raw_config['schedule'])
+        if 'orchestration' in self._raw_config:
+            self.orchestration = OrchestrationConfig(**self._raw_config['orchestration'])
+        if 'throttle' in self._raw_config:
+            self.throttle = ThrottleConfig(**self._raw_config['throttle'])
+        if 'checksum_algorithm' in self._raw_config:
+            if self._raw_config['checksum_algorithm'] not in CHECKSUM_ALGORITHMS:
+                algorithms = ', '.join(CHECKSUM_ALGORITHMS)
+                raise ConfigError(f"Unsupported checksum algorithm, expected one of: [default]{algorithms}")
+            self.checksum_algorithm = self._raw_config['checksum_algorithm']
+        if 'dedup' in self._raw_config:
+            self.dedup = DedupConfig(**self._raw_config['dedup'])
+        if 'split' in self._raw_config:
+            if self.dedup is not None:
+                raise ConfigError("Options 'dedup' and 'split' can't be used together")
+            self.split = SplitConfig(**self._raw_config['split'])
+        if 'shard' in self._raw_config:
+            if self.dedup is not None or self.split is not None:
+                raise ConfigError("Option 'shard' can't be used together with 'dedup' or 'split'")
+            self.shard = ShardConfig(**self._raw_config['shard'])
+        if 'binlog' in self._raw_config:
+            self.binlog = BinlogConfig(**self._raw_config['binlog'])
+        if 'io_priority' in self._raw_config:
+            self.io_priority = IoPriorityConfig(**self._raw_config['io_priority'])
+
+        self.targets = [self._target_config(raw_target) for raw_target in self._raw_config.get('targets', [])]
 
     def validate_config(self):
         # check for unknown top lvl nodes
@@ -81,12 +181,86 @@ class Config:
         # check for existing node fields
         for node_name, node_fields in self._raw_config.items():
             required_node_fields = self.CONFIG_STRUCTURE[node_name]['required_fields']
-            node_missing_required_fields = [
-                f"{node_name}.{field}" for field in required_node_fields if field not in node_fields
-            ]
-            if len(node_missing_required_fields) > 0:
-                message = f"Missing required config fields: [default]{', '.join(node_missing_required_fields)}"
-                raise ConfigError(message)
+            nodes = [node_fields]
+            if self.CONFIG_STRUCTURE[node_name].get('multiple', False) and isinstance(node_fields, list):
+                if len(node_fields) == 0:
+                    raise ConfigError(f"Empty config node: [default]{node_name}")
+                nodes = node_fields
+            for node in nodes:
+                node_missing_required_fields = [
+                    f"{node_name}.{field}" for field in required_node_fields if field not in node
+                ]
+                if len(node_missing_required_fields) > 0:
+                    message = f"Missing required config fields: [default]{', '.join(node_missing_required_fields)}"
+                    raise ConfigError(message)
+
+        # check SFTP destinations: they are told apart by the name (the host by default)
+        raw_destinations = self._raw_config.get('sftp', [])
+        if not isinstance(raw_destinations, list):
+            raw_destinations = [raw_destinations]
+        destination_names = [destination.get('name', destination['host']) for destination in raw_destinations]
+        duplicate_names = sorted({name for name in destination_names if destination_names.count(name) > 1})
+        if len(duplicate_names) > 0:
+            raise ConfigError(f"Duplicate SFTP destinations (set 'name' to tell them apart): [default]"
+                              f"{', '.join(duplicate_names)}")
+
+        # check targets: a list of MySQL instances, each with a unique name
+        target_names = []
+        for raw_target in self._raw_config.get('targets', []):
+            if not isinstance(raw_target, dict) or 'project_name' not in raw_target:
+                raise ConfigError('Missing required config fields: [default]targets.project_name')
+            if raw_target['project_name'] in target_names:
+                raise ConfigError(f"Duplicate config target: [default]{raw_target['project_name']}")
+            target_names.append(raw_target['project_name'])
+
+    @property
+    def is_auto_tuned(self) -> bool:
+        configs = [self, *self.targets]
+        return any(config.xtrabackup.is_auto_tuned for config in configs) or any(
+            destination.is_auto_tuned for destination in self.sftp_destinations
+        )
+
+    def apply_tuning(self, tuning: dict) -> None:
+        """ Replace 'auto' thread options (of the targets as well) with the tuned values """
+
+        self.reset_tuning()
+        self._untuned = [
+            (config, config.xtrabackup, config.sftp, config.sftp_destinations) for config in [self, *self.targets]
+        ]
+
+        for config in [self, *self.targets]:
+            config.xtrabackup = config.xtrabackup.tuned(tuning)
+            if config.sftp is not None:
+                config.sftp_destinations = [destination.tuned(tuning) for destination in config.sftp_destinations]
+                config.sftp = config.sftp_destinations[0]
+
+    def reset_tuning(self) -> None:
+        """ Restore 'auto' thread options, so the next run of a long-lived process is tuned again """
+
+        for config, xtrabackup, sftp, sftp_destinations in self._untuned:
+            config.xtrabackup = xtrabackup
+            config.sftp = sftp
+            config.sftp_destinations = sftp_destinations
+        self._untuned = []
+
+    def target(self, name: str) -> 'Config':
+        target_config = next((target for target in self.targets if target.project_name == name), None)
+        if target_config is None:
+            raise ConfigError(f"Unknown config target: [default]{name}")
+
+        return target_config
+
+    def _target_config(self, raw_target: dict) -> 'Config':
+        """ Copy of the config for one target, target 'xtrabackup' fields override the top lvl ones """
+
+        target_config = copy.copy(self)
+        target_config.project_name = raw_target['project_name']
+        target_config.xtrabackup = XtrabackupConfig(
+            **{**self._raw_config['xtrabackup'], **raw_target.get('xtrabackup', {})}
+        )
+        target_config.targets = []
+
+        return target_config
 
     @staticmethod
     def print_ready_message():
@@ -0,0 +1,24 @@
+from dataclasses import dataclass
+from typing import Union
+
+from exceptions import ConfigError
+
+
+@dataclass(frozen=True)
+class BinlogConfig:
+    # mysqlbinlog --connection-server-id, must differ from the server ids of the source and its replicas
+    server_id: int = 65535
+    # the binary log streaming starts from when nothing is streamed yet (the current one of the server by default)
+    start_file: Union[str, None] = None
+    # seconds, the current binary log is closed (FLUSH BINARY LOGS) this often to be uploaded, off if not set
+    flush_interval: Union[int, None] = None
+    # gzip level of the uploaded binary logs
+    compress_level: int = 6
+
+    def __post_init__(self):
+        if not isinstance(self.server_id, int) or not 0 < self.server_id < 2 ** 32:
+            raise ConfigError("Invalid 'binlog.server_id' option: [default]a positive 32-bit integer expected")
+        if self.flush_interval is not None and (not isinstance(self.flush_interval, int) or self.flush_interval < 60):
+            raise ConfigError("Invalid 'binlog.flush_interval' option: [default]60 seconds or more expected")
+        if self.compress_level not in range(1, 10):
+            raise ConfigError("Invalid 'binlog.compress_level' option: [default]1-9 expected")
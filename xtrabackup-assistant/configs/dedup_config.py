@@ -0,0 +1,17 @@
+from dataclasses import dataclass
+
+from exceptions import ConfigError
+
+MIN_AVERAGE_CHUNK_SIZE = 64
+
+
+@dataclass(frozen=True)
+class DedupConfig:
+    # KB, chunks are cut between a quarter and four times of it
+    average_chunk_size: int = 1024
+
+    def __post_init__(self):
+        if not isinstance(self.average_chunk_size, int) or self.average_chunk_size < MIN_AVERAGE_CHUNK_SIZE:
+            raise ConfigError(
+                f"Invalid 'dedup.average_chunk_size' option: [default]{MIN_AVERAGE_CHUNK_SIZE} KB or more expected"
+            )
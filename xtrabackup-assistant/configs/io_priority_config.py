@@ -0,0 +1,40 @@
+from dataclasses import dataclass
+from typing import Union
+
+from exceptions import ConfigError
+
+IONICE_CLASSES = ('idle', 'best-effort')
+
+
+@dataclass(frozen=True)
+class IoPriorityConfig:
+    # nice value of the xtrabackup/xbstream processes, 19 is the lowest priority
+    nice: Union[int, None] = None
+    # ionice scheduling class of the xtrabackup/xbstream processes: 'idle' (disk time nobody else wants) or
+    # 'best-effort' with the level below
+    ionice_class: Union[str, None] = None
+    # 0 (highest) - 7 (lowest), for the 'best-effort' class
+    ionice_level: Union[int, None] = None
+    # drop the files the assistant reads/writes (temp stream, archive, uploads, downloads) from the page cache as it
+    # goes, so the pages the database keeps hot aren't evicted by a backup passing through
+    drop_cache: bool = False
+    # cgroup v2 the xtrabackup/xbstream processes run in, e.g. /sys/fs/cgroup/xtrabackup-assistant (created if missing)
+    cgroup: Union[str, None] = None
+    # io.max lines of the cgroup: ["8:0 rbps=104857600 wbps=52428800", ...]
+    io_max: list = None
+
+    def __post_init__(self):
+        if self.nice is not None and (not isinstance(self.nice, int) or not 0 <= self.nice <= 19):
+            raise ConfigError("Invalid 'io_priority.nice' option: [default]0-19 expected")
+        if self.ionice_class is not None and self.ionice_class not in IONICE_CLASSES:
+            raise ConfigError(f"Invalid 'io_priority.ionice_class' option: [default]{', '.join(IONICE_CLASSES)}")
+        if self.ionice_level is not None:
+            if self.ionice_class != 'best-effort':
+                raise ConfigError("Option 'io_priority.ionice_level' is for the 'best-effort' ionice class only")
+            if not isinstance(self.ionice_level, int) or not 0 <= self.ionice_level <= 7:
+                raise ConfigError("Invalid 'io_priority.ionice_level' option: [default]0-7 expected")
+        if self.io_max is not None:
+            if self.cgroup is None:
+                raise ConfigError("Option 'io_priority.io_max' needs 'io_priority.cgroup'")
+            if not isinstance(self.io_max, list) or not all(isinstance(line, str) for line in self.io_max):
+                raise ConfigError("Invalid 'io_priority.io_max' option: [default]a list of io.max lines expected")
@@ -0,0 +1,24 @@
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Union
+
+from exceptions import ConfigError
+
+
+@dataclass(frozen=True)
+class LocalStorageConfig:
+    # a mounted NFS share or a secondary disk
+    path: Path
+    # a name to tell storages apart when there are several of them (the path by default)
+    name: Union[str, None] = None
+    # a failed copy to a storage which is not required is a warning only
+    required: bool = True
+
+    def __post_init__(self):
+        object.__setattr__(self, 'path', Path(self.path))
+        if not self.path.is_absolute():
+            raise ConfigError("Invalid 'local_storage.path' option: [default]an absolute path expected")
+
+    @property
+    def label(self) -> str:
+        return self.name or str(self.path)
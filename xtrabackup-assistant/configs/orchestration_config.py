@@ -0,0 +1,9 @@
+from dataclasses import dataclass
+from typing import Union
+
+
+@dataclass(frozen=True)
+class OrchestrationConfig:
+    max_concurrent_backups: int = 2
+    max_parallel_threads: Union[int, None] = None
+    max_upload_speed: Union[float, None] = None
@@ -0,0 +1,32 @@
+from dataclasses import dataclass, fields
+from typing import Union
+
+from exceptions import ConfigError
+from utils import CronExpression
+
+
+@dataclass(frozen=True)
+class ScheduleConfig:
+    create: Union[str, None] = None
+    create_upload: Union[str, None] = None
+    rotate: Union[str, None] = None
+    verify: Union[str, None] = None
+    check: Union[str, None] = None
+
+    def __post_init__(self):
+        try:
+            jobs = self.jobs
+        except ValueError as e:
+            raise ConfigError(f"Invalid 'schedule' option: [default]{e}")
+
+        if len(jobs) == 0:
+            raise ConfigError("The 'schedule' option has no jobs: [default]create, create_upload, rotate, verify or check expected")
+
+    @property
+    def jobs(self) -> dict:
+        """ Command name => cron expression of every scheduled job """
+
+        return {
+            field.name: CronExpression(getattr(self, field.name))
+            for field in fields(self) if getattr(self, field.name) is not None
+        }
@@ -1,5 +1,10 @@
+import dataclasses
 from dataclasses import dataclass
 from pathlib import PurePath
+from typing import Union
+
+from exceptions import ConfigError
+from .xtrabackup_config import AUTO, is_thread_count
 
 
 @dataclass(frozen=True)
@@ -8,3 +13,52 @@ class SftpConfig:
     user: str
     password: str
     path: PurePath = PurePath('/')
+    port: int = 22
+    # concurrent read requests of a download, paramiko decides if not set, 'auto' picks a value from the host resources
+    prefetch_requests: Union[int, str, None] = None
+    # a name to tell destinations apart when there are several of them (the host by default)
+    name: Union[str, None] = None
+    # attempts to upload a file again after a failure
+    retries: int = 2
+    # a failed upload to a destination which is not required is a warning only (if another destination succeeded)
+    required: bool = True
+    # MB, the SSH channel window: data the storage host can send before an acknowledgement (paramiko default 2 MB),
+    # a small window caps downloads over links with a high latency
+    window_size: Union[int, None] = None
+    # KB, the largest SSH packet accepted (paramiko default 32 KB)
+    max_packet_size: Union[int, None] = None
+    # ciphers in the order of preference, the ones paramiko doesn't implement are skipped
+    ciphers: Union[tuple, None] = None
+    # SSH compression, off by default: the archives are compressed already
+    compress: bool = False
+    # transfer files over raw SSH exec channels (cat) instead of SFTP if the storage host runs commands
+    ssh_streams: bool = False
+
+    def __post_init__(self):
+        if self.prefetch_requests is not None and not is_thread_count(self.prefetch_requests):
+            raise ConfigError("Invalid 'sftp.prefetch_requests' option: [default]a positive number or 'auto' expected")
+        if self.window_size is not None and (not isinstance(self.window_size, int) or not 0 < self.window_size < 4096):
+            raise ConfigError("Invalid 'sftp.window_size' option: [default]1-4095 MB expected")
+        if self.max_packet_size is not None and (
+            not isinstance(self.max_packet_size, int) or not 32 <= self.max_packet_size <= 256
+        ):
+            raise ConfigError("Invalid 'sftp.max_packet_size' option: [default]32-256 KB expected")
+        if self.ciphers is not None:
+            if isinstance(self.ciphers, str) or len(self.ciphers) == 0:
+                raise ConfigError("Invalid 'sftp.ciphers' option: [default]a list of cipher names expected")
+            # a list in the config, the config is hashable (a key of connection pools)
+            object.__setattr__(self, 'ciphers', tuple(self.ciphers))
+
+    @property
+    def label(self) -> str:
+        return self.name or self.host
+
+    @property
+    def is_auto_tuned(self) -> bool:
+        return self.prefetch_requests == AUTO
+
+    def tuned(self, tuning: dict) -> 'SftpConfig':
+        if not self.is_auto_tuned:
+            return self
+
+        return dataclasses.replace(self, prefetch_requests=tuning['sftp_prefetch_requests'])
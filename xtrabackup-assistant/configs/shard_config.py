@@ -0,0 +1,15 @@
+from dataclasses import dataclass
+
+from exceptions import ConfigError
+
+MAX_SHARDS = 64
+
+
+@dataclass(frozen=True)
+class ShardConfig:
+    # archives the backup stream is split into (by schema, large schemas by table), written and transferred in parallel
+    count: int = 4
+
+    def __post_init__(self):
+        if not isinstance(self.count, int) or not 2 <= self.count <= MAX_SHARDS:
+            raise ConfigError(f"Invalid 'shard.count' option: [default]an integer from 2 to {MAX_SHARDS} expected")
@@ -0,0 +1,23 @@
+from dataclasses import dataclass
+
+from exceptions import ConfigError
+
+MIN_PART_SIZE = 16
+
+
+@dataclass(frozen=True)
+class SplitConfig:
+    # MB, the archive is written as parts of this size (the last one is smaller)
+    part_size: int = 1024
+    # parts transferred concurrently
+    workers: int = 4
+
+    def __post_init__(self):
+        if not isinstance(self.part_size, int) or self.part_size < MIN_PART_SIZE:
+            raise ConfigError(f"Invalid 'split.part_size' option: [default]{MIN_PART_SIZE} MB or more expected")
+        if not isinstance(self.workers, int) or self.workers < 1:
+            raise ConfigError("Invalid 'split.workers' option: [default]a positive integer expected")
+
+    @property
+    def part_size_bytes(self) -> int:
+        return self.part_size * 1024 * 1024
@@ -0,0 +1,69 @@
+from dataclasses import dataclass, field
+from datetime import datetime, time
+from typing import Union
+
+from exceptions import ConfigError
+
+
+@dataclass(frozen=True)
+class ThrottleConfig:
+    LIMITS = ('xtrabackup_throttle', 'disk_speed', 'network_speed')
+
+    # xtrabackup --throttle: the number of 10 MB chunks copied per second
+    xtrabackup_throttle: Union[int, None] = None
+    # MB/s for the tar archive copy
+    disk_speed: Union[float, None] = None
+    # MB/s for SFTP transfers
+    network_speed: Union[float, None] = None
+    # time-of-day windows overriding the limits above: [{"from": "08:00", "to": "20:00", "disk_speed": 50}, ...]
+    schedule: list = field(default_factory=list)
+
+    def __post_init__(self):
+        for limit in self.LIMITS:
+            if not self.is_valid_limit(getattr(self, limit)):
+                raise ConfigError(f"Invalid 'throttle.{limit}' option (a number or null expected): "
+                                  f"[default]{getattr(self, limit)!r}")
+        if self.xtrabackup_throttle is not None and not isinstance(self.xtrabackup_throttle, int):
+            raise ConfigError(f"Invalid 'throttle.xtrabackup_throttle' option (a whole number of chunks expected): "
+                              f"[default]{self.xtrabackup_throttle!r}")
+        if not isinstance(self.schedule, list):
+            raise ConfigError("Invalid 'throttle.schedule' option: [default]a list of windows expected")
+        for window in self.schedule:
+            if not isinstance(window, dict):
+                raise ConfigError(f"Invalid 'throttle.schedule' window: [default]{window!r}")
+            unknown_fields = set(window.keys()) - {'from', 'to', *self.LIMITS}
+            if 'from' not in window or 'to' not in window or len(unknown_fields) > 0:
+                raise ConfigError(f"Invalid 'throttle.schedule' window: [default]{window}")
+            try:
+                self._parse_time(window['from'])
+                self._parse_time(window['to'])
+            except (TypeError, ValueError):
+                raise ConfigError(f"Invalid 'throttle.schedule' time (HH:MM expected): [default]{window}")
+            if not all(self.is_valid_limit(window[limit]) for limit in self.LIMITS if limit in window):
+                raise ConfigError(f"Invalid 'throttle.schedule' limits (a number or null expected): [default]{window}")
+
+    @staticmethod
+    def is_valid_limit(value) -> bool:
+        """ A limit is a non-negative number, None (or 0) for no limit """
+
+        return value is None or (isinstance(value, (int, float)) and not isinstance(value, bool) and value >= 0)
+
+    def limits_at(self, moment: datetime) -> dict:
+        """ Limits in effect at the moment: the first matching schedule window overrides the defaults """
+
+        limits = {limit: getattr(self, limit) for limit in self.LIMITS}
+
+        current_time = moment.time()
+        for window in self.schedule:
+            start, end = self._parse_time(window['from']), self._parse_time(window['to'])
+            # a window like 22:00-06:00 wraps midnight
+            in_window = start <= current_time < end if start <= end else (current_time >= start or current_time < end)
+            if in_window:
+                limits.update({limit: window[limit] for limit in self.LIMITS if limit in window})
+                break
+
+        return limits
+
+    @staticmethod
+    def _parse_time(value: str) -> time:
+        return datetime.strptime(value, '%H:%M').time()
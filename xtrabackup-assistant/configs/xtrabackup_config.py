@@ -1,4 +1,18 @@
+import dataclasses
 from dataclasses import dataclass
+from pathlib import Path
+from typing import Union
+
+from exceptions import ConfigError
+
+AUTO = 'auto'
+ENCRYPTION_ALGORITHMS = ('AES128', 'AES192', 'AES256')
+THREAD_OPTIONS = ('parallel', 'compress_threads', 'decompress_threads', 'encrypt_threads')
+
+
+
+def is_thread_count(value) -> bool:
+    return value == AUTO or (isinstance(value, int) and not isinstance(value, bool) and value > 0)
 
 
 @dataclass(frozen=True)
@@ -6,4 +20,51 @@ class XtrabackupConfig:
     user: str
     password: str
     host: str
-    parallel: int = 10
+    # thread options accept 'auto' to pick a value from the host resources at the start of a run
+    parallel: Union[int, str] = 10
+    compress_threads: Union[int, str] = 5
+    decompress_threads: Union[int, str] = 5
+    # xtrabackup --encrypt: the backup stream is encrypted (after the compression) with the key from the key file,
+    # xbstream decrypts it while extracting on restore
+    encrypt: Union[str, None] = None
+    encrypt_key_file: Union[str, None] = None
+    encrypt_threads: Union[int, str] = 4
+    # the MySQL datadir `restore --apply` moves a prepared backup into (MySQL stopped, the datadir empty)
+    datadir: Union[str, None] = None
+
+    def __post_init__(self):
+        for option in THREAD_OPTIONS:
+            if not is_thread_count(getattr(self, option)):
+                raise ConfigError(
+                    f"Invalid 'xtrabackup.{option}' option: [default]a positive number or 'auto' expected"
+                )
+        if self.datadir is not None and not Path(self.datadir).is_absolute():
+            raise ConfigError("Invalid 'xtrabackup.datadir' option: [default]an absolute path expected")
+        if self.encrypt is None:
+            return
+        if self.encrypt not in ENCRYPTION_ALGORITHMS:
+            raise ConfigError(
+                f"Invalid 'xtrabackup.encrypt' option, expected one of: [default]{', '.join(ENCRYPTION_ALGORITHMS)}"
+            )
+        if self.encrypt_key_file is None or not Path(self.encrypt_key_file).is_file():
+            raise ConfigError(f"Encryption key file not found: [default]{self.encrypt_key_file}")
+
+    @property
+    def encryption_options(self) -> tuple:
+        """ Key and threads options shared by xtrabackup --encrypt and xbstream --decrypt, empty if it's off """
+
+        if self.encrypt is None:
+            return ()
+
+        return f"--encrypt-key-file={self.encrypt_key_file}", f"--encrypt-threads={self.encrypt_threads}"
+
+    @property
+    def is_auto_tuned(self) -> bool:
+        return AUTO in (getattr(self, option) for option in THREAD_OPTIONS)
+
+    def tuned(self, tuning: dict) -> 'XtrabackupConfig':
+        """ Copy with 'auto' options replaced by the tuned values """
+
+        return dataclasses.replace(self, **{
+            option: tuning[option] for option in THREAD_OPTIONS if getattr(self, option) == AUTO
+        })
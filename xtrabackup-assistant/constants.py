@@ -9,6 +9,29 @@ CONFIG_PATH: Path = Path(ROOT_DIR, 'conf/config.json')
 BACKUPS_DIR_PATH: Path = Path(ROOT_DIR, 'data/backups')
 TEMP_DIR_PATH: Path = Path(ROOT_DIR, 'data/tmp')
 RESTORE_DIR_PATH: Path = Path(ROOT_DIR, 'data/restore')
+RESTORE_WORK_DIR_PATH: Path = Path(ROOT_DIR, 'data/restore-work')
+CACHE_DIR_PATH: Path = Path(ROOT_DIR, 'data/cache')
+RUN_DIR_PATH: Path = Path(ROOT_DIR, 'data/run')
+REPORTS_DIR_PATH: Path = Path(ROOT_DIR, 'data/reports')
+CHUNKS_DIR_PATH: Path = Path(ROOT_DIR, 'data/chunks')
+BINLOGS_DIR_PATH: Path = Path(ROOT_DIR, 'data/binlogs')
+REPLAY_DIR_PATH: Path = Path(ROOT_DIR, 'data/replay')
+# the cleared dirs are moved there and deleted in the background
+TRASH_DIR_PATH: Path = Path(ROOT_DIR, 'data/.trash')
+
+RESTORE_STATE_PATH: Path = Path(RESTORE_WORK_DIR_PATH, 'state.json')
+# in order, a stage works on the output of the previous one
+RESTORE_STAGES: tuple = ('download', 'extract_xbstream', 'extract_qp', 'decompress', 'prepare', 'apply')
+
+ENVIRONMENT_CACHE_PATH: Path = Path(CACHE_DIR_PATH, 'environment.json')
+# sizes and durations of the previous runs, the next ones are planned from them
+RUN_HISTORY_PATH: Path = Path(CACHE_DIR_PATH, 'run-history.json')
+
+JOB_LOCK_PATH: Path = Path(RUN_DIR_PATH, 'job.lock')
+DAEMON_LOCK_PATH: Path = Path(RUN_DIR_PATH, 'daemon.lock')
+DAEMON_STATUS_PATH: Path = Path(RUN_DIR_PATH, 'daemon-status.json')
+BINLOG_LOCK_PATH: Path = Path(RUN_DIR_PATH, 'binlog.lock')
+THROTTLE_CONTROL_PATH: Path = Path(RUN_DIR_PATH, 'throttle.json')
 
 LOGS_DIR_PATH: Path = Path(ROOT_DIR, 'logs')
 PRIMARY_LOG_PATH: Path = Path(LOGS_DIR_PATH, f"xtrabackup-assistant-{now('%Y')}.log")
@@ -6,5 +6,9 @@ class ConfigError(AssistantException):
     pass
 
 
-class SftpError(AssistantException):
+class StorageError(AssistantException):
+    pass
+
+
+class SftpError(StorageError):
     pass
@@ -2,12 +2,9 @@
 
 import sys
 
-from assistant import Assistant, Command
+from assistant import Command
 from cli import Cli
-from configs import Config
-from constants import TEMP_DIR_PATH
 from exceptions import ConfigError
-from utils import clear_dir, echo, echo_error
 
 NAME = 'Percona XtraBackup Assistant'
 VERSION = '1.0.10'
@@ -15,24 +12,32 @@ AUTHOR = 'Anton Samofal'
 MIN_PYTHON_VERSION = (3, 9)
 
 
-def main(command: Command):
+def main(command: Command, options: dict):
+    from assistant import Assistant
+    from configs import Config
+
     config = Config()
     config.print_ready_message()
 
     assistant = Assistant(config)
-    assistant.execute(command)
+    assistant.execute(command, options)
 
 
 if __name__ == '__main__':
     if sys.version_info < MIN_PYTHON_VERSION:
+        from utils import echo_error
         echo_error("Python %s.%s or newer is required." % MIN_PYTHON_VERSION)
         sys.exit(1)
 
     cli = Cli(NAME, VERSION)
     cli.register_arguments()
+    command, options = cli.get_command(), cli.get_options()
+
+    # rich, the configs and the commands are imported once the arguments are parsed, `--help` doesn't need them
+    from utils import echo, echo_error
 
     try:
-        main(cli.get_command())
+        main(command, options)
     except ConfigError as error:
         echo_error(error, 'Config')
         sys.exit(1)
@@ -42,5 +47,3 @@ if __name__ == '__main__':
     except KeyboardInterrupt:
         echo('\rTerminating...', author=None, time=False)
         sys.exit()
-    finally:
-        clear_dir(TEMP_DIR_PATH)
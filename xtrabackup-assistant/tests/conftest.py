@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# the modules import each other as top level packages (common, utils, ...), as main.py runs them
+sys.path.insert(0, str(Path(__file__).parent.parent))
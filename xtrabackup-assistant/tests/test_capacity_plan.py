@@ -0,0 +1,81 @@
+import os
+from collections import namedtuple
+
+import pytest
+
+from common import CapacityPlan
+from common import capacity_plan
+
+DiskUsage = namedtuple('DiskUsage', 'total used free')
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def filesystems(tmp_path, monkeypatch):
+    """ The dirs under tmp_path/<device> are on the filesystem <device>, with free MB set by the test """
+
+    free = {}
+    real_stat = os.stat
+
+    def device_of(path) -> str:
+        return os.path.relpath(path, tmp_path).split(os.sep)[0]
+
+    def stat(path, **kwargs):
+        result = real_stat(path, **kwargs)
+        if not str(path).startswith(str(tmp_path)):
+            return result
+        return os.stat_result((*result[:2], hash(device_of(path)), *result[3:]))
+
+    monkeypatch.setattr(capacity_plan.os, 'stat', stat)
+    monkeypatch.setattr(
+        capacity_plan.shutil,
+        'disk_usage',
+        lambda path: DiskUsage(1024 * MB, 0, free[device_of(path)] * MB)
+    )
+
+    return free
+
+
+def test_dirs_on_one_filesystem_add_up(tmp_path, filesystems):
+    filesystems['ssd'] = 100
+    (tmp_path / 'ssd' / 'tmp').mkdir(parents=True)
+    (tmp_path / 'ssd' / 'backups').mkdir()
+
+    assert CapacityPlan({tmp_path / 'ssd' / 'tmp': 40 * MB, tmp_path / 'ssd' / 'backups': 40 * MB}).fits
+
+    shortages = CapacityPlan({tmp_path / 'ssd' / 'tmp': 50 * MB, tmp_path / 'ssd' / 'backups': 50 * MB}).shortages()
+    paths, needed, free = shortages[0]
+    assert len(shortages) == 1
+    assert paths == [tmp_path / 'ssd' / 'tmp', tmp_path / 'ssd' / 'backups']
+    assert needed == int(50 * MB * CapacityPlan.MARGIN) * 2
+    assert free == 100 * MB
+
+
+def test_filesystems_are_checked_separately(tmp_path, filesystems):
+    filesystems['ssd'] = 100
+    filesystems['hdd'] = 10
+    (tmp_path / 'ssd').mkdir()
+    (tmp_path / 'hdd').mkdir()
+
+    shortages = CapacityPlan({tmp_path / 'ssd': 50 * MB, tmp_path / 'hdd': 50 * MB}).shortages()
+
+    assert [paths for paths, _, _ in shortages] == [[tmp_path / 'hdd']]
+
+
+def test_missing_dir_is_on_the_filesystem_of_its_parent(tmp_path, filesystems):
+    filesystems['hdd'] = 10
+    (tmp_path / 'hdd').mkdir()
+
+    shortages = CapacityPlan({tmp_path / 'hdd' / 'tmp' / 'project': 50 * MB}).shortages()
+
+    assert shortages == [([tmp_path / 'hdd' / 'tmp' / 'project'], int(50 * MB * CapacityPlan.MARGIN), 10 * MB)]
+
+
+def test_nothing_needed_fits(tmp_path, filesystems):
+    filesystems['hdd'] = 0
+    (tmp_path / 'hdd').mkdir()
+
+    plan = CapacityPlan({tmp_path / 'hdd': 0})
+
+    assert plan.fits
+    assert plan.describe() == 'no extra space'
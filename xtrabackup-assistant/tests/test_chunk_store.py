@@ -0,0 +1,38 @@
+import hashlib
+import os
+import time
+
+from common import ChunkStore
+
+
+def put_chunk(store: ChunkStore, data: bytes, age: float = 0) -> str:
+    chunk_id = hashlib.sha256(data).hexdigest()
+    store.put(chunk_id, data)
+    if age > 0:
+        modified_at = time.time() - age
+        os.utime(store.path_for(chunk_id), (modified_at, modified_at))
+
+    return chunk_id
+
+
+def test_unreferenced_chunks_are_kept_within_the_grace_period(tmp_path):
+    store = ChunkStore(tmp_path)
+    referenced_id = put_chunk(store, b'referenced', age=2 * ChunkStore.GARBAGE_GRACE_PERIOD)
+    old_id = put_chunk(store, b'old', age=2 * ChunkStore.GARBAGE_GRACE_PERIOD)
+    # written by a backup whose index isn't there yet
+    new_id = put_chunk(store, b'new')
+
+    assert store.collect_garbage({referenced_id}) == (1, len(b'old'))
+    assert not store.has(old_id)
+    assert store.has(referenced_id) and store.has(new_id)
+
+
+def test_reused_chunk_is_kept(tmp_path):
+    store = ChunkStore(tmp_path)
+    chunk_id = put_chunk(store, b'reused', age=2 * ChunkStore.GARBAGE_GRACE_PERIOD)
+
+    # a new backup refers to it again, before its index is written
+    assert store.put(chunk_id, b'reused') is False
+
+    assert store.collect_garbage(set()) == (0, 0)
+    assert store.has(chunk_id)
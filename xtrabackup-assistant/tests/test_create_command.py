@@ -0,0 +1,82 @@
+import hashlib
+import io
+import os
+import tarfile
+from types import SimpleNamespace
+
+import pytest
+from rich.table import Table
+
+from assistant.commands import create
+from assistant.commands.create import CreateCommand
+from common import XtrabackupLogPipeline
+from test_xtrabackup_log_pipeline import COMPRESSED_LOG, FILE_SIZES
+
+
+def test_slowest_files_are_reported_from_the_log(tmp_path, monkeypatch):
+    echoed = []
+    logged = []
+    monkeypatch.setattr(create, 'echo', lambda text, **_: echoed.append(text))
+    monkeypatch.setattr(create, 'logger', SimpleNamespace(info=logged.append))
+
+    with XtrabackupLogPipeline(io.BytesIO(COMPRESSED_LOG), tmp_path / 'xtrabackup.log', interactive=False) as pipeline:
+        pass
+    command = CreateCommand(env=None, config=SimpleNamespace(project_name='test'))
+    command._report_slowest_files(pipeline.copy_times, FILE_SIZES)
+
+    table, = echoed
+    assert isinstance(table, Table)
+    assert table.row_count == 2
+    assert sorted(table.columns[0].cells) == ['./db/t1.ibd', './ibdata1']
+    # the sizes of the estimate are matched by the paths in the log
+    assert '-' not in list(table.columns[1].cells)
+    assert logged[0].startswith('[test] Slowest copied files:')
+    assert './ibdata1: ' in logged[0] and './db/t1.ibd: ' in logged[0]
+
+
+def streamed_command(tmp_path) -> CreateCommand:
+    command = CreateCommand(env=None, config=SimpleNamespace(project_name='test', checksum_algorithm='sha256'))
+    command._temp_backup_file_path = tmp_path / '2026-10-19-03-00_test_8.0.35-27.xbstream'
+    command._temp_log_path = tmp_path / 'xtrabackup.log'
+    command._temp_log_path.write_bytes(COMPRESSED_LOG)
+
+    return command
+
+
+def test_member_header_length_does_not_depend_on_the_size():
+    name = '2026-10-19-03-00_test_8.0.35-27.xbstream'
+
+    # a header written for an unknown size is replaced by the one with the size once the stream is complete
+    assert {len(CreateCommand._member_header(name, size)) for size in (0, 1, 8 ** 11, 2 ** 40)} == {tarfile.BLOCKSIZE}
+
+
+@pytest.mark.parametrize('stream_size', [0, 1, tarfile.BLOCKSIZE, 3 * tarfile.BLOCKSIZE + 17])
+def test_streamed_archive_is_a_valid_tar(tmp_path, stream_size):
+    command = streamed_command(tmp_path)
+    archive_path = tmp_path / '2026-10-19-03-00_test_8.0.35-27.tar'
+    stream = os.urandom(stream_size)
+    # as xtrabackup leaves it: the stream after the space for the header
+    with CreateCommand._open_streamed_archive(archive_path, command._temp_backup_file_path.name) as partial_file:
+        partial_file.write(stream)
+
+    size, manifest = command._finish_streamed_archive(archive_path)
+
+    archive = CreateCommand._partial_path(archive_path).read_bytes()
+    assert size == manifest.size == len(archive)
+    assert manifest.filename == archive_path.name
+    assert manifest.digest == hashlib.sha256(archive).hexdigest()
+    assert command._stream_size == stream_size
+    with tarfile.open(CreateCommand._partial_path(archive_path)) as tar:
+        assert tar.getnames() == [command._temp_backup_file_path.name, 'xtrabackup.log']
+        assert tar.extractfile(command._temp_backup_file_path.name).read() == stream
+        assert tar.extractfile('xtrabackup.log').read() == COMPRESSED_LOG
+
+
+def test_removed_archive_takes_the_partial_file_and_the_empty_month_dir(tmp_path):
+    archive_path = tmp_path / '2026' / '10' / '2026-10-19-03-00_test_8.0.35-27.tar'
+    archive_path.parent.mkdir(parents=True)
+    CreateCommand._partial_path(archive_path).write_bytes(b'\0' * tarfile.BLOCKSIZE)
+
+    CreateCommand._remove_archive(archive_path)
+
+    assert not archive_path.parent.exists()
@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+
+import pytest
+
+from assistant.commands import orchestrate
+from assistant.commands.orchestrate import OrchestrateCommand
+from configs import OrchestrationConfig, XtrabackupConfig
+
+
+def target_config(name: str) -> SimpleNamespace:
+    return SimpleNamespace(
+        project_name=name, slack=None, xtrabackup=XtrabackupConfig(user='root', password='', host='localhost')
+    )
+
+
+def orchestrator(targets: list, orchestration: OrchestrationConfig = OrchestrationConfig()) -> OrchestrateCommand:
+    config = SimpleNamespace(targets=targets, orchestration=orchestration)
+    return OrchestrateCommand(env=None, config=config, target_names=[], throttle=SimpleNamespace(network=None))
+
+
+def test_unexpected_target_error_fails_the_run(monkeypatch):
+    class TargetCreateCommand:
+        def __init__(self, env, config, *_):
+            self._config = config
+            self.backup = None
+
+        def execute(self, upload):
+            if self._config.project_name == 'broken':
+                raise OSError('No space left on device')
+
+    monkeypatch.setattr(orchestrate, 'TargetCreateCommand', TargetCreateCommand)
+    monkeypatch.setattr(orchestrate, 'echo', lambda *_, **__: None)
+    command = orchestrator([target_config('broken'), target_config('healthy')])
+
+    with pytest.raises(RuntimeError, match='1 of 2 targets'):
+        command.execute(upload=False)
+
+    assert command._states['broken'].phase == 'failed'
+    assert command._states['broken'].error == 'OSError: No space left on device'
+    assert command._states['healthy'].phase == 'done'
+
+
+def test_thread_budget_does_not_change_the_target_config():
+    target = target_config('db1')
+
+    command = orchestrator([target], OrchestrationConfig(max_parallel_threads=4))
+
+    assert command._targets[0].xtrabackup.parallel == 4
+    assert target.xtrabackup.parallel == 10
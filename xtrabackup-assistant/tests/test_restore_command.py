@@ -0,0 +1,108 @@
+from datetime import datetime
+from pathlib import PurePath
+from types import SimpleNamespace
+
+import pytest
+
+from assistant.commands import restore
+from assistant.commands.restore import RestoreCommand
+from common import Backup, BinlogIndex, Manifest
+
+
+def binlog(name: str, first_event_at: str, last_event_at: str) -> dict:
+    return {'name': name, 'filename': f"{name}.gz", 'size': 1, 'algorithm': 'sha256', 'digest': '',
+            'first_event_at': first_event_at, 'last_event_at': last_event_at, 'gtids': ''}
+
+
+INDEX = BinlogIndex([
+    binlog('binlog.000003', '2026-10-19 01:00:00', '2026-10-19 03:10:00'),
+    binlog('binlog.000004', '2026-10-19 03:10:00', '2026-10-19 05:00:00'),
+])
+
+
+def restore_command(monkeypatch, tmp_path, index: BinlogIndex, binlog_position=None) -> RestoreCommand:
+    monkeypatch.setattr(restore, 'RESTORE_DIR_PATH', tmp_path)
+    monkeypatch.setattr(restore, 'echo_warning', lambda *_, **__: None)
+    destination = SimpleNamespace(label='storage')
+
+    command = RestoreCommand.__new__(RestoreCommand)
+    command.target_backup = Backup('local', PurePath('2026-10-19-03-00_test_8.0.35-27.tar'), size=1)
+    command._manifest = Manifest('2026-10-19-03-00_test_8.0.35-27.tar', 1, 'sha256', '', '', binlog_position)
+    command._binlog_index = lambda _: (destination, index)
+
+    return command
+
+
+def test_binlogs_are_resolved_from_the_manifest_position(monkeypatch, tmp_path):
+    command = restore_command(monkeypatch, tmp_path, INDEX, ['binlog.000003', 157])
+
+    assert command._resolve_binlogs(datetime(2026, 10, 19, 4))[1] is INDEX
+
+
+def test_missing_binlog_of_the_position_fails_before_the_stages(monkeypatch, tmp_path):
+    command = restore_command(monkeypatch, tmp_path, INDEX, ['binlog.000002', 157])
+
+    with pytest.raises(RuntimeError, match='binlog.000002 is not streamed'):
+        command._resolve_binlogs(datetime(2026, 10, 19, 4))
+
+
+def test_restored_binlog_position_is_preferred_to_the_manifest(monkeypatch, tmp_path):
+    (tmp_path / 'xtrabackup_binlog_info').write_text('binlog.000002\t157\n')
+    command = restore_command(monkeypatch, tmp_path, INDEX, ['binlog.000003', 157])
+
+    with pytest.raises(RuntimeError, match='binlog.000002 is not streamed'):
+        command._resolve_binlogs(datetime(2026, 10, 19, 4))
+
+
+def test_binlogs_ending_before_the_backup_fail_without_a_position(monkeypatch, tmp_path):
+    index = BinlogIndex([binlog('binlog.000002', '2026-10-18 01:00:00', '2026-10-19 02:00:00')])
+    command = restore_command(monkeypatch, tmp_path, index)
+
+    with pytest.raises(RuntimeError, match='before the backup was taken'):
+        command._resolve_binlogs(datetime(2026, 10, 19, 4))
+    assert restore_command(monkeypatch, tmp_path, INDEX)._resolve_binlogs(datetime(2026, 10, 19, 4))[1] is INDEX
+
+
+def test_empty_binlog_index_fails(monkeypatch, tmp_path):
+    command = restore_command(monkeypatch, tmp_path, BinlogIndex(), ['binlog.000003', 157])
+
+    with pytest.raises(RuntimeError, match='No binary logs streamed'):
+        command._resolve_binlogs(datetime(2026, 10, 19, 4))
+
+
+def listing_command(backups: list) -> RestoreCommand:
+    command = RestoreCommand.__new__(RestoreCommand)
+    command._config = SimpleNamespace(project_name='test', sftp_destinations=[], local_storages=[])
+    command.backup_list = backups
+    command._years = ['2026']
+    command._list_next_year = lambda: False
+    command._unavailable_sources = []
+
+    return command
+
+
+def test_backup_taken_at_the_time_is_chosen_without_a_replay():
+    backups = [Backup('local', PurePath(f"2026-10-19-{hour}-00_test_8.0.35-27.tar"), size=1) for hour in ('04', '03')]
+    command = listing_command(backups)
+
+    assert command._backup_before(datetime(2026, 10, 19, 4), pitr=False) is backups[0]
+    # the binary log position of a backup started at the time is past it
+    assert command._backup_before(datetime(2026, 10, 19, 4), pitr=True) is backups[1]
+
+
+@pytest.mark.parametrize('error, reason', [
+    (RuntimeError('Invalid binary log index [default]/backups/binlogs/test/index.json'),
+     'Invalid binary log index [default]/backups/binlogs/test/index.json'),
+    (KeyError('digest'), "KeyError: 'digest'"),
+])
+def test_listing_error_is_reported(monkeypatch, error, reason):
+    warnings = []
+    monkeypatch.setattr(restore, 'echo_warning', lambda text, **_: warnings.append(text))
+    monkeypatch.setattr(restore, 'logger', SimpleNamespace(exception=lambda *_: None))
+    command = listing_command([])
+
+    def fail():
+        raise error
+
+    assert command._list_sources(fail, lambda _: []) == {}
+    assert warnings == [f"Backups from local backups not included to the list: {reason}"]
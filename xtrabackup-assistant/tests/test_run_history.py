@@ -0,0 +1,49 @@
+import pytest
+
+from common import RunHistory
+
+
+@pytest.fixture
+def history_path(tmp_path):
+    return tmp_path / 'run-history.json'
+
+
+def test_oldest_runs_of_the_project_and_command_are_pruned(history_path, monkeypatch):
+    monkeypatch.setattr(RunHistory, 'MAX_RUNS', 3)
+    RunHistory.record(history_path, 'other', 'create', data_size=1)
+    for data_size in range(1, 6):
+        RunHistory.record(history_path, 'test', 'create', data_size=data_size)
+    RunHistory.record(history_path, 'test', 'restore', archive_size=1)
+
+    history = RunHistory.load(history_path)
+
+    assert [run['data_size'] for run in history.of('test', 'create')] == [3, 4, 5]
+    assert len(history.of('other', 'create')) == 1
+    assert len(history.of('test', 'restore')) == 1
+
+
+def test_predictions_are_medians(history_path):
+    for data_size, stream_size, seconds in ((100, 10, 1), (100, 20, 2), (200, 60, 10)):
+        RunHistory.record(
+            history_path,
+            'test',
+            'create',
+            data_size=data_size,
+            stream_size=stream_size,
+            durations={'backup': seconds}
+        )
+
+    history = RunHistory.load(history_path)
+
+    assert history.compression_ratio('test') == pytest.approx(0.2)
+    assert history.seconds_per_byte('test', 'create', 'backup') == pytest.approx(0.02)
+    assert history.seconds_per_byte('test', 'create', 'upload') is None
+    assert history.last('test', 'create', 'data_size') == 200
+    assert history.compression_ratio('other') is None
+
+
+def test_missing_or_damaged_history_is_empty(history_path):
+    assert RunHistory.load(history_path).runs == []
+
+    history_path.write_text('{"runs": [')
+    assert RunHistory.load(history_path).runs == []
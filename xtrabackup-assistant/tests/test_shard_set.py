@@ -0,0 +1,137 @@
+import io
+import zlib
+
+import pytest
+
+from common import ShardPlan, XbstreamSharder, XbstreamScanner
+from common.xbstream_scanner import HEADER, PAYLOAD_HEADER, SPARSE_MAP_SIZE, SPARSE_MAP_ENTRY, CHUNK_MAGIC, \
+    CHUNK_TYPE_PAYLOAD, CHUNK_TYPE_SPARSE, CHUNK_TYPE_EOF
+
+FILE_SIZES = {
+    './ibdata1': 12000,
+    './db/t1.ibd': 4000,
+    './db/t2.ibd': 2000,
+    './db/t3.ibd': 1000,
+    './big/t1.ibd': 30000,
+    './big/t2.ibd': 30000,
+}
+
+
+def payload_chunk(path: str, offset: int, data: bytes) -> bytes:
+    raw_path = bytes(path, 'utf-8')
+    return HEADER.pack(CHUNK_MAGIC, 0, CHUNK_TYPE_PAYLOAD, len(raw_path)) + raw_path + \
+        PAYLOAD_HEADER.pack(len(data), offset, zlib.crc32(data)) + data
+
+
+def sparse_chunk(path: str, offset: int, holes: list, data: bytes) -> bytes:
+    """ The data written after the holes, [(hole size, data size), ...] """
+
+    raw_path = bytes(path, 'utf-8')
+    sparse_map = b''.join(SPARSE_MAP_ENTRY.pack(skip, length) for skip, length in holes)
+    return HEADER.pack(CHUNK_MAGIC, 0, CHUNK_TYPE_SPARSE, len(raw_path)) + raw_path + \
+        SPARSE_MAP_SIZE.pack(len(holes)) + PAYLOAD_HEADER.pack(len(data), offset, zlib.crc32(data)) + sparse_map + data
+
+
+def eof_chunk(path: str) -> bytes:
+    raw_path = bytes(path, 'utf-8')
+    return HEADER.pack(CHUNK_MAGIC, 0, CHUNK_TYPE_EOF, len(raw_path)) + raw_path
+
+
+def parse_chunks(stream: bytes) -> list:
+    """ [(path, raw chunk), ...] """
+
+    chunks = []
+    position = 0
+    while position < len(stream):
+        start = position
+        _, _, chunk_type, path_length = HEADER.unpack_from(stream, position)
+        position += HEADER.size
+        path = str(stream[position:position + path_length], 'utf-8')
+        position += path_length
+        if chunk_type != CHUNK_TYPE_EOF:
+            sparse_map_size = 0
+            if chunk_type == CHUNK_TYPE_SPARSE:
+                sparse_map_size, = SPARSE_MAP_SIZE.unpack_from(stream, position)
+                position += SPARSE_MAP_SIZE.size
+            payload_length, _, _ = PAYLOAD_HEADER.unpack_from(stream, position)
+            position += PAYLOAD_HEADER.size + sparse_map_size * SPARSE_MAP_ENTRY.size + payload_length
+        chunks.append((path, stream[start:position]))
+
+    return chunks
+
+
+@pytest.fixture
+def stream() -> bytes:
+    """ The files interleaved as xtrabackup --parallel streams them, compressed and with a sparse tablespace """
+
+    return b''.join((
+        payload_chunk('ibdata1.qp', 0, b'a' * 100),
+        payload_chunk('db/t1.ibd.qp', 0, b'b' * 50),
+        payload_chunk('big/t1.ibd.qp', 0, b'c' * 70),
+        payload_chunk('ibdata1.qp', 100, b'a' * 30),
+        sparse_chunk('db/t1.ibd.qp', 50, [(4096, 10), (8192, 10)], b'b' * 20),
+        payload_chunk('big/t2.ibd.qp', 0, b'd' * 40),
+        eof_chunk('db/t1.ibd.qp'),
+        payload_chunk('db/t2.ibd.qp', 0, b'e' * 10),
+        eof_chunk('ibdata1.qp'),
+        payload_chunk('big/t1.ibd.qp', 70, b'c' * 5),
+        eof_chunk('big/t2.ibd.qp'),
+        eof_chunk('big/t1.ibd.qp'),
+        eof_chunk('db/t2.ibd.qp'),
+        payload_chunk('new/t9.ibd.qp', 0, b'f' * 3),
+        eof_chunk('new/t9.ibd.qp'),
+        payload_chunk('xtrabackup_checkpoints', 0, b'backup_type = full-backuped\n'),
+        eof_chunk('xtrabackup_checkpoints'),
+    ))
+
+
+def test_every_file_goes_to_one_shard_in_stream_order(tmp_path, stream):
+    plan = ShardPlan(3, FILE_SIZES)
+    paths = [tmp_path / f"shard{index + 1}.xbstream" for index in range(3)]
+
+    sharder = XbstreamSharder(io.BytesIO(stream), plan, paths).split()
+
+    shards = [path.read_bytes() for path in paths]
+    assert sharder.sizes == [len(shard) for shard in shards]
+    assert sum(sharder.sizes) == len(stream)
+
+    shard_chunks = [parse_chunks(shard) for shard in shards]
+    for path in {path for path, _ in parse_chunks(stream)}:
+        holding = [index for index, chunks in enumerate(shard_chunks) if any(name == path for name, _ in chunks)]
+        assert holding == [plan.shard_for(path)]
+        expected = [chunk for name, chunk in parse_chunks(stream) if name == path]
+        assert [chunk for name, chunk in shard_chunks[holding[0]] if name == path] == expected
+
+    # every shard is a complete xbstream stream of its own, as xbstream -x reads it
+    files = {}
+    for shard in shards:
+        files.update(XbstreamScanner(io.BytesIO(shard)).scan().files)
+    assert files == XbstreamScanner(io.BytesIO(stream)).scan().files
+
+
+def test_truncated_stream_fails(tmp_path, stream):
+    paths = [tmp_path / f"shard{index + 1}.xbstream" for index in range(2)]
+
+    with pytest.raises(RuntimeError, match='truncated'):
+        XbstreamSharder(io.BytesIO(stream[:-3]), ShardPlan(2, FILE_SIZES), paths).split()
+
+
+def test_plan_places_schemas_and_spreads_the_large_ones():
+    plan = ShardPlan(3, FILE_SIZES)
+
+    # the files outside the schemas (system tablespace, logs, metadata) go to the first shard
+    assert plan.shard_for('ibdata1.qp') == plan.shard_for('xtrabackup_checkpoints') == 0
+    # a schema within the share of a shard is kept together
+    assert plan.shard_for('db/t1.ibd.qp') == plan.shard_for('db/t2.ibd.qp') == plan.shard_for('./db/t3.ibd')
+    # a larger one is spread by table
+    assert plan.shard_for('big/t1.ibd.qp') != plan.shard_for('big/t2.ibd.qp')
+    assert plan.shard_for('big/t1.ibd.qp.xbcrypt') == plan.shard_for('./big/t1.ibd')
+    assert sum(plan.sizes) == sum(FILE_SIZES.values())
+
+
+def test_plan_places_unknown_files_the_same_way_every_time():
+    first, second = ShardPlan(4, FILE_SIZES), ShardPlan(4, FILE_SIZES)
+
+    assert first.shard_for('new/t9.ibd.qp') == second.shard_for('new/t9.ibd.qp')
+    # a table created in a schema of the estimate goes with the schema
+    assert first.shard_for('db/t4.ibd.qp') == first.shard_for('db/t1.ibd.qp')
@@ -0,0 +1,32 @@
+import signal
+
+import pytest
+
+from configs import ThrottleConfig
+from exceptions import ConfigError
+from utils import throttle
+from utils.throttle import Throttle
+
+
+@pytest.mark.parametrize('options', [
+    {'disk_speed': '50'},
+    {'network_speed': -1},
+    {'network_speed': True},
+    {'xtrabackup_throttle': 2.5},
+    {'schedule': [{'from': '08:00', 'to': '20:00', 'disk_speed': 'fast'}]},
+    {'schedule': ['08:00-20:00']},
+])
+def test_invalid_limits_fail_the_config(options):
+    with pytest.raises(ConfigError):
+        ThrottleConfig(**options)
+
+
+def test_sigusr1_handler_is_restored_on_stop(tmp_path, monkeypatch):
+    monkeypatch.setattr(throttle, 'THROTTLE_CONTROL_PATH', tmp_path / 'throttle.json')
+    previous_handler = signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+    try:
+        with Throttle(ThrottleConfig(disk_speed=50)):
+            assert signal.getsignal(signal.SIGUSR1) is not signal.SIG_IGN
+        assert signal.getsignal(signal.SIGUSR1) is signal.SIG_IGN
+    finally:
+        signal.signal(signal.SIGUSR1, previous_handler)
@@ -0,0 +1,97 @@
+import hashlib
+import os
+from pathlib import Path, PurePath
+from types import SimpleNamespace
+
+import pytest
+
+from assistant.commands.verify import VerifyCommand
+from common import Backup, ChunkIndex, Manifest, PartIndex, ShardIndex, BACKUP_FILE_PATTERN, CHUNKS_DIR_NAME
+
+
+class LocalSftp:
+    """ The Sftp calls of the verification on a local dir, a host which can't run commands """
+
+    def __init__(self):
+        self.sftp_client = SimpleNamespace(stat=os.stat, listdir=os.listdir)
+
+    @staticmethod
+    def exists(path: PurePath) -> bool:
+        return Path(path).exists()
+
+    @staticmethod
+    def read_text(path: PurePath) -> str:
+        return Path(path).read_text()
+
+    @staticmethod
+    def remote_checksum(*_) -> None:
+        return None
+
+    @staticmethod
+    def read_checksum(path: PurePath, algorithm: str, **_) -> str:
+        return hashlib.new(algorithm, Path(path).read_bytes()).hexdigest()
+
+
+def write_indexed_backup(dir_path: Path, index_class, suffix: str) -> Path:
+    parts = []
+    for number, data in enumerate((b'first part', b'second part'), start=1):
+        name = f"2026-10-19-03-00_test_8.0.35-27.tar.{suffix}{number:02d}"
+        (dir_path / name).write_bytes(data)
+        parts.append([name, len(data), hashlib.sha256(data).hexdigest()])
+    fields = {'part_size': 16} if index_class is PartIndex else {}
+    index = index_class(filename='2026-10-19-03-00_test_8.0.35-27.tar', size=21, algorithm='sha256',
+                        created_at='2026-10-19 03:05:00', parts=parts, **fields)
+
+    index_path = dir_path / f"2026-10-19-03-00_test_8.0.35-27{index_class.SUFFIX}"
+    index.save(index_path)
+    write_manifest(index_path)
+
+    return index_path
+
+
+def write_manifest(path: Path) -> None:
+    Manifest(path.name, path.stat().st_size, 'sha256', hashlib.sha256(path.read_bytes()).hexdigest(), '').save(
+        Path(Manifest.path_for(path))
+    )
+
+
+def verify(path: Path):
+    command = VerifyCommand.__new__(VerifyCommand)
+    command._throttle = None
+    command._sftp = lambda _: LocalSftp()
+    destination = SimpleNamespace(label='storage', path=str(path.parent))
+
+    return command._verify_backup(Backup('sftp', path, path.stat().st_size, destination=destination))
+
+
+@pytest.mark.parametrize('index_class, suffix', [(PartIndex, 'part'), (ShardIndex, 'shard')])
+def test_parts_are_verified_against_the_index(tmp_path, index_class, suffix):
+    index_path = write_indexed_backup(tmp_path, index_class, suffix)
+    assert BACKUP_FILE_PATTERN.search(index_path.name) is not None
+
+    result = verify(index_path)
+    assert (result.status, result.size, result.method) == ('ok', 21, 'sftp')
+
+    (tmp_path / f"2026-10-19-03-00_test_8.0.35-27.tar.{suffix}02").write_bytes(b'second pArt')
+    result = verify(index_path)
+    assert result.status == 'corrupted'
+    assert result.error == f"2026-10-19-03-00_test_8.0.35-27.tar.{suffix}02: sha256 checksum mismatch"
+
+    (tmp_path / f"2026-10-19-03-00_test_8.0.35-27.tar.{suffix}01").unlink()
+    assert verify(index_path).error == f"2026-10-19-03-00_test_8.0.35-27.tar.{suffix}01 missing"
+
+
+def test_missing_chunks_fail_the_verification(tmp_path):
+    chunk_ids = [hashlib.sha256(data).hexdigest() for data in (b'a', b'b')]
+    for chunk_id in chunk_ids[:1]:
+        (tmp_path / CHUNKS_DIR_NAME / chunk_id[:2]).mkdir(parents=True)
+        (tmp_path / CHUNKS_DIR_NAME / chunk_id[:2] / chunk_id).write_bytes(b'a')
+    index_path = tmp_path / '2026-10-19-03-00_test_8.0.35-27.chunks'
+    ChunkIndex(filename='2026-10-19-03-00_test_8.0.35-27.tar', size=2, chunks=[[chunk_ids[0], 1], [chunk_ids[1], 1]]) \
+        .save(index_path)
+    write_manifest(index_path)
+
+    result = verify(index_path)
+
+    assert (result.status, result.error) == ('corrupted', '1 of 2 chunks missing')
+    assert result.size == 2
@@ -0,0 +1,23 @@
+import pytest
+
+from configs import SftpConfig, XtrabackupConfig
+from exceptions import ConfigError
+
+
+@pytest.mark.parametrize('option', ['parallel', 'compress_threads', 'decompress_threads', 'encrypt_threads'])
+@pytest.mark.parametrize('value', [0, -4, '8', 'many', True, 2.5])
+def test_invalid_thread_options_fail_the_config(option, value):
+    with pytest.raises(ConfigError, match=f"xtrabackup.{option}"):
+        XtrabackupConfig(user='root', password='', host='localhost', **{option: value})
+
+
+def test_thread_options_accept_auto_and_positive_numbers():
+    config = XtrabackupConfig(user='root', password='', host='localhost', parallel='auto', compress_threads=1)
+
+    assert config.tuned({'parallel': 6}).parallel == 6
+
+
+@pytest.mark.parametrize('value', [0, '16', True])
+def test_invalid_prefetch_requests_fail_the_config(value):
+    with pytest.raises(ConfigError, match='sftp.prefetch_requests'):
+        SftpConfig(host='storage', user='backup', password='', prefetch_requests=value)
@@ -0,0 +1,102 @@
+import io
+import threading
+
+from common import XtrabackupLogPipeline
+
+# captured from xtrabackup 8.0.35 --backup --compress --stream=xbstream (with --encrypt=AES256 for the encrypted ones)
+COMPRESSED_LOG = b"""\
+2026-10-19T03:00:00.101532+00:00 0 [Note] [MY-011825] [Xtrabackup] recognized server arguments: --datadir=/var/lib/mysql
+2026-10-19T03:00:00.221876+00:00 0 [Note] [MY-011825] [Xtrabackup] Connecting to MySQL server host: db, user: backup, \
+password: set, port: not set, socket: not set
+2026-10-19T03:00:01.004120+00:00 1 [Note] [MY-011825] [Xtrabackup] Compressing and streaming ./ibdata1 to <STDOUT>
+2026-10-19T03:00:01.005471+00:00 2 [Note] [MY-011825] [Xtrabackup] Compressing and streaming ./db/t1.ibd to <STDOUT>
+2026-10-19T03:00:01.310009+00:00 2 [Note] [MY-011825] [Xtrabackup] Done: Compressing and streaming ./db/t1.ibd \
+to <STDOUT>
+2026-10-19T03:00:02.480113+00:00 1 [Note] [MY-011825] [Xtrabackup] Done: Compressing and streaming ./ibdata1 to <STDOUT>
+2026-10-19T03:00:02.490271+00:00 0 [Note] [MY-011825] [Xtrabackup] MySQL binlog position: filename 'binlog.000003', \
+position '157', GTID of the last change '3e11fa47-71ca-11e1-9e33-c80aa9429562:1-42'
+2026-10-19T03:00:02.501374+00:00 0 [Note] [MY-011825] [Xtrabackup] Transaction log of lsn (19084377) to (19084397) \
+was copied.
+2026-10-19T03:00:02.712230+00:00 0 [Note] [MY-011825] [Xtrabackup] completed OK!
+"""
+ENCRYPTED_LOG = b"""\
+2026-10-19T03:00:01.004120+00:00 1 [Note] [MY-011825] [Xtrabackup] Compressing, encrypting and streaming ./ibdata1 \
+to <STDOUT>
+2026-10-19T03:00:01.005471+00:00 2 [Note] [MY-011825] [Xtrabackup] Compressing, encrypting and streaming ./db/t1.ibd \
+to <STDOUT>
+2026-10-19T03:00:01.310009+00:00 2 [Note] [MY-011825] [Xtrabackup] Done: Compressing, encrypting and streaming \
+./db/t1.ibd to <STDOUT>
+2026-10-19T03:00:02.480113+00:00 1 [Note] [MY-011825] [Xtrabackup] Done: Compressing, encrypting and streaming \
+./ibdata1 to <STDOUT>
+2026-10-19T03:00:02.712230+00:00 0 [Note] [MY-011825] [Xtrabackup] completed OK!
+"""
+FILE_SIZES = {'./ibdata1': 12 * 1024 * 1024, './db/t1.ibd': 4 * 1024 * 1024}
+
+
+def run_pipeline(log: bytes, log_path, file_sizes=None) -> XtrabackupLogPipeline:
+    with XtrabackupLogPipeline(io.BytesIO(log), log_path, interactive=False, file_sizes=file_sizes) as pipeline:
+        pass
+
+    return pipeline
+
+
+def test_compressed_copy_messages_are_counted(tmp_path):
+    pipeline = run_pipeline(COMPRESSED_LOG, tmp_path / 'xtrabackup.log', FILE_SIZES)
+
+    assert pipeline._started_files_count == 2
+    assert pipeline._copied_files_count == 2
+    assert pipeline._copied_bytes == sum(FILE_SIZES.values())
+    assert list(pipeline.copy_times) == ['./db/t1.ibd', './ibdata1']
+
+
+def test_encrypted_copy_messages_are_counted(tmp_path):
+    pipeline = run_pipeline(ENCRYPTED_LOG, tmp_path / 'xtrabackup.log', FILE_SIZES)
+
+    assert pipeline._copied_files_count == 2
+    assert pipeline._copied_bytes == sum(FILE_SIZES.values())
+    assert set(pipeline.copy_times) == set(FILE_SIZES)
+
+
+def test_binlog_position_is_taken_from_the_log(tmp_path):
+    assert run_pipeline(COMPRESSED_LOG, tmp_path / 'xtrabackup.log').binlog_position == ['binlog.000003', 157]
+    # binary logging is off
+    assert run_pipeline(ENCRYPTED_LOG, tmp_path / 'xtrabackup.log').binlog_position is None
+
+
+def test_log_has_every_line(tmp_path):
+    log_path = tmp_path / 'xtrabackup.log'
+    run_pipeline(COMPRESSED_LOG, log_path)
+
+    assert log_path.read_bytes() == COMPRESSED_LOG
+
+
+def test_stream_is_drained_when_processing_fails(tmp_path):
+    stream = io.BytesIO(COMPRESSED_LOG)
+    pipeline = XtrabackupLogPipeline(stream, tmp_path / 'xtrabackup.log', interactive=True)
+
+    def fail(*_):
+        raise ValueError('broken message')
+
+    pipeline._on_copy_message = fail
+    pipeline._read()
+
+    assert stream.read() == b''
+    queued = []
+    while not pipeline._queue.empty():
+        queued.append(pipeline._queue.get_nowait())
+    # the lines before the failure are printed, the renderer is told the stream has ended
+    assert queued[-1] is XtrabackupLogPipeline._END
+    assert len(queued) == 3
+
+
+def test_reader_ends_when_the_renderer_is_gone(tmp_path, monkeypatch):
+    monkeypatch.setattr(XtrabackupLogPipeline, 'QUEUE_SIZE', 1)
+    monkeypatch.setattr(XtrabackupLogPipeline, 'RENDER_INTERVAL', 0.01)
+    pipeline = XtrabackupLogPipeline(io.BytesIO(COMPRESSED_LOG), tmp_path / 'xtrabackup.log', interactive=True)
+    # the renderer thread is never started: a renderer which died on the first line, the queue stays full
+    reader = threading.Thread(target=pipeline._read, daemon=True)
+    reader.start()
+    reader.join(timeout=5)
+
+    assert not reader.is_alive()
+    assert (tmp_path / 'xtrabackup.log').read_bytes() == COMPRESSED_LOG
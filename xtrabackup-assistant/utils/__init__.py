@@ -1,6 +1,31 @@
 from .time import now
-from .echo import echo, echo_error, echo_warning
-from .sftp import Sftp
-from .slack import Slack
-from .data_dir import clear_dir
-from .logger import logger, rotation_logger
+from .lazy import lazy_getattr
+from .data_dir import clear_dir, reap_trash
+from .cron import CronExpression
+from .lock import ProcessLock
+from .rate_limiter import TokenBucket, RateLimitedReader
+from .thread_budget import ThreadBudget
+from .chunker import Chunker
+from .hashing import HashingWriter, HashingReader, CHECKSUM_ALGORITHMS, CHECKSUM_TOOLS
+
+# heavy third-party clients (paramiko, slack_notifications, rich) and log file handlers are set up on first use only
+_LAZY_ATTRIBUTES = {
+    'console': '.echo',
+    'echo': '.echo',
+    'echo_error': '.echo',
+    'echo_warning': '.echo',
+    'logger': '.logger',
+    'rotation_logger': '.logger',
+    'Sftp': '.sftp',
+    'Storage': '.storage',
+    'storage_session': '.storage',
+    'LocalStorage': '.local_storage',
+    'copy_file': '.local_storage',
+    'Slack': '.slack',
+    'Throttle': '.throttle',
+    'IoPriority': '.io_priority',
+    'print_summary': '.report',
+    'write_report': '.report',
+}
+
+__getattr__ = lazy_getattr(__name__, _LAZY_ATTRIBUTES)
@@ -0,0 +1,72 @@
+import math
+import zlib
+
+
+class Chunker:
+    """
+    Content-defined chunking: boundaries depend on the bytes around them only, so data shifted by an insert still
+    splits into the same chunks. A boundary is a point where a hash of the preceding window matches a mask.
+    The window hash is evaluated at anchor positions (a 2-byte pattern found with bytes.find) instead of rolling
+    over every byte, which keeps the chunking at memory speed in pure Python.
+    """
+
+    ANCHOR = b'\xa7\x3d'
+    # on random data the anchor occurs once per 64 KB
+    ANCHOR_GAP = 256 ** len(ANCHOR)
+    WINDOW_SIZE = 48
+    # low-entropy data (e.g. zero pages) can be full of anchors, a chunk is cut at max size after this many
+    MAX_ANCHOR_CHECKS = 4096
+
+    def __init__(self, average_size: int):
+        self.min_size = average_size // 4
+        self.max_size = average_size * 4
+        # every 2^bits-th anchor is a boundary: min size + 2^bits anchor gaps on average
+        bits = max(0, round(math.log2(max(1.0, (average_size - self.min_size) / self.ANCHOR_GAP))))
+        self._mask = (1 << bits) - 1
+
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes) -> list:
+        """ Add data, return the chunks completed by it """
+
+        self._buffer += data
+
+        chunks = []
+        # a boundary can only be decided when max size bytes are available (or at the end)
+        while len(self._buffer) >= self.max_size:
+            chunks.append(self._cut(self._find_boundary()))
+
+        return chunks
+
+    def finish(self) -> list:
+        """ Return the remaining chunks at the end of the data """
+
+        chunks = []
+        while len(self._buffer) > 0:
+            chunks.append(self._cut(self._find_boundary()))
+
+        return chunks
+
+    def _find_boundary(self) -> int:
+        limit = min(len(self._buffer), self.max_size)
+        if limit <= self.min_size:
+            return limit
+
+        position = self.min_size - len(self.ANCHOR)
+        for _ in range(self.MAX_ANCHOR_CHECKS):
+            position = self._buffer.find(self.ANCHOR, position, limit)
+            if position < 0:
+                return limit
+
+            end = position + len(self.ANCHOR)
+            if zlib.crc32(self._buffer[end - self.WINDOW_SIZE:end]) & self._mask == 0:
+                return end
+            position += 1
+
+        return limit
+
+    def _cut(self, size: int) -> bytes:
+        chunk = bytes(self._buffer[:size])
+        del self._buffer[:size]
+
+        return chunk
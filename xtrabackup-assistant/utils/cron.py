@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta
+
+
+class CronExpression:
+    """ Standard 5-field cron expression: minute hour day-of-month month day-of-week """
+
+    FIELD_RANGES = (
+        ('minute', 0, 59),
+        ('hour', 0, 23),
+        ('day of month', 1, 31),
+        ('month', 1, 12),
+        ('day of week', 0, 6),
+    )
+    ALIASES = {
+        '@hourly': '0 * * * *',
+        '@daily': '0 0 * * *',
+        '@midnight': '0 0 * * *',
+        '@weekly': '0 0 * * 0',
+        '@monthly': '0 0 1 * *',
+        '@yearly': '0 0 1 1 *',
+        '@annually': '0 0 1 1 *',
+    }
+
+    def __init__(self, expression: str):
+        self.expression = expression
+
+        fields = self.ALIASES.get(expression.strip(), expression).split()
+        if len(fields) != 5:
+            raise ValueError(f"Invalid cron expression '{expression}': 5 fields expected")
+
+        self._minutes, self._hours, self._days, self._months, self._weekdays = (
+            self._parse_field(field, *field_range) for field, field_range in zip(fields, self.FIELD_RANGES)
+        )
+        # cron semantics: if both day fields are restricted, a day matches when either of them matches
+        self._any_day = fields[2] == '*'
+        self._any_weekday = fields[4] == '*'
+
+    def next_after(self, moment: datetime) -> datetime:
+        """ Return the first matching minute strictly after the given moment """
+
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # a matching minute always exists within 4 years (Feb 29)
+        deadline = candidate + timedelta(days=366 * 4)
+
+        while candidate < deadline:
+            if candidate.month not in self._months:
+                candidate = (candidate.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+                continue
+            if not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            if candidate.hour not in self._hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+                continue
+            if candidate.minute not in self._minutes:
+                candidate += timedelta(minutes=1)
+                continue
+
+            return candidate
+
+        raise ValueError(f"Cron expression '{self.expression}' never matches")
+
+    def _day_matches(self, moment: datetime) -> bool:
+        # datetime: Monday is 0, cron: Sunday is 0
+        day_matches = moment.day in self._days
+        weekday_matches = (moment.weekday() + 1) % 7 in self._weekdays
+
+        if self._any_day or self._any_weekday:
+            return day_matches and weekday_matches
+
+        return day_matches or weekday_matches
+
+    def _parse_field(self, field: str, name: str, minimum: int, maximum: int) -> set:
+        values = set()
+
+        for part in field.split(','):
+            value_range, _, step = part.partition('/')
+            try:
+                step = int(step) if step else 1
+                if value_range == '*':
+                    start, end = minimum, maximum
+                elif '-' in value_range:
+                    start, end = map(int, value_range.split('-', 1))
+                else:
+                    start = int(value_range)
+                    end = maximum if step > 1 else start
+            except ValueError:
+                raise ValueError(f"Invalid cron expression '{self.expression}': bad {name} '{part}'")
+
+            # 7 is an alternative notation of Sunday
+            if name == 'day of week' and end == 7:
+                values.add(0)
+                if start == 7:
+                    continue
+                end = 6
+            if start < minimum or end > maximum or start > end or step < 1:
+                raise ValueError(f"Invalid cron expression '{self.expression}': {name} out of range '{part}'")
+
+            values.update(range(start, end + 1, step))
+
+        return values
+
+    def __str__(self) -> str:
+        return self.expression
@@ -1,12 +1,66 @@
 import os
-import shutil
+import stat
+import subprocess
+import sys
+import time
 from pathlib import Path
 
+# next to the cleared dirs (data/.trash), on the same filesystem: a dir is moved there with a rename
+TRASH_DIR_NAME = '.trash'
 
-def clear_dir(dir_path: Path) -> None:
+
+def clear_dir(dir_path: Path, keep: tuple = ()) -> None:
+    """
+    Empty the dir (but .gitignore and the names to keep) at once: it's renamed into the trash next to it and recreated,
+    the contents are deleted by a reaper process in the background. A dir the rename doesn't work for (a mount point)
+    is emptied here.
+    """
+
+    kept_names = ('.gitignore', *keep)
     with os.scandir(str(dir_path)) as entries:
-        for entry in entries:
-            if entry.is_dir() and not entry.is_symlink():
-                shutil.rmtree(entry.path)
-            elif entry.name != '.gitignore':
-                os.remove(entry.path)
+        if all(entry.name in kept_names for entry in entries):
+            return
+
+    trash_path = Path(dir_path.parent, TRASH_DIR_NAME)
+    try:
+        trash_path.mkdir(exist_ok=True)
+        dir_stat = dir_path.stat()
+        if dir_stat.st_dev != trash_path.stat().st_dev:
+            raise OSError(f"{dir_path} is on another filesystem")
+
+        trashed_path = Path(trash_path, f"{dir_path.name}-{os.getpid()}-{time.time_ns()}")
+        os.rename(dir_path, trashed_path)
+    except OSError:
+        from .reaper import remove_entries
+
+        remove_entries(dir_path, kept_names)
+        return
+
+    dir_path.mkdir()
+    os.chmod(dir_path, stat.S_IMODE(dir_stat.st_mode))
+    for name in kept_names:
+        if os.path.lexists(Path(trashed_path, name)):
+            os.rename(Path(trashed_path, name), Path(dir_path, name))
+
+    reap_trash(trash_path)
+
+
+def reap_trash(trash_path: Path) -> None:
+    """ Start a reaper process for the dirs in the trash, e.g. the ones left by a reaper killed before it was done """
+
+    from .reaper import trashed_paths
+    if not trash_path.exists() or len(trashed_paths(trash_path)) == 0:
+        return
+
+    # at the configured priority, the reaper competes for the disk as the backup work does
+    from .io_priority import IoPriority
+
+    subprocess.Popen(
+        IoPriority.command([sys.executable, '-m', 'utils.reaper', str(trash_path)]),
+        cwd=Path(__file__).parent.parent,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        # outlives the assistant, the exit isn't held up by the deletion
+        start_new_session=True
+    )
@@ -8,7 +8,8 @@ from rich.text import Text
 
 from utils import now
 
-rprint = Console(highlight=False).print
+console = Console(highlight=False)
+rprint = console.print
 
 
 def echo(
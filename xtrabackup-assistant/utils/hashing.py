@@ -0,0 +1,58 @@
+import hashlib
+
+CHECKSUM_ALGORITHMS = ('sha256', 'blake2b')
+# coreutils tools printing the same digests as hashlib (b2sum is BLAKE2b-512, the hashlib.blake2b default)
+CHECKSUM_TOOLS = {'sha256': 'sha256sum', 'blake2b': 'b2sum'}
+
+
+class HashingWriter:
+    """ File object wrapper hashing everything written through it, so no second read is needed """
+
+    def __init__(self, file, algorithm: str):
+        self._file = file
+        self._hash = hashlib.new(algorithm)
+
+        self.algorithm = algorithm
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self._hash.update(data)
+        self.size += len(data)
+
+        return self._file.write(data)
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+    def __getattr__(self, name: str):
+        return getattr(self._file, name)
+
+
+class HashingReader:
+    """ File object wrapper hashing everything read through it """
+
+    def __init__(self, file, algorithm: str):
+        self._file = file
+        self._hash = hashlib.new(algorithm)
+
+        self.algorithm = algorithm
+        self.size = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._file.read(size)
+        self._hash.update(data)
+        self.size += len(data)
+
+        return data
+
+    def read_to_end(self, chunk_size: int = 1024 * 1024) -> None:
+        """ Hash the rest of the file (e.g. tar padding a consumer never reads) """
+
+        while len(self.read(chunk_size)) > 0:
+            pass
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+    def __getattr__(self, name: str):
+        return getattr(self._file, name)
@@ -0,0 +1,160 @@
+import os
+import shlex
+import shutil
+from pathlib import Path
+from typing import Union
+
+from configs import IoPriorityConfig
+from utils import echo_warning, logger
+
+IONICE_CLASS_NUMBERS = {'best-effort': 2, 'idle': 3}
+
+
+class IoPriority:
+    """
+    Backup work at a low priority on a production host: the xtrabackup/xbstream processes run niced/ioniced (and in
+    a cgroup with io.max limits), the files the assistant streams through are dropped from the page cache as it goes.
+    Set up once per process from the 'io_priority' config, the defaults change nothing.
+    """
+
+    _config: Union[IoPriorityConfig, None] = None
+    # the command prefix of the subprocesses, built once
+    _prefix: list = []
+
+    @classmethod
+    def apply(cls, config: IoPriorityConfig) -> None:
+        if config == cls._config:
+            return
+
+        cls._config = config
+        cls._prefix = [*cls._cgroup_prefix(config), *cls._priority_prefix(config)]
+        if len(cls._prefix) > 0:
+            logger.info(f"Subprocesses run with: {' '.join(cls._prefix)}")
+
+    @classmethod
+    def command(cls, command: list) -> list:
+        """ A subprocess command (xtrabackup, xbstream) started at the configured priority """
+
+        return [*cls._prefix, *command]
+
+    @classmethod
+    def uncached(cls, file):
+        """ The file object dropping the data passed through it from the page cache, if it's enabled """
+
+        if cls._config is None or not cls._config.drop_cache or not hasattr(os, 'posix_fadvise'):
+            return file
+
+        return UncachedFile(file)
+
+    @classmethod
+    def drop_cache(cls, path: Path) -> None:
+        """ Drop a whole file from the page cache, e.g. once a subprocess or a zero-copy copy is done with it """
+
+        if cls._config is None or not cls._config.drop_cache or not hasattr(os, 'posix_fadvise'):
+            return
+
+        try:
+            with open(path, 'rb') as file:
+                os.fdatasync(file.fileno())
+                os.posix_fadvise(file.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+        except OSError:
+            pass
+
+    @staticmethod
+    def _priority_prefix(config: IoPriorityConfig) -> list:
+        prefix = []
+        if config.nice is not None:
+            if shutil.which('nice') is not None:
+                prefix += ['nice', '-n', str(config.nice)]
+            else:
+                echo_warning("'nice' is not found, 'io_priority.nice' is ignored", author='IoPriority')
+        if config.ionice_class is not None:
+            if shutil.which('ionice') is not None:
+                prefix += ['ionice', '-c', str(IONICE_CLASS_NUMBERS[config.ionice_class])]
+                if config.ionice_level is not None:
+                    prefix += ['-n', str(config.ionice_level)]
+            else:
+                echo_warning("'ionice' is not found, 'io_priority.ionice_class' is ignored", author='IoPriority')
+
+        return prefix
+
+    @staticmethod
+    def _cgroup_prefix(config: IoPriorityConfig) -> list:
+        """ A shell moving itself into the cgroup before it runs the command (no window outside of it) """
+
+        if config.cgroup is None:
+            return []
+
+        cgroup_path = Path(config.cgroup)
+        try:
+            cgroup_path.mkdir(exist_ok=True)
+            if config.io_max is not None:
+                # the io controller of the cgroup is enabled by its parent
+                with open(Path(cgroup_path.parent, 'cgroup.subtree_control'), 'w') as subtree_control:
+                    subtree_control.write('+io')
+                for line in config.io_max:
+                    with open(Path(cgroup_path, 'io.max'), 'w') as io_max:
+                        io_max.write(line)
+        except OSError as e:
+            echo_warning(f"Failed to set up cgroup {cgroup_path}, it's not used: {e}", author='IoPriority')
+            logger.warning(f"Failed to set up cgroup {cgroup_path}: {e}")
+            return []
+
+        procs_path = shlex.quote(str(Path(cgroup_path, 'cgroup.procs')))
+        return ['sh', '-c', f'echo $$ > {procs_path} && exec "$@"', 'sh']
+
+
+class UncachedFile:
+    """
+    File object wrapper dropping the pages of the data read or written from the page cache every DROP_SIZE bytes.
+    Written data is flushed to the disk first: dirty pages can't be dropped.
+    """
+
+    DROP_SIZE = 64 * 1024 * 1024
+
+    def __init__(self, file):
+        self._file = file
+        self._fd = file.fileno()
+        self._writable = file.writable()
+        self._position = 0
+        self._dropped = 0
+
+        os.posix_fadvise(self._fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._file.read(size)
+        self._advance(len(data))
+
+        return data
+
+    def write(self, data: bytes) -> int:
+        size = self._file.write(data)
+        self._advance(len(data))
+
+        return size
+
+    def _advance(self, size: int) -> None:
+        self._position += size
+        if self._position - self._dropped >= self.DROP_SIZE:
+            self._drop()
+
+    def _drop(self) -> None:
+        if self._writable:
+            self._file.flush()
+            os.fdatasync(self._fd)
+        os.posix_fadvise(self._fd, self._dropped, self._position - self._dropped, os.POSIX_FADV_DONTNEED)
+        self._dropped = self._position
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self._drop()
+        self._file.close()
+
+    def __getattr__(self, name: str):
+        return getattr(self._file, name)
+
+    def __enter__(self) -> "UncachedFile":
+        return self
+
+    def __exit__(self, e_type, value, traceback):
+        self.close()
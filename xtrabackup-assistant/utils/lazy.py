@@ -0,0 +1,22 @@
+import importlib
+import sys
+from typing import Callable
+
+
+def lazy_getattr(package_name: str, attributes: dict) -> Callable:
+    """ Module `__getattr__` importing the package submodule of an attribute ({name: '.module'}) on first access """
+
+    def __getattr__(name: str):
+        if name not in attributes:
+            raise AttributeError(f"module {package_name!r} has no attribute {name!r}")
+
+        package = sys.modules[package_name]
+        module = importlib.import_module(attributes[name], package_name)
+        # importing a submodule binds its name in the package, so rebind every attribute it provides
+        for attribute, module_name in attributes.items():
+            if module_name == attributes[name]:
+                setattr(package, attribute, getattr(module, attribute))
+
+        return getattr(package, name)
+
+    return __getattr__
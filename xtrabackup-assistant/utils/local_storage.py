@@ -0,0 +1,236 @@
+import errno
+import fcntl
+import os
+import stat
+from pathlib import Path, PurePath
+from re import Pattern
+from typing import Union, Callable
+
+from rich.progress import Progress, TextColumn, SpinnerColumn, BarColumn, DownloadColumn, TransferSpeedColumn
+
+from common import Manifest
+from configs import LocalStorageConfig
+from exceptions import StorageError
+from utils import echo, IoPriority, TokenBucket
+from .storage import Storage
+
+# ioctl cloning a whole file (copy-on-write filesystems: btrfs, XFS with reflink=1, ...)
+FICLONE = 0x40049409
+# a copy is done in slices, so it can be throttled and its progress displayed
+COPY_SLICE_SIZE = 64 * 1024 * 1024
+# the kernel can't copy between these files, the next method is tried
+UNSUPPORTED_ERRORS = (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EBADF)
+
+
+def copy_file(
+    source_path: Path,
+    destination_path: Path,
+    rate_limiter: Union[TokenBucket, None] = None,
+    on_copied: Union[Callable[[int], None], None] = None
+) -> str:
+    """
+    Copy a file without passing the data through Python: a reflink if the filesystem can share the blocks,
+    otherwise copy_file_range (server-side copy on NFS 4.2) or sendfile, a read/write loop as the last resort.
+    Returns the method used.
+    """
+
+    with open(source_path, 'rb') as source, open(destination_path, 'wb') as destination:
+        size = os.fstat(source.fileno()).st_size
+
+        try:
+            fcntl.ioctl(destination.fileno(), FICLONE, source.fileno())
+            if on_copied is not None:
+                on_copied(size)
+            return 'reflink'
+        except OSError as e:
+            if e.errno not in (*UNSUPPORTED_ERRORS, errno.ENOTTY):
+                raise
+
+        for method in ('copy_file_range', 'sendfile'):
+            if not hasattr(os, method):
+                continue
+            try:
+                _copy_slices(method, source.fileno(), destination.fileno(), size, rate_limiter, on_copied)
+                return method
+            except _UnsupportedCopy:
+                continue
+
+        for data in iter(lambda: source.read(COPY_SLICE_SIZE), b''):
+            if rate_limiter is not None:
+                rate_limiter.consume(len(data))
+            destination.write(data)
+            if on_copied is not None:
+                on_copied(len(data))
+
+        return 'read/write'
+
+
+class _UnsupportedCopy(Exception):
+    pass
+
+
+def _copy_slices(
+    method: str,
+    source_fd: int,
+    destination_fd: int,
+    size: int,
+    rate_limiter: Union[TokenBucket, None],
+    on_copied: Union[Callable[[int], None], None]
+) -> None:
+    offset = 0
+    while offset < size:
+        count = min(COPY_SLICE_SIZE, size - offset)
+        if rate_limiter is not None:
+            rate_limiter.consume(count)
+        try:
+            if method == 'copy_file_range':
+                copied = os.copy_file_range(source_fd, destination_fd, count, offset, offset)
+            else:
+                # sendfile writes at the destination file position, which follows the offset
+                copied = os.sendfile(destination_fd, source_fd, offset, count)
+        except OSError as e:
+            # nothing is written yet, so another method can start over
+            if offset == 0 and e.errno in UNSUPPORTED_ERRORS:
+                raise _UnsupportedCopy()
+            raise
+        if copied == 0:
+            raise OSError(errno.EIO, f"The source file is shorter than {size} bytes")
+
+        offset += copied
+        if on_copied is not None:
+            on_copied(copied)
+
+
+class LocalStorage(Storage):
+    """ Backups storage on a mounted filesystem (NFS, a secondary disk), the same layout as on SFTP """
+
+    KIND = 'Mounted storage'
+
+    def __init__(self, config: LocalStorageConfig):
+        if not config.path.is_dir():
+            raise StorageError(f"Local storage is not available: {config.path}")
+        self._config = config
+
+    def download(
+        self,
+        remote_path: PurePath,
+        local_path: Path,
+        display_progress=True,
+        rate_limiter: Union[TokenBucket, None] = None,
+        manifest: Union[Manifest, None] = None
+    ):
+        """ Copy a file from the storage, only the size is checked against the manifest (the data isn't read) """
+
+        if not local_path.parent.exists():
+            local_path.parent.mkdir(parents=True)
+
+        try:
+            self._copy(Path(remote_path), local_path, display_progress, rate_limiter, '[blue]Copying from storage...')
+            if manifest is not None and local_path.stat().st_size != manifest.size:
+                raise RuntimeError(f"size {local_path.stat().st_size} bytes, expected {manifest.size} bytes")
+        except (OSError, RuntimeError, KeyboardInterrupt) as e:
+            local_path.unlink(missing_ok=True)
+            if not any(local_path.parent.iterdir()):
+                local_path.parent.rmdir()
+
+            if isinstance(e, KeyboardInterrupt):
+                raise
+            raise RuntimeError(f"Local storage copy failed: {e}")
+
+    def upload(
+        self,
+        local_path: Path,
+        remote_path: PurePath,
+        display_progress=True,
+        rate_limiter: Union[TokenBucket, None] = None
+    ):
+        remote_path = Path(remote_path)
+        self.mkdir_p(remote_path.parent)
+
+        # copied aside and renamed, so a file under its name is always complete
+        partial_path = remote_path.with_name(f"{remote_path.name}.partial")
+        try:
+            self._copy(local_path, partial_path, display_progress, rate_limiter, '[blue]Copying to storage...')
+            os.replace(partial_path, remote_path)
+        except (OSError, KeyboardInterrupt) as e:
+            partial_path.unlink(missing_ok=True)
+
+            if isinstance(e, KeyboardInterrupt):
+                raise
+            raise RuntimeError(f"Local storage copy failed: {e}")
+
+    @staticmethod
+    def _copy(
+        source_path: Path,
+        destination_path: Path,
+        display_progress: bool,
+        rate_limiter: Union[TokenBucket, None],
+        description: str
+    ) -> None:
+        with Progress(
+            TextColumn('[blue]\\[Storage][/blue]'),
+            SpinnerColumn(),
+            TextColumn('[progress.description]{task.description}'),
+            BarColumn(),
+            DownloadColumn(),
+            TransferSpeedColumn(),
+            transient=True,
+            disable=not display_progress
+        ) as progress:
+            copying = progress.add_task(description, total=source_path.stat().st_size)
+            method = copy_file(
+                source_path,
+                destination_path,
+                rate_limiter=rate_limiter,
+                on_copied=lambda size: progress.advance(copying, size)
+            )
+        # the data doesn't pass through the process, the pages the kernel cached on the way are dropped afterwards
+        IoPriority.drop_cache(source_path)
+        IoPriority.drop_cache(destination_path)
+
+        if display_progress:
+            echo(f"{source_path.name} copied ({method})", author='Storage')
+
+    def read_text(self, remote_path: PurePath) -> str:
+        return Path(remote_path).read_text('utf-8')
+
+    def read_head(self, remote_path: PurePath, size: int) -> bytes:
+        with open(remote_path, 'rb') as remote_file:
+            return remote_file.read(size)
+
+    def exists(self, remote_path: PurePath) -> bool:
+        return Path(remote_path).exists()
+
+    def delete(self, remote_path: PurePath, ignore_errors=False):
+        try:
+            path = Path(remote_path)
+            path.rmdir() if path.is_dir() else path.unlink()
+        except OSError:
+            if ignore_errors is False:
+                raise
+
+    def listdir(self, remote_path: PurePath) -> list:
+        return os.listdir(remote_path)
+
+    def mkdir_p(self, remote_path: PurePath):
+        Path(remote_path).mkdir(parents=True, exist_ok=True)
+
+    def r_find_files(self, remote_path: PurePath, pattern: Pattern = None, skip_dirs: tuple = ()) -> list:
+        file_paths = []
+
+        try:
+            with os.scandir(remote_path) as entries:
+                for entry in entries:
+                    entry_attr = entry.stat()
+                    is_dir = stat.S_ISDIR(entry_attr.st_mode)
+                    if is_dir and entry.name in skip_dirs:
+                        continue
+                    if is_dir:
+                        file_paths += self.r_find_files(Path(remote_path, entry.name), pattern, skip_dirs)
+                    elif pattern is None or pattern.search(entry.name):
+                        file_paths.append({'path': Path(remote_path, entry.name), 'attr': entry_attr})
+        except FileNotFoundError:
+            # in case of a wrong path just return an empty list
+            pass
+
+        return file_paths
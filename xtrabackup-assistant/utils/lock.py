@@ -0,0 +1,38 @@
+import fcntl
+import os
+from pathlib import Path
+
+
+class ProcessLock:
+    """ Exclusive advisory lock (flock) held for the lifetime of the context, released by the kernel on exit """
+
+    def __init__(self, path: Path, name: str):
+        self._path = path
+        self._name = name
+        self._file = None
+
+    def __enter__(self) -> "ProcessLock":
+        self._file = open(self._path, 'a+')
+        try:
+            fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._file.seek(0)
+            holder_pid = self._file.read().strip() or 'unknown'
+            self._file.close()
+            self._file = None
+
+            raise RuntimeError(f"Another {self._name} is already running (pid {holder_pid})")
+
+        self._file.seek(0)
+        self._file.truncate()
+        self._file.write(str(os.getpid()))
+        self._file.flush()
+
+        return self
+
+    def __exit__(self, e_type, value, traceback):
+        if self._file is not None:
+            self._file.truncate(0)
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
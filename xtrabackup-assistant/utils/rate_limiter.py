@@ -0,0 +1,72 @@
+import threading
+from time import monotonic, sleep
+from typing import Union
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket limiting a byte rate, shareable between several transfers.
+    A rate of None (or 0) means unlimited. Consuming from a bucket with a parent consumes from the parent as well.
+    """
+
+    def __init__(self, rate: Union[float, None], burst_seconds: float = 1.0, parent: "TokenBucket" = None):
+        self._parent = parent
+        self._lock = threading.Lock()
+        self._burst_seconds = burst_seconds
+        self._rate = None
+        self._tokens = 0.0
+        self._updated_at = monotonic()
+
+        self.set_rate(rate)
+
+    @property
+    def rate(self) -> Union[float, None]:
+        return self._rate
+
+    def set_rate(self, rate: Union[float, None]) -> None:
+        with self._lock:
+            self._rate = rate if rate else None
+            self._tokens = min(self._tokens, self._capacity)
+            self._updated_at = monotonic()
+
+    def consume(self, amount: int) -> None:
+        """ Take the amount of tokens (bytes), sleeping as long as the rate requires """
+
+        if self._parent is not None:
+            self._parent.consume(amount)
+
+        with self._lock:
+            if self._rate is None:
+                return
+
+            current_time = monotonic()
+            self._tokens = min(self._capacity, self._tokens + (current_time - self._updated_at) * self._rate)
+            self._updated_at = current_time
+
+            # go into debt instead of waiting for tokens: concurrent consumers queue up behind each other
+            self._tokens -= amount
+            wait_time = -self._tokens / self._rate if self._tokens < 0 else 0
+
+        if wait_time > 0:
+            sleep(wait_time)
+
+    @property
+    def _capacity(self) -> float:
+        return self._rate * self._burst_seconds if self._rate else 0.0
+
+
+class RateLimitedReader:
+    """ File object wrapper throttling reads, e.g. for tarfile or shutil.copyfileobj """
+
+    def __init__(self, file, rate_limiter: TokenBucket):
+        self._file = file
+        self._rate_limiter = rate_limiter
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._file.read(size)
+        self._rate_limiter.consume(len(data))
+
+        return data
+
+    def __getattr__(self, name: str):
+        return getattr(self._file, name)
@@ -0,0 +1,79 @@
+import fcntl
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# the reaper deletes the dirs clear_dir moved into the trash, in a process of its own (python -m utils.reaper <trash>)
+REAPER_LOCK_NAME = '.reaper.lock'
+# files are unlinked in parallel, a filesystem (NFS, a large dir) is rarely busy with a single unlink at a time
+REAPER_WORKERS = 8
+
+
+def trashed_paths(trash_path: Path) -> list:
+    with os.scandir(str(trash_path)) as entries:
+        return [Path(entry.path) for entry in entries if entry.name not in ('.gitignore', REAPER_LOCK_NAME)]
+
+
+def reap(trash_path: Path) -> None:
+    """ Delete the dirs in the trash until it's empty, a single reaper at a time """
+
+    while True:
+        with open(Path(trash_path, REAPER_LOCK_NAME), 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # the running reaper deletes whatever is in the trash
+                return
+
+            with ThreadPoolExecutor(max_workers=REAPER_WORKERS) as executor:
+                paths = trashed_paths(trash_path)
+                while len(paths) > 0:
+                    for path in paths:
+                        _remove_tree(path, executor)
+                    remaining_paths = trashed_paths(trash_path)
+                    if any(path in remaining_paths for path in paths):
+                        # files which can't be deleted (permissions), retried by the reaper of the next start
+                        return
+                    paths = remaining_paths
+
+        # a dir trashed while the lock was released is deleted by this reaper or the one which took the lock
+        if len(trashed_paths(trash_path)) == 0:
+            return
+
+
+def remove_entries(dir_path: Path, kept_names: tuple = ('.gitignore',)) -> None:
+    with ThreadPoolExecutor(max_workers=REAPER_WORKERS) as executor, os.scandir(str(dir_path)) as entries:
+        for entry in entries:
+            if entry.name not in kept_names:
+                _remove_tree(Path(entry.path), executor)
+
+
+def _remove_tree(path: Path, executor: ThreadPoolExecutor) -> None:
+    """ The files of every dir are unlinked in parallel, the dirs are removed bottom-up once they're empty """
+
+    if path.is_symlink() or not path.is_dir():
+        _unlink(path)
+        return
+
+    for dir_path, dirnames, filenames in os.walk(path, topdown=False):
+        # symlinks to dirs are listed as dirs (not followed), they're unlinked as files
+        names = [*filenames, *(dirname for dirname in dirnames if os.path.islink(os.path.join(dir_path, dirname)))]
+        list(executor.map(_unlink, [os.path.join(dir_path, name) for name in names]))
+        try:
+            os.rmdir(dir_path)
+        except OSError:
+            # a file failed to be deleted, it's retried by the next reaper
+            pass
+
+
+def _unlink(path) -> None:
+    try:
+        os.unlink(path)
+    except OSError:
+        # gone already, or left to the next reaper
+        pass
+
+
+if __name__ == '__main__':
+    reap(Path(sys.argv[1]))
@@ -0,0 +1,34 @@
+import json
+from dataclasses import asdict
+from pathlib import Path
+from typing import Iterable
+
+from rich.table import Table, Column
+
+from constants import REPORTS_DIR_PATH
+from .echo import echo
+from .time import now
+
+
+def print_summary(title: str, columns: Iterable[Column], rows: Iterable[tuple]) -> None:
+    table = Table(*columns, title=title)
+    for row in rows:
+        table.add_row(*row)
+
+    echo(table)
+
+
+def write_report(name: str, results: list) -> Path:
+    """ The results (dataclasses) of a run written to data/reports/<name>-<time>.json """
+
+    REPORTS_DIR_PATH.mkdir(parents=True, exist_ok=True)
+
+    report_path = Path(REPORTS_DIR_PATH, f"{name}-{now('%Y-%m-%d-%H-%M')}.json")
+    with open(report_path, 'w') as report_file:
+        json.dump(
+            {'created_at': now('%Y-%m-%d %H:%M:%S'), 'results': [asdict(result) for result in results]},
+            report_file,
+            indent=2
+        )
+
+    return report_path
@@ -1,20 +1,43 @@
+import hashlib
+import shlex
 import socket
 import stat
+from contextlib import contextmanager
 from pathlib import Path, PurePath
 from re import Pattern
+from time import monotonic
+from typing import Iterator, Union, Callable, IO
 
 import paramiko
 from paramiko.sftp import SFTPError
 from paramiko.ssh_exception import SSHException
-from rich.progress import Progress, TextColumn, BarColumn, SpinnerColumn, DownloadColumn, TransferSpeedColumn
+from rich.progress import Progress, TextColumn, BarColumn, SpinnerColumn, DownloadColumn, TransferSpeedColumn, TaskID
 
+from common import Manifest
 from configs import SftpConfig
 from exceptions import SftpError
-from utils import echo
+from utils import echo, logger, IoPriority, TokenBucket, HashingWriter, CHECKSUM_TOOLS
+from .ssh_stream import SshStream
+from .storage import Storage
 
 
-class Sftp:
+class Sftp(Storage):
+    KIND = 'SFTP'
+    VERIFIES_DOWNLOADS = True
+
     CONNECTION_TIMEOUT = 7
+    KEEPALIVE_INTERVAL = 30
+    READ_CHUNK_SIZE = 1024 * 1024
+    # transfers go in SFTP requests of this size: larger reads/writes are split and buffered by paramiko (copied again)
+    TRANSFER_BLOCK_SIZE = paramiko.SFTPFile.MAX_REQUEST_SIZE
+    # seconds between progress bar updates: an update per transferred block costs more than the block at 10G speeds
+    PROGRESS_INTERVAL = 0.1
+
+    # connections reused between jobs of a long-lived process (daemon), see Sftp.session()
+    _keep_sessions_warm: bool = False
+    _warm_sessions: dict = {}
+    # destinations ssh_streams are enabled for, but their host can't run the commands (warned once)
+    _streamless: set = set()
 
     def __init__(self, config: SftpConfig):
         try:
@@ -25,40 +48,105 @@ class Sftp:
 
             self.ssh_client.connect(
                 hostname=config.host,
+                port=config.port,
                 username=config.user,
                 password=config.password,
-                timeout=self.CONNECTION_TIMEOUT
+                timeout=self.CONNECTION_TIMEOUT,
+                compress=config.compress,
+                transport_factory=self._transport
+            )
+            self.sftp_client = paramiko.SFTPClient.from_transport(
+                self.ssh_client.get_transport(),
+                window_size=self._window_size,
+                max_packet_size=self._max_packet_size
             )
-            self.sftp_client = self.ssh_client.open_sftp()
+            self.stream = self._open_stream()
         except (SSHException, socket.error) as e:
             raise SftpError(f"Failed to init the SFTP connection: {e}")
 
-    def download(self, remote_path: PurePath, local_path: Path, display_progress=True):
+    def _open_stream(self) -> Union[SshStream, None]:
+        """ The raw SSH transport if it's enabled and the storage host supports it, SFTP is used otherwise """
+
+        if not self._config.ssh_streams or self._config in self._streamless:
+            return None
+
+        stream = SshStream(self.ssh_client, window_size=self._window_size, max_packet_size=self._max_packet_size)
+        if not stream.is_available():
+            self._streamless.add(self._config)
+            logger.warning(f"[SFTP {self._config.label}] The storage host doesn't run the commands of SSH streams "
+                           f"(cat, mv, rm, wc, sha256sum), transferring over SFTP")
+            return None
+
+        return stream
+
+    @property
+    def _window_size(self) -> Union[int, None]:
+        return self._config.window_size * 1024 * 1024 if self._config.window_size is not None else None
+
+    @property
+    def _max_packet_size(self) -> Union[int, None]:
+        return self._config.max_packet_size * 1024 if self._config.max_packet_size is not None else None
+
+    def _transport(self, sock: socket.socket, **kwargs) -> paramiko.Transport:
+        """ SSH transport with the configured window/packet sizes and the preferred ciphers offered first """
+
+        transport_options = {}
+        if self._window_size is not None:
+            transport_options['default_window_size'] = self._window_size
+        if self._max_packet_size is not None:
+            transport_options['default_max_packet_size'] = self._max_packet_size
+        transport = paramiko.Transport(sock, **transport_options, **kwargs)
+
+        if self._config.ciphers is not None:
+            security_options = transport.get_security_options()
+            supported = security_options.ciphers
+            preferred = [cipher for cipher in self._config.ciphers if cipher in supported]
+            security_options.ciphers = (*preferred, *(cipher for cipher in supported if cipher not in preferred))
+
+        return transport
+
+    def download(
+        self,
+        remote_path: PurePath,
+        local_path: Path,
+        display_progress=True,
+        rate_limiter: Union[TokenBucket, None] = None,
+        manifest: Union[Manifest, None] = None
+    ):
+        """ Download a file, verifying it against the manifest (if given) while it's being written """
+
         if not local_path.parent.exists():
             local_path.parent.mkdir(parents=True)
 
         try:
-            if display_progress:
-                with Progress(
-                    TextColumn('[blue][SFTP][/blue]'),
-                    SpinnerColumn(),
-                    TextColumn('[progress.description]{task.description}'),
-                    BarColumn(),
-                    DownloadColumn(),
-                    TransferSpeedColumn(),
-                    transient=True
-                ) as progress:
-                    file_size = self.sftp_client.stat(str(remote_path)).st_size
-                    downloading = progress.add_task('[blue]Downloading...', total=file_size)
+            with IoPriority.uncached(open(local_path, 'wb')) as local_file:
+                writer = local_file if manifest is None else HashingWriter(local_file, manifest.algorithm)
 
-                    self.sftp_client.get(
-                        str(remote_path),
-                        str(local_path),
-                        lambda transferred, total: progress.update(downloading, completed=transferred)
-                    )
-            else:
-                self.sftp_client.get(str(remote_path), str(local_path))
-        except (EOFError, SSHException, SFTPError, KeyboardInterrupt) as e:
+                if display_progress:
+                    with Progress(
+                        TextColumn('[blue][SFTP][/blue]'),
+                        SpinnerColumn(),
+                        TextColumn('[progress.description]{task.description}'),
+                        BarColumn(),
+                        DownloadColumn(),
+                        TransferSpeedColumn(),
+                        transient=True
+                    ) as progress:
+                        file_size = self.sftp_client.stat(str(remote_path)).st_size
+                        downloading = progress.add_task('[blue]Downloading...', total=file_size)
+
+                        self._get(
+                            remote_path,
+                            writer,
+                            self._limited_callback(rate_limiter, self._progress_callback(progress, downloading)),
+                            verified=manifest is not None
+                        )
+                else:
+                    self._get(remote_path, writer, self._limited_callback(rate_limiter), verified=manifest is not None)
+
+            if manifest is not None:
+                manifest.verify(writer.hexdigest(), writer.size)
+        except (IOError, EOFError, SSHException, SFTPError, KeyboardInterrupt, RuntimeError) as e:
             echo('Error or terminate signal received. Cleaning up....', style='italic', author='SFTP')
 
             self.close()
@@ -72,7 +160,13 @@ class Sftp:
             else:
                 raise RuntimeError(f'SFTP download failed: {e}')
 
-    def upload(self, local_path: Path, remote_path: PurePath, display_progress=True):
+    def upload(
+        self,
+        local_path: Path,
+        remote_path: PurePath,
+        display_progress=True,
+        rate_limiter: Union[TokenBucket, None] = None
+    ):
         remote_dir_path = PurePath(str(remote_path.parent).lstrip('/'))
         self._mkdir_p(remote_dir_path)
 
@@ -90,14 +184,14 @@ class Sftp:
                     file_size = local_path.stat().st_size
                     uploading = progress.add_task('[blue]Uploading...', total=file_size)
 
-                    self.sftp_client.put(
-                        str(local_path),
-                        str(remote_path),
-                        lambda transferred, total: progress.update(uploading, completed=transferred)
+                    self._put(
+                        local_path,
+                        remote_path,
+                        self._limited_callback(rate_limiter, self._progress_callback(progress, uploading))
                     )
             else:
-                self.sftp_client.put(str(local_path), str(remote_path))
-        except (EOFError, SSHException, KeyboardInterrupt) as e:
+                self._put(local_path, remote_path, self._limited_callback(rate_limiter))
+        except (IOError, EOFError, SSHException, KeyboardInterrupt) as e:
             echo('Error or terminate signal received. Cleaning up....', style='italic', author='SFTP')
 
             self.close()
@@ -113,6 +207,152 @@ class Sftp:
             else:
                 raise RuntimeError(f'SFTP upload failed: {e}')
 
+    def _get(self, remote_path: PurePath, writer: IO[bytes], callback: Union[Callable, None], verified=False) -> None:
+        """ Like SFTPClient.getfo(), with the configured number of prefetch requests; over an SSH stream if enabled """
+
+        file_size = self.sftp_client.stat(str(remote_path)).st_size
+        if self.stream is not None:
+            # the data is hashed on the storage host as well, unless the caller verifies it against a manifest
+            self.stream.read(remote_path, writer, file_size, callback, verified=verified)
+            return
+
+        with self.sftp_client.open(str(remote_path), 'rb') as remote_file:
+            remote_file.prefetch(file_size, max_concurrent_requests=self._config.prefetch_requests)
+
+            transferred = 0
+            for block in iter(lambda: remote_file.read(self.TRANSFER_BLOCK_SIZE), b''):
+                writer.write(block)
+                transferred += len(block)
+                if callback is not None:
+                    callback(transferred, file_size)
+
+    def _put(self, local_path: Path, remote_path: PurePath, callback: Union[Callable, None]) -> None:
+        """ Like SFTPClient.put(): pipelined writes, the write statuses are checked when the file is closed """
+
+        file_size = local_path.stat().st_size
+        if self.stream is not None:
+            self.stream.write(remote_path, self._file_blocks(local_path, SshStream.BLOCK_SIZE, callback))
+            return
+
+        with self.sftp_client.open(str(remote_path), 'wb') as remote_file:
+            remote_file.set_pipelined(True)
+            for block in self._file_blocks(local_path, self.TRANSFER_BLOCK_SIZE, callback):
+                remote_file.write(block)
+
+        remote_size = self.sftp_client.stat(str(remote_path)).st_size
+        if remote_size != file_size:
+            raise IOError(f"size mismatch in put: {remote_size} != {file_size}")
+
+    @staticmethod
+    def _file_blocks(local_path: Path, block_size: int, callback: Union[Callable, None]) -> Iterator[bytes]:
+        file_size = local_path.stat().st_size
+        transferred = 0
+        with IoPriority.uncached(open(local_path, 'rb')) as local_file:
+            for block in iter(lambda: local_file.read(block_size), b''):
+                yield block
+                transferred += len(block)
+                if callback is not None:
+                    callback(transferred, file_size)
+
+    def open_stream(self, remote_path: PurePath) -> IO[bytes]:
+        """ Read-only file object streaming a file from the storage host (SSH stream if enabled, SFTP otherwise) """
+
+        if self.stream is not None:
+            return self.stream.open(remote_path)
+
+        remote_file = self.sftp_client.open(str(remote_path), 'rb')
+        remote_file.prefetch(max_concurrent_requests=self._config.prefetch_requests)
+
+        return remote_file
+
+    @classmethod
+    def _progress_callback(cls, progress: Progress, task: TaskID) -> Callable:
+        """ Transfer callback updating a progress bar every PROGRESS_INTERVAL at most (and at the end) """
+
+        updated_at = 0.0
+
+        def progress_callback(transferred: int, total: int) -> None:
+            nonlocal updated_at
+            if transferred == total or monotonic() - updated_at >= cls.PROGRESS_INTERVAL:
+                progress.update(task, completed=transferred)
+                updated_at = monotonic()
+
+        return progress_callback
+
+    @staticmethod
+    def _limited_callback(rate_limiter: Union[TokenBucket, None], callback: Callable = None) -> Union[Callable, None]:
+        """ Wrap a paramiko transfer callback: it's called after every chunk, so sleeping there throttles """
+
+        if rate_limiter is None:
+            return callback
+
+        last_transferred = 0
+
+        def limited_callback(transferred: int, total: int) -> None:
+            nonlocal last_transferred
+            rate_limiter.consume(transferred - last_transferred)
+            last_transferred = transferred
+
+            if callback is not None:
+                callback(transferred, total)
+
+        return limited_callback
+
+    def remote_checksum(self, remote_path: PurePath, algorithm: str) -> Union[str, None]:
+        """ Hash a file on the storage host itself over SSH, None if the host can't run the tool (e.g. SFTP only) """
+
+        command = f"{CHECKSUM_TOOLS[algorithm]} -- {shlex.quote(str(remote_path))}"
+        try:
+            _, stdout, _ = self.ssh_client.exec_command(command)
+            output = stdout.read().decode('utf-8', errors='replace')
+            exit_status = stdout.channel.recv_exit_status()
+        except SSHException:
+            return None
+
+        digest = output.split(' ', 1)[0]
+        if exit_status != 0 or len(digest) != hashlib.new(algorithm).digest_size * 2:
+            return None
+
+        return digest
+
+    def read_checksum(
+        self,
+        remote_path: PurePath,
+        algorithm: str,
+        rate_limiter: Union[TokenBucket, None] = None
+    ) -> str:
+        """ Hash a file read over SFTP: the chunks are requested concurrently (prefetch) and hashed in order """
+
+        file_hash = hashlib.new(algorithm)
+        with self.sftp_client.open(str(remote_path), 'rb') as remote_file:
+            remote_file.prefetch(max_concurrent_requests=self._config.prefetch_requests)
+            while True:
+                chunk = remote_file.read(self.READ_CHUNK_SIZE)
+                if len(chunk) == 0:
+                    break
+                if rate_limiter is not None:
+                    rate_limiter.consume(len(chunk))
+                file_hash.update(chunk)
+
+        return file_hash.hexdigest()
+
+    def read_text(self, remote_path: PurePath) -> str:
+        with self.sftp_client.open(str(remote_path), 'r') as remote_file:
+            return remote_file.read().decode('utf-8')
+
+    def read_head(self, remote_path: PurePath, size: int) -> bytes:
+        with self.sftp_client.open(str(remote_path), 'rb') as remote_file:
+            size = min(size, remote_file.stat().st_size)
+            remote_file.prefetch(size)
+            return remote_file.read(size)
+
+    def exists(self, remote_path: PurePath) -> bool:
+        try:
+            self.sftp_client.stat(str(remote_path))
+            return True
+        except IOError:
+            return False
+
     def delete(self, remote_path: PurePath, ignore_errors=False):
         try:
             path = str(remote_path)
@@ -122,6 +362,12 @@ class Sftp:
             if ignore_errors is False:
                 raise
 
+    def listdir(self, remote_path: PurePath) -> list:
+        return self.sftp_client.listdir(str(remote_path))
+
+    def mkdir_p(self, remote_path: PurePath):
+        self._mkdir_p(PurePath(str(remote_path).lstrip('/')))
+
     def _mkdir_p(self, remote_path: PurePath):
         """Make parent directories as needed"""
         dir_path = ''
@@ -132,14 +378,16 @@ class Sftp:
             except IOError:
                 self.sftp_client.mkdir(dir_path, 0o755)
 
-    def r_find_files(self, remote_path: PurePath, pattern: Pattern = None) -> list:
+    def r_find_files(self, remote_path: PurePath, pattern: Pattern = None, skip_dirs: tuple = ()) -> list:
         file_paths = []
 
         try:
             for entry_attr in self.sftp_client.listdir_attr(str(remote_path)):
                 is_dir = stat.S_ISDIR(entry_attr.st_mode)
+                if is_dir and entry_attr.filename in skip_dirs:
+                    continue
                 if is_dir:
-                    file_paths += self.r_find_files(PurePath(remote_path, entry_attr.filename), pattern)
+                    file_paths += self.r_find_files(PurePath(remote_path, entry_attr.filename), pattern, skip_dirs)
                 elif pattern is None or pattern.search(entry_attr.filename):
                     file_paths.append({
                         'path': PurePath(remote_path, entry_attr.filename),
@@ -151,6 +399,41 @@ class Sftp:
 
         return file_paths
 
+    @property
+    def is_active(self) -> bool:
+        transport = self.ssh_client.get_transport()
+        return transport is not None and transport.is_active()
+
+    @classmethod
+    def keep_sessions_warm(cls) -> None:
+        """ Keep connections opened by Sftp.session() alive until Sftp.close_sessions() is called """
+        cls._keep_sessions_warm = True
+
+    @classmethod
+    def close_sessions(cls) -> None:
+        for sftp in cls._warm_sessions.values():
+            sftp.close()
+        cls._warm_sessions.clear()
+        cls._keep_sessions_warm = False
+
+    @classmethod
+    @contextmanager
+    def session(cls, config: SftpConfig) -> Iterator["Sftp"]:
+        """ Connection for a single job: a new one, or a warm one reused if sessions are kept warm """
+
+        if not cls._keep_sessions_warm:
+            with Sftp(config) as sftp:
+                yield sftp
+            return
+
+        sftp = cls._warm_sessions.get(config)
+        if sftp is None or not sftp.is_active:
+            sftp = Sftp(config)
+            sftp.ssh_client.get_transport().set_keepalive(cls.KEEPALIVE_INTERVAL)
+            cls._warm_sessions[config] = sftp
+
+        yield sftp
+
     def close(self):
         if self.sftp_client is not None:
             self.sftp_client.close()
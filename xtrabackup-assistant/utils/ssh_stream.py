@@ -0,0 +1,178 @@
+import hashlib
+import shlex
+from pathlib import PurePath
+from typing import Union, Callable, IO, Iterable
+
+import paramiko
+from paramiko.ssh_exception import SSHException
+
+from .hashing import CHECKSUM_TOOLS
+
+
+class SshStream:
+    """
+    Transfers over raw SSH exec channels of an existing connection: `cat > file.partial` to write, `cat file` to read.
+    There's no request/response framing as in SFTP, a transfer is limited by the channel window only. Needs a shell
+    on the storage host: the size and the hash of a written file are checked there before it's put in place.
+    """
+
+    # a large block keeps the per-call overhead low, it's sent in packets without copying (memoryview)
+    BLOCK_SIZE = 1024 * 1024
+    # the tools a transfer needs on the storage host
+    REQUIRED_TOOLS = ('cat', 'mv', 'rm', 'wc')
+    PARTIAL_SUFFIX = '.partial'
+
+    def __init__(self, ssh_client: paramiko.SSHClient, algorithm: str = 'sha256',
+                 window_size: Union[int, None] = None, max_packet_size: Union[int, None] = None):
+        self._ssh_client = ssh_client
+        self._algorithm = algorithm
+        self._window_size = window_size
+        self._max_packet_size = max_packet_size
+
+    def is_available(self) -> bool:
+        """ Whether the storage host runs commands (not an SFTP only account) and has the tools """
+
+        tools = ' '.join((*self.REQUIRED_TOOLS, CHECKSUM_TOOLS[self._algorithm]))
+        try:
+            exit_status, _, _ = self._run(f"command -v {tools}")
+        except (SSHException, OSError):
+            return False
+
+        return exit_status == 0
+
+    def write(self, remote_path: PurePath, blocks: Iterable[bytes]) -> int:
+        """ Write the blocks to a partial file, checked on the storage host (size, hash) and then renamed """
+
+        partial_path = shlex.quote(f"{remote_path}{self.PARTIAL_SUFFIX}")
+        tool = CHECKSUM_TOOLS[self._algorithm]
+        channel = self._exec(f"cat > {partial_path} && wc -c < {partial_path} && {tool} < {partial_path}")
+
+        file_hash = hashlib.new(self._algorithm)
+        size = 0
+        try:
+            for block in blocks:
+                try:
+                    channel.sendall(memoryview(block))
+                except OSError:
+                    # the command failed (e.g. no space left on the device), its error output tells why
+                    break
+                file_hash.update(block)
+                size += len(block)
+            else:
+                channel.shutdown_write()
+
+            exit_status, output, error = self._result(channel)
+        finally:
+            channel.close()
+
+        remote_size, remote_digest = (output.split() + ['', ''])[:2]
+        if exit_status != 0 or remote_size != str(size) or remote_digest != file_hash.hexdigest():
+            self._run(f"rm -f {partial_path}")
+            if exit_status != 0:
+                raise IOError(f"writing {remote_path} on the storage host failed: {error.strip()}")
+            raise IOError(
+                f"{remote_path} written on the storage host doesn't match: {remote_size} bytes, {remote_digest} "
+                f"({self._algorithm}), expected {size} bytes, {file_hash.hexdigest()}"
+            )
+
+        exit_status, _, error = self._run(f"mv -f {partial_path} {shlex.quote(str(remote_path))}")
+        if exit_status != 0:
+            raise IOError(f"renaming {remote_path}{self.PARTIAL_SUFFIX} failed: {error.strip()}")
+
+        return size
+
+    def read(
+        self,
+        remote_path: PurePath,
+        writer: IO[bytes],
+        file_size: int,
+        callback: Union[Callable, None] = None,
+        verified: bool = False
+    ) -> None:
+        """
+        Read the file into the writer, the size is checked; the hash is checked on the storage host as well, unless
+        the caller verifies the data itself (a manifest)
+        """
+
+        file_hash = hashlib.new(self._algorithm) if not verified else None
+        transferred = 0
+        with self.open(remote_path) as reader:
+            for block in iter(lambda: reader.read(self.BLOCK_SIZE), b''):
+                writer.write(block)
+                if file_hash is not None:
+                    file_hash.update(block)
+                transferred += len(block)
+                if callback is not None:
+                    callback(transferred, file_size)
+
+        if transferred != file_size:
+            raise IOError(f"size mismatch in read: {transferred} != {file_size}")
+        if file_hash is not None:
+            tool = CHECKSUM_TOOLS[self._algorithm]
+            exit_status, output, _ = self._run(f"{tool} < {shlex.quote(str(remote_path))}")
+            if exit_status != 0 or output.split(' ', 1)[0] != file_hash.hexdigest():
+                raise IOError(f"{remote_path} read doesn't match the file on the storage host ({self._algorithm})")
+
+    def open(self, remote_path: PurePath) -> "SshStreamReader":
+        """ Read-only file object streaming the file (`cat`), e.g. into tarfile """
+
+        return SshStreamReader(self._exec(f"cat {shlex.quote(str(remote_path))}"), remote_path)
+
+    def _exec(self, command: str) -> paramiko.Channel:
+        channel_options = {}
+        if self._window_size is not None:
+            channel_options['window_size'] = self._window_size
+        if self._max_packet_size is not None:
+            channel_options['max_packet_size'] = self._max_packet_size
+
+        channel = self._ssh_client.get_transport().open_session(**channel_options)
+        channel.exec_command(command)
+
+        return channel
+
+    def _run(self, command: str) -> tuple:
+        channel = self._exec(command)
+        try:
+            return self._result(channel)
+        finally:
+            channel.close()
+
+    @staticmethod
+    def _result(channel: paramiko.Channel) -> tuple:
+        """ (exit status, stdout, stderr) of a command which output is small """
+
+        output = channel.makefile('rb').read().decode('utf-8', errors='replace')
+        error = channel.makefile_stderr('rb').read().decode('utf-8', errors='replace')
+
+        return channel.recv_exit_status(), output, error
+
+
+class SshStreamReader:
+    """ The output of `cat file` over an exec channel, the exit status is checked at the end of the file """
+
+    def __init__(self, channel: paramiko.Channel, remote_path: PurePath):
+        self._channel = channel
+        self._remote_path = remote_path
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0:
+            return b''.join(iter(lambda: self.read(SshStream.BLOCK_SIZE), b''))
+
+        # draining the channel buffer in large reads, small ones make paramiko shift the buffer over and over
+        data = self._channel.recv(size)
+        if len(data) == 0:
+            exit_status = self._channel.recv_exit_status()
+            if exit_status != 0:
+                error = self._channel.makefile_stderr('rb').read().decode('utf-8', errors='replace')
+                raise IOError(f"reading {self._remote_path} on the storage host failed: {error.strip()}")
+
+        return data
+
+    def close(self) -> None:
+        self._channel.close()
+
+    def __enter__(self) -> "SshStreamReader":
+        return self
+
+    def __exit__(self, e_type, value, traceback):
+        self.close()
@@ -0,0 +1,85 @@
+from contextlib import contextmanager
+from pathlib import Path, PurePath
+from re import Pattern
+from typing import Iterator, Union
+
+from common import Manifest
+from configs import SftpConfig, LocalStorageConfig
+from utils import TokenBucket
+
+
+class Storage:
+    """
+    A place backups are kept besides the local backups dir: SFTP or a mounted filesystem (NFS, a secondary disk).
+    Backup paths are absolute paths on the storage.
+    """
+
+    # the storage kind in messages
+    KIND = 'Storage'
+    # whether download() verifies the checksum of the bytes it writes (otherwise the restore verifies it)
+    VERIFIES_DOWNLOADS = False
+
+    def download(
+        self,
+        remote_path: PurePath,
+        local_path: Path,
+        display_progress=True,
+        rate_limiter: Union[TokenBucket, None] = None,
+        manifest: Union[Manifest, None] = None
+    ):
+        raise NotImplementedError
+
+    def upload(
+        self,
+        local_path: Path,
+        remote_path: PurePath,
+        display_progress=True,
+        rate_limiter: Union[TokenBucket, None] = None
+    ):
+        raise NotImplementedError
+
+    def read_text(self, remote_path: PurePath) -> str:
+        raise NotImplementedError
+
+    def read_head(self, remote_path: PurePath, size: int) -> bytes:
+        """ The first bytes of a file """
+        raise NotImplementedError
+
+    def exists(self, remote_path: PurePath) -> bool:
+        raise NotImplementedError
+
+    def delete(self, remote_path: PurePath, ignore_errors=False):
+        raise NotImplementedError
+
+    def listdir(self, remote_path: PurePath) -> list:
+        raise NotImplementedError
+
+    def mkdir_p(self, remote_path: PurePath):
+        raise NotImplementedError
+
+    def r_find_files(self, remote_path: PurePath, pattern: Pattern = None, skip_dirs: tuple = ()) -> list:
+        """ [{'path': ..., 'attr': ... (st_size, st_mode)}, ...] of the files under the path, empty if it's missing """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self) -> "Storage":
+        return self
+
+    def __exit__(self, e_type, value, traceback):
+        self.close()
+
+
+@contextmanager
+def storage_session(config: Union[SftpConfig, LocalStorageConfig]) -> Iterator[Storage]:
+    """ Connection to the storage a config describes (a reused one for SFTP, see Sftp.session()) """
+
+    if isinstance(config, LocalStorageConfig):
+        from .local_storage import LocalStorage
+        with LocalStorage(config) as storage:
+            yield storage
+    else:
+        from .sftp import Sftp
+        with Sftp.session(config) as sftp:
+            yield sftp
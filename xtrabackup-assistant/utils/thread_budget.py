@@ -0,0 +1,29 @@
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class ThreadBudget:
+    """ Counting limit of worker threads shared by concurrently running processes (e.g. xtrabackup --parallel) """
+
+    def __init__(self, total: int):
+        self.total = total
+
+        self._available = total
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def reserve(self, count: int) -> Iterator[int]:
+        """ Block until the count (capped by the total) is available, yield the reserved count """
+
+        count = min(count, self.total)
+        with self._condition:
+            self._condition.wait_for(lambda: self._available >= count)
+            self._available -= count
+
+        try:
+            yield count
+        finally:
+            with self._condition:
+                self._available += count
+                self._condition.notify_all()
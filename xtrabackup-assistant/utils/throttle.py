@@ -0,0 +1,135 @@
+import json
+import signal
+import threading
+from datetime import datetime
+from typing import Union
+
+from configs import ThrottleConfig
+from constants import THROTTLE_CONTROL_PATH
+from utils import echo, logger
+from .rate_limiter import TokenBucket
+
+
+class Throttle:
+    """
+    Disk and network rate limits of a run. The limits follow the config (with its time-of-day schedule) and can be
+    changed at runtime with the control file (data/run/throttle.json), re-read every few seconds or on SIGUSR1.
+    """
+
+    CHECK_INTERVAL = 5
+
+    def __init__(self, config: ThrottleConfig):
+        self._config = config
+
+        self.disk = TokenBucket(None)
+        self.network = TokenBucket(None)
+        self._limits = {}
+        # control file values reported as invalid, the file is re-read every few seconds
+        self._ignored_values = set()
+
+        self._reload = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Union[threading.Thread, None] = None
+        # restored on stop, a long-lived process (the daemon) runs a throttle per job
+        self._previous_handler = None
+
+        self._apply_limits()
+
+    @property
+    def xtrabackup_throttle(self) -> Union[int, None]:
+        """ xtrabackup --throttle value, it's passed once at start and doesn't follow later changes """
+
+        return self._limits['xtrabackup_throttle']
+
+    def start(self) -> None:
+        # signal handlers can be set from the main thread only
+        if threading.current_thread() is threading.main_thread():
+            self._previous_handler = signal.signal(signal.SIGUSR1, lambda signum, frame: self._reload.set())
+
+        self._thread = threading.Thread(target=self._watch, name='throttle_thread', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._reload.set()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        if self._previous_handler is not None and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGUSR1, self._previous_handler)
+            self._previous_handler = None
+
+    def _watch(self) -> None:
+        while not self._stopped.is_set():
+            self._reload.wait(self.CHECK_INTERVAL)
+            self._reload.clear()
+
+            if not self._stopped.is_set():
+                try:
+                    self._apply_limits()
+                except Exception as e:
+                    # the limits in effect are kept, the thread goes on watching the control file
+                    logger.warning(f"Throttle limits are not changed: {e}")
+
+    def _apply_limits(self) -> None:
+        limits = self._config.limits_at(datetime.now())
+        limits.update(self._control_file_limits())
+
+        if limits == self._limits:
+            return
+
+        self.disk.set_rate(self._bytes_per_second(limits['disk_speed']))
+        self.network.set_rate(self._bytes_per_second(limits['network_speed']))
+
+        # the first apply happens on init and isn't a change worth reporting
+        if self._limits:
+            message = (f"Limits changed: disk {self._describe(limits['disk_speed'])}, "
+                       f"network {self._describe(limits['network_speed'])}")
+            echo(message, author='Throttle')
+            logger.info(message)
+
+        self._limits = limits
+
+    def _control_file_limits(self) -> dict:
+        try:
+            with open(THROTTLE_CONTROL_PATH, 'r') as control_file:
+                control = json.load(control_file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Throttle control file is ignored: {e}")
+            return {}
+
+        if not isinstance(control, dict):
+            return {}
+
+        limits = {}
+        for limit in ThrottleConfig.LIMITS:
+            value = control.get(limit)
+            if not ThrottleConfig.is_valid_limit(value):
+                if (limit, repr(value)) not in self._ignored_values:
+                    self._ignored_values.add((limit, repr(value)))
+                    logger.warning(f"Throttle control file value is ignored (a number or null expected): "
+                                   f"{limit} = {value!r}")
+                continue
+            if limit in control:
+                limits[limit] = value
+
+        return limits
+
+    @staticmethod
+    def _bytes_per_second(megabytes_per_second: Union[float, None]) -> Union[float, None]:
+        return megabytes_per_second * 1024 ** 2 if megabytes_per_second else None
+
+    @staticmethod
+    def _describe(megabytes_per_second: Union[float, None]) -> str:
+        return f"{megabytes_per_second} MB/s" if megabytes_per_second else 'unlimited'
+
+    def __enter__(self) -> "Throttle":
+        self.start()
+        return self
+
+    def __exit__(self, e_type, value, traceback):
+        self.stop()
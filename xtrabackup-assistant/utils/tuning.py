@@ -0,0 +1,76 @@
+import os
+from pathlib import Path
+from typing import Union
+
+import psutil
+
+# rough memory footprint of one xtrabackup copy/compress thread (buffers of the copied/compressed chunks)
+THREAD_MEMORY = 64 * 1024 ** 2
+# memory reserved for one in-flight SFTP prefetch request (32 KB chunks plus paramiko overhead)
+PREFETCH_REQUEST_MEMORY = 4 * 1024 ** 2
+
+MAX_PARALLEL_SSD = 16
+MAX_PARALLEL_ROTATIONAL = 4
+MAX_COMPRESS_THREADS = 32
+MIN_PREFETCH_REQUESTS, MAX_PREFETCH_REQUESTS = 16, 512
+
+
+def detect_host_resources(data_path: Path) -> dict:
+    """ CPU count, current load, free memory and the disk type of the data path """
+
+    return {
+        'cpu_count': psutil.cpu_count(logical=True) or 1,
+        'load_average': os.getloadavg()[0],
+        'available_memory': psutil.virtual_memory().available,
+        'rotational_disk': is_rotational_disk(data_path),
+    }
+
+
+def auto_tune(resources: dict) -> dict:
+    """ Thread counts for xtrabackup and SFTP picked from the host resources """
+
+    # CPUs not busy with the current load (e.g. the MySQL server itself)
+    idle_cpus = max(1, round(resources['cpu_count'] - resources['load_average']))
+    memory_threads = max(1, resources['available_memory'] // THREAD_MEMORY)
+
+    # copy threads mostly wait for the disk: a spinning disk degrades with concurrent seeks
+    max_parallel = MAX_PARALLEL_ROTATIONAL if resources['rotational_disk'] else MAX_PARALLEL_SSD
+    parallel = clamp(idle_cpus, 1, min(max_parallel, memory_threads))
+
+    # (de)compression and encryption are CPU bound, one thread per idle CPU
+    compress_threads = clamp(idle_cpus, 1, min(MAX_COMPRESS_THREADS, memory_threads))
+
+    prefetch_requests = clamp(
+        resources['available_memory'] // PREFETCH_REQUEST_MEMORY, MIN_PREFETCH_REQUESTS, MAX_PREFETCH_REQUESTS
+    )
+
+    return {
+        'parallel': parallel,
+        'compress_threads': compress_threads,
+        'decompress_threads': compress_threads,
+        'encrypt_threads': compress_threads,
+        'sftp_prefetch_requests': prefetch_requests,
+    }
+
+
+def is_rotational_disk(path: Path) -> Union[bool, None]:
+    """ Whether the block device holding the path is a spinning disk, None if unknown (e.g. overlayfs, tmpfs) """
+
+    device = os.stat(path).st_dev
+    try:
+        # /sys/dev/block/MAJOR:MINOR points to the disk or to a partition inside the disk dir
+        device_sys_path = Path(f'/sys/dev/block/{os.major(device)}:{os.minor(device)}').resolve(strict=True)
+    except (OSError, RuntimeError):
+        return None
+
+    for queue_path in (Path(device_sys_path, 'queue'), Path(device_sys_path.parent, 'queue')):
+        try:
+            return Path(queue_path, 'rotational').read_text().strip() == '1'
+        except OSError:
+            continue
+
+    return None
+
+
+def clamp(value: int, minimum: int, maximum: int) -> int:
+    return int(max(minimum, min(value, maximum)))